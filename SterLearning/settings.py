@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 
 import os
+import tempfile
 from dotenv import load_dotenv
 from django.contrib import messages
 
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
     'app_leaderboard',
     'app_pages',
     'app_quiz',
+    'app_streaming',
     'app_tools',
     'app_user',
 ]
@@ -96,6 +98,22 @@ DATABASES = {
     }
 }
 
+# Notification summaries and friend recommendations are cached in files, so
+# every worker process on this machine shares them and an entry dropped by
+# one process is dropped for all. Set CACHE_LOCATION to change the folder.
+# Each user has up to two entries, so CACHE_MAX_ENTRIES should be at least
+# twice the number of active users, otherwise the cache keeps culling itself.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get("CACHE_LOCATION",
+                                   os.path.join(tempfile.gettempdir(), "sterlearning_cache")),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get("CACHE_MAX_ENTRIES", 20000)),
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -151,12 +169,64 @@ AUTH_USER_MODEL = "app_user.ExtendedUser"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': "channels.layers.InMemoryChannelLayer"
+# InMemoryChannelLayer only reaches sockets in the same process. Set
+# CHANNEL_LAYER=sqlite when running more than one worker on this machine, to
+# share groups and messages between them through a SQLite file.
+if os.environ.get("CHANNEL_LAYER") == "sqlite":
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': "app_streaming.layers.SQLiteChannelLayer",
+            'CONFIG': {
+                'path': os.environ.get("CHANNEL_LAYER_PATH", str(BASE_DIR / 'channels.sqlite3')),
+            }
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': "channels.layers.InMemoryChannelLayer"
+        }
     }
+
+# Mortgage calculator used by the mortgage tool. LocalBackend works it out
+# in process. Set MORTGAGE_CALCULATOR_BACKEND=app_tools.backends.HTTPCalculatorBackend
+# to use api-ninjas, or another service with the same API at
+# MORTGAGE_CALCULATOR_URL, with its key in MORTGAGE_CALCULATOR_API_KEY.
+MORTGAGE_CALCULATOR = {
+    'BACKEND': os.environ.get("MORTGAGE_CALCULATOR_BACKEND", "app_tools.backends.LocalBackend"),
+    'OPTIONS': {
+        'url': os.environ.get("MORTGAGE_CALCULATOR_URL",
+                              "https://api.api-ninjas.com/v1/mortgagecalculator"),
+        'api_key': os.environ.get("MORTGAGE_CALCULATOR_API_KEY", ""),
+        'connect_timeout': 3.05,
+        'read_timeout': 10,
+        'cache_seconds': 3600,
+    },
 }
 
+# Processes the pension projection's simulated paths are shared between
+PENSION_WORKERS = int(os.environ.get("PENSION_WORKERS", 1))
+
 MESSAGE_TAGS = {
     messages.ERROR: "danger"
 }
+
+# Number of quizzes the quiz streaming snapshot cache keeps in memory
+QUIZ_SNAPSHOT_CACHE_SIZE = 64
+
+# Seconds a quiz snapshot is used before being read again, to pick up edits
+# made by other processes
+QUIZ_SNAPSHOT_MAX_AGE = 60
+
+# Answers, or seconds, a quiz attempt buffers before writing them out
+QUIZ_WRITE_BUFFER_ANSWERS = 10
+QUIZ_WRITE_BUFFER_SECONDS = 30
+
+# Seconds each process keeps its in-memory leaderboard and quiz completion
+# matrix before rebuilding them, to pick up changes committed by other
+# processes
+LEADERBOARD_MAX_AGE = 60
+COMPLETION_MATRIX_MAX_AGE = 300
+
+# Quiz WebSocket consumer, "async" (AsyncQuizConsumer) or "sync" (QuizConsumer)
+QUIZ_CONSUMER = os.environ.get("QUIZ_CONSUMER", "sync")
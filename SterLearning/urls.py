@@ -37,8 +37,15 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("learn/", include(pathway_patterns)),
     path("quiz/<int:qid>/", quiz_views.quiz, name="quiz-views-quiz"),
+    path("quiz/<int:qid>/submit/", quiz_views.submit_quiz, name="quiz-views-submit"),
     path("shop/", user_views.shop, name="shop"),
     path("accounts/", include("app_user.urls")),
+    path("leaderboard/", include("app_leaderboard.urls")),
     path("tools/", tools_views.mortgage, name="mortgage-calculator"),
+    path("tools/schedule", tools_views.mortgage_schedule, name="mortgage-schedule"),
+    path("tools/sweep", tools_views.mortgage_sweep, name="mortgage-sweep"),
+    path("tools/tax", tools_views.take_home_pay, name="take-home-pay"),
+    path("tools/tax/batch", tools_views.take_home_pay_batch, name="take-home-pay-batch"),
+    path("tools/pension", tools_views.pension_projection, name="pension-projection"),
     path("", include("app_pages.urls"))
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppLeaderboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_leaderboard'
+
+    def ready(self):
+        import app_leaderboard.signals
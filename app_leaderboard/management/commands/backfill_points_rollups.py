@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from app_leaderboard.models import PointsRollup
+from app_user.models import PointsAwarded
+
+
+class Command(BaseCommand):
+    """Django command to rebuild the points rollups from the PointsAwarded ledger."""
+
+    help = 'Rebuild every points rollup from PointsAwarded, a chunk of users at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of user ids whose rollups are rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        chunk_size = max(options['chunk_size'], 1)
+        today = timezone.localdate()
+
+        # Users with rollups but no awards any more are covered too, so their
+        # rollups are removed.
+        awarded = PointsAwarded.objects.aggregate(low=Min('user'), high=Max('user'))
+        rolled_up = PointsRollup.objects.aggregate(low=Min('user'), high=Max('user'))
+        lows = [low for low in (awarded['low'], rolled_up['low']) if low is not None]
+        highs = [high for high in (awarded['high'], rolled_up['high']) if high is not None]
+        low = min(lows, default=0)
+        high = max(highs, default=-1)
+
+        built = 0
+        for start in range(low, high + 1, chunk_size):
+            built += self.rebuild(start, start + chunk_size, today)
+            self.stdout.write('Rebuilt users %d to %d' % (start, min(start + chunk_size, high + 1) - 1))
+
+        self.stdout.write(self.style.SUCCESS('Built %d points rollups.' % built))
+
+    # Rebuilds the rollups of users start to stop - 1 in one short
+    # transaction, so awards made meanwhile wait on this chunk at most. The
+    # ledger is summed by the database, so only one row per user per day is
+    # read into memory.
+    def rebuild(self, start, stop, today):
+        with transaction.atomic():
+            days = PointsAwarded.objects.filter(user__gte=start, user__lt=stop) \
+                .annotate(day=TruncDate('time')) \
+                .values('user', 'day') \
+                .annotate(total=Sum('points')) \
+                .values_list('user', 'day', 'total')
+
+            buckets = {}
+            for user_id, day, total in days:
+                span, bucket_start = PointsRollup.bucket(day, today)
+                key = (user_id, span, bucket_start)
+                buckets[key] = buckets.get(key, 0) + total
+
+            buckets = {key: points for key, points in buckets.items() if points}
+
+            stale = [rollup_id for rollup_id, user_id, span, bucket_start
+                     in PointsRollup.objects.filter(user__gte=start, user__lt=stop)
+                     .values_list('id', 'user', 'span', 'start')
+                     if (user_id, span, bucket_start) not in buckets]
+            PointsRollup.objects.filter(id__in=stale).delete()
+
+            rollups = [PointsRollup(user_id=user_id, span=span, start=bucket_start, points=points)
+                       for (user_id, span, bucket_start), points in buckets.items()]
+            PointsRollup.objects.bulk_create(rollups, batch_size=500, update_conflicts=True,
+                                             unique_fields=['user', 'span', 'start'],
+                                             update_fields=['points'])
+
+        return len(rollups)
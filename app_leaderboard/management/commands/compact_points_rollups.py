@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from app_leaderboard.models import PointsRollup
+
+
+class Command(BaseCommand):
+    """Django command to merge old daily points rollups into monthly ones."""
+
+    help = 'Merge day buckets from before last month into one bucket per user per month'
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        before = PointsRollup.compact_before()
+
+        with transaction.atomic():
+            days = PointsRollup.objects.filter(span=PointsRollup.Spans.DAY, start__lt=before)
+            months = days.annotate(month=TruncMonth('start')) \
+                .values('user', 'month') \
+                .annotate(total=Sum('points')) \
+                .values_list('user', 'month', 'total')
+
+            count = 0
+            for user_id, month, total in months:
+                PointsRollup.add(user_id, month, total, PointsRollup.Spans.MONTH)
+                count += 1
+
+            deleted, _ = days.delete()
+
+        self.stdout.write(self.style.SUCCESS('Compacted %d day buckets into %d month buckets.'
+                                             % (deleted, count)))
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('span', models.CharField(choices=[('D', 'Day'), ('M', 'Month')], default='D', max_length=1)),
+                ('start', models.DateField()),
+                ('points', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['span', 'start'], name='app_leaderb_span_8384cf_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pointsrollup',
+            constraint=models.UniqueConstraint(fields=('user', 'span', 'start'), name='unique_points_rollup'),
+        ),
+    ]
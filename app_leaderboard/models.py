@@ -1,3 +1,85 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.translation import gettext
+from app_user.models import ExtendedUser
 
-# Create your models here.
+
+# Points a user earned over one day. Days that are no longer needed for the
+# short windows are compacted into one bucket per month.
+class PointsRollup(models.Model):
+    class Spans(models.TextChoices):
+        DAY = "D", gettext("Day")
+        MONTH = "M", gettext("Month")
+
+    user = models.ForeignKey(ExtendedUser, on_delete = models.CASCADE)
+    span = models.CharField(choices = Spans.choices, max_length = 1, default = Spans.DAY)
+    start = models.DateField()
+    points = models.IntegerField(default = 0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ["user", "span", "start"],
+                                    name = "unique_points_rollup"),
+        ]
+        indexes = [
+            models.Index(fields = ["span", "start"]),
+        ]
+
+    # Day buckets before this date are compacted into months. Last month is
+    # kept by day so the 7 day window can always be answered.
+    @staticmethod
+    def compact_before(today = None):
+        today = today or timezone.localdate()
+        last_month = (today.replace(day = 1) - timezone.timedelta(days = 1)).replace(day = 1)
+
+        return last_month
+
+    # The bucket points awarded on a date are counted in.
+    @classmethod
+    def bucket(cls, day, today = None):
+        if day < cls.compact_before(today):
+            return cls.Spans.MONTH, day.replace(day = 1)
+
+        return cls.Spans.DAY, day
+
+    # Atomically adds points to a bucket, creating it if needed.
+    @classmethod
+    def add(cls, user_id, start, points, span = Spans.DAY, create = True):
+        if not points:
+            return
+
+        updated = cls.objects.filter(user_id = user_id, span = span, start = start) \
+            .update(points = F('points') + points)
+
+        if updated or not create:
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(user_id = user_id, span = span, start = start, points = points)
+        except IntegrityError:
+            # Created by someone else in the meantime
+            cls.objects.filter(user_id = user_id, span = span, start = start) \
+                .update(points = F('points') + points)
+
+    # Total points per user over a window, highest first. The window is
+    # "today", "week" (the last 7 days), "month" (this calendar month) or
+    # "all".
+    @classmethod
+    def totals(cls, window, today = None):
+        today = today or timezone.localdate()
+        buckets = cls.objects.all()
+
+        if window == "today":
+            buckets = buckets.filter(span = cls.Spans.DAY, start = today)
+        elif window == "week":
+            buckets = buckets.filter(span = cls.Spans.DAY,
+                                     start__gt = today - timezone.timedelta(days = 7),
+                                     start__lte = today)
+        elif window == "month":
+            buckets = buckets.filter(start__gte = today.replace(day = 1), start__lte = today)
+        elif window != "all":
+            raise ValueError(window)
+
+        return buckets.values("user").annotate(total = Sum("points")).order_by("-total", "user")
@@ -0,0 +1,263 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from django.conf import settings
+from app_user.models import PointsBalance
+
+
+# Seconds a process uses its leaderboard before building it again. Points
+# committed in the same process are applied straight away, ones committed by
+# other processes (or written without the signals) show up once rebuilt.
+LEADERBOARD_MAX_AGE = getattr(settings, "LEADERBOARD_MAX_AGE", 60)
+
+
+# Fenwick (binary indexed) tree of counts. Gives the sum of the first counts,
+# and the index where a running total reaches k, in O(log n). Its size is
+# kept a power of two so it can double without being rebuilt.
+class FenwickTree:
+    def __init__(self, counts=()):
+        self.size = 1
+
+        while self.size < len(counts):
+            self.size *= 2
+
+        self.tree = [0] + list(counts) + [0] * (self.size - len(counts))
+
+        # Built in place in O(n), each slot passes its total to its parent.
+        for index in range(1, self.size + 1):
+            parent = index + (index & -index)
+
+            if parent <= self.size:
+                self.tree[parent] += self.tree[index]
+
+    # Doubles the size until index fits. The new last slot covers the whole
+    # tree and the rest cover only new, empty slots.
+    def grow(self, index):
+        while self.size <= index:
+            total = self.prefix(self.size - 1)
+            self.tree.extend([0] * self.size)
+            self.size *= 2
+            self.tree[self.size] = total
+
+    def add(self, index, delta):
+        self.grow(index)
+        index += 1
+
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    # Sum of the counts at 0 to index inclusive.
+    def prefix(self, index):
+        index = min(index + 1, self.size)
+        total = 0
+
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+
+        return total
+
+    # Smallest index whose prefix sum is at least k.
+    def find(self, k):
+        index = 0
+        step = 1 << self.size.bit_length()
+
+        while step:
+            nxt = index + step
+
+            if nxt <= self.size and self.tree[nxt] < k:
+                index = nxt
+                k -= self.tree[nxt]
+
+            step >>= 1
+
+        return index
+
+
+# Tree slots left between neighbouring scores when the slots are laid out,
+# so scores no one had before can usually go between them.
+SLOT_SPACING = 16
+
+
+# In-memory ranking of users by points. Users with the same score share a
+# rank and are listed in user id order. Each score held by a user is a
+# bucket: a sorted list of its users' ids. Rather than by the score itself,
+# the Fenwick tree is indexed by a slot given to each bucket in score order,
+# so it's only as big as the number of different scores. A new score takes
+# a free slot between its neighbours' and the slots are only laid out again
+# when there's none.
+class Leaderboard:
+    def __init__(self, scores=()):
+        self.scores = dict(scores)
+        self.buckets = {}
+        self._lock = threading.RLock()
+
+        for user_id, score in sorted(self.scores.items()):
+            self.buckets.setdefault(self.bucket(score), []).append(user_id)
+
+        self.layout()
+
+    def __len__(self):
+        return len(self.scores)
+
+    # Scores below zero are ranked as zero.
+    @staticmethod
+    def bucket(score):
+        return max(score, 0)
+
+    # Spreads the buckets out over the slots again and rebuilds the tree,
+    # dropping buckets no one is in any more.
+    def layout(self):
+        self.buckets = {key: users for key, users in self.buckets.items() if users}
+        self.keys = sorted(self.buckets)
+        self.slots = {key: (i + 1) * SLOT_SPACING for i, key in enumerate(self.keys)}
+
+        counts = [0] * ((len(self.keys) + 1) * SLOT_SPACING)
+        for key, slot in self.slots.items():
+            counts[slot] = len(self.buckets[key])
+
+        self.tree = FenwickTree(counts)
+        self.at_slot = {slot: key for key, slot in self.slots.items()}
+
+    # Gives a new bucket the slot halfway between its neighbours', laying the
+    # slots out again if they're next to each other.
+    def insert_bucket(self, key, user_id):
+        self.buckets[key] = [user_id]
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+
+        below = self.slots[self.keys[i - 1]] if i > 0 else 0
+
+        if i + 1 < len(self.keys):
+            above = self.slots[self.keys[i + 1]]
+        else:
+            above = below + 2 * SLOT_SPACING
+
+        if above - below < 2:
+            self.layout()
+            return
+
+        slot = (below + above) // 2
+        self.slots[key] = slot
+        self.at_slot[slot] = key
+        self.tree.add(slot, 1)
+
+    def set(self, user_id, score):
+        with self._lock:
+            old = self.scores.get(user_id)
+
+            if old is not None:
+                users = self.buckets[self.bucket(old)]
+                del users[bisect_left(users, user_id)]
+                self.tree.add(self.slots[self.bucket(old)], -1)
+
+            self.scores[user_id] = score
+            users = self.buckets.get(self.bucket(score))
+
+            if users is None:
+                self.insert_bucket(self.bucket(score), user_id)
+            else:
+                insort(users, user_id)
+                self.tree.add(self.slots[self.bucket(score)], 1)
+
+    def add(self, user_id, points):
+        with self._lock:
+            self.set(user_id, self.scores.get(user_id, 0) + points)
+
+    def score(self, user_id):
+        return self.scores.get(user_id, 0)
+
+    # Number of users with more points than the given score.
+    def above(self, score):
+        with self._lock:
+            i = bisect_right(self.keys, self.bucket(score))
+
+            if i == 0:
+                return len(self.scores)
+
+            return len(self.scores) - self.tree.prefix(self.slots[self.keys[i - 1]])
+
+    # 1 + the number of users with more points. Users who aren't on the
+    # board rank as if they had no points.
+    def rank(self, user_id):
+        with self._lock:
+            return self.above(self.score(user_id)) + 1
+
+    # Up to count (rank, user id, score) entries starting at the given
+    # 1-based position in the ordering.
+    def entries(self, start, count):
+        with self._lock:
+            start = max(start, 1)
+            result = []
+            position = start
+
+            while len(result) < count and position <= len(self.scores):
+                # The k-th highest user is the (total - k + 1)-th lowest.
+                bucket = self.at_slot[self.tree.find(len(self.scores) - position + 1)]
+                users = self.buckets[bucket]
+                rank = self.above(bucket) + 1
+
+                for user_id in users[position - rank:position - rank + count - len(result)]:
+                    result.append((rank, user_id, self.scores[user_id]))
+
+                position = rank + len(users)
+
+            return result
+
+    def top(self, count):
+        return self.entries(1, count)
+
+    # Entries for the users just above and below a user.
+    def around(self, user_id, radius):
+        with self._lock:
+            if user_id not in self.scores:
+                return []
+
+            score = self.scores[user_id]
+            users = self.buckets[self.bucket(score)]
+            position = self.above(score) + bisect_left(users, user_id) + 1
+
+            return self.entries(position - radius, 2 * radius + 1
+                                - max(0, radius + 1 - position))
+
+
+_leaderboard = None
+_leaderboard_built = 0
+_leaderboard_lock = threading.Lock()
+
+
+def _leaderboard_stale():
+    return _leaderboard is None or time.monotonic() - _leaderboard_built > LEADERBOARD_MAX_AGE
+
+
+# Returns this process's leaderboard, built from the points balances with
+# one query when first needed and again once it's LEADERBOARD_MAX_AGE old.
+def get_leaderboard():
+    global _leaderboard, _leaderboard_built
+
+    if _leaderboard_stale():
+        with _leaderboard_lock:
+            if _leaderboard_stale():
+                _leaderboard = build_leaderboard()
+                _leaderboard_built = time.monotonic()
+
+    return _leaderboard
+
+
+def build_leaderboard():
+    return Leaderboard(PointsBalance.objects.values_list('user_id', 'earned'))
+
+
+# Drops the leaderboard so the next use rebuilds it.
+def reset_leaderboard():
+    global _leaderboard
+
+    with _leaderboard_lock:
+        _leaderboard = None
+
+
+# Applies a change in points, if the leaderboard has been built yet.
+def update_leaderboard(user_id, points):
+    if _leaderboard is not None:
+        _leaderboard.add(user_id, points)
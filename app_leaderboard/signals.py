@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from app_user.models import points_balance_changed
+from .models import PointsRollup
+from .ranking import update_leaderboard
+
+# Only update the in-memory leaderboard once the points are committed.
+@receiver(points_balance_changed)
+def balance_changed(sender, user_id, points, **kwargs):
+    transaction.on_commit(lambda: update_leaderboard(user_id, points))
+
+# Keep the rollups in the same transaction as the balance. Removed points
+# never create a bucket, it may already have been deleted with its user.
+@receiver(points_balance_changed)
+def rollup_points(sender, user_id, points, time, **kwargs):
+    span, start = PointsRollup.bucket(timezone.localdate(time))
+    PointsRollup.add(user_id, start, points, span, create = points > 0)
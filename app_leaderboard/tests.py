@@ -1,3 +1,242 @@
-from django.test import TestCase
+import random
+from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+from app_user.models import PointsAwarded
+from .models import PointsRollup
+from .ranking import Leaderboard, get_leaderboard, reset_leaderboard
 
-# Create your tests here.
+
+# Ranks worked out the slow way, to check the leaderboard against
+def brute_force(scores):
+    ordered = sorted(scores.items(), key=lambda item: (-max(item[1], 0), item[0]))
+
+    return [(1 + sum(1 for other in scores.values() if max(other, 0) > max(score, 0)), user_id, score)
+            for user_id, score in ordered]
+
+
+class LeaderboardTest(TestCase):
+    # Test ranks, ties and top-k
+    def test_rank_and_top(self):
+        leaderboard = Leaderboard([(1, 50), (2, 80), (3, 50), (4, 10)])
+
+        self.assertEqual(leaderboard.rank(2), 1)
+        self.assertEqual(leaderboard.rank(1), 2)
+        self.assertEqual(leaderboard.rank(3), 2)
+        self.assertEqual(leaderboard.rank(4), 4)
+        self.assertEqual(leaderboard.top(3), [(1, 2, 80), (2, 1, 50), (2, 3, 50)])
+
+    # Test users around a user, including near the top
+    def test_around(self):
+        leaderboard = Leaderboard([(user_id, user_id * 10) for user_id in range(1, 11)])
+
+        self.assertEqual([user_id for _, user_id, _ in leaderboard.around(5, 2)], [7, 6, 5, 4, 3])
+        self.assertEqual([user_id for _, user_id, _ in leaderboard.around(10, 2)], [10, 9, 8])
+        self.assertEqual(leaderboard.around(99, 2), [])
+
+    # Test incremental updates match a full recount, past the initial tree size
+    def test_updates_match_brute_force(self):
+        rng = random.Random(42)
+        leaderboard = Leaderboard()
+        scores = {}
+
+        for _ in range(2000):
+            user_id = rng.randrange(200)
+            points = rng.randrange(-20, 60)
+            scores[user_id] = scores.get(user_id, 0) + points
+            leaderboard.add(user_id, points)
+
+        expected = brute_force(scores)
+        self.assertEqual(leaderboard.top(len(scores)), expected)
+        self.assertEqual(leaderboard.entries(50, 10), expected[49:59])
+
+        for rank, user_id, _ in expected:
+            self.assertEqual(leaderboard.rank(user_id), rank)
+
+
+    # Test the tree is sized by the number of scores, not the highest one
+    def test_tree_compressed(self):
+        leaderboard = Leaderboard([(1, 10 ** 9), (2, 5), (3, 5)])
+
+        self.assertLess(leaderboard.tree.size, 100)
+        self.assertEqual(leaderboard.rank(2), 2)
+
+        # New scores between neighbouring ones, until the slots run out
+        for user_id in range(4, 40):
+            leaderboard.set(user_id, 6 + user_id / 100)
+
+        leaderboard.set(1, 7)
+        leaderboard.set(3, 7)
+
+        self.assertLess(leaderboard.tree.size, 2000)
+        self.assertEqual(leaderboard.top(3), [(1, 1, 7), (1, 3, 7), (3, 39, 6.39)])
+        self.assertEqual(leaderboard.rank(2), 39)
+
+
+class LeaderboardViewTest(TestCase):
+    def setUp(self):
+        reset_leaderboard()
+
+        self.client = Client()
+        user_model = get_user_model()
+        self.user1 = user_model.objects.create_user(username='user1', password='pass')
+        self.user2 = user_model.objects.create_user(username='user2', password='pass')
+        PointsAwarded.objects.create(user=self.user1, points=10)
+        PointsAwarded.objects.create(user=self.user2, points=30)
+
+    def tearDown(self):
+        reset_leaderboard()
+
+    # Test the global top list
+    def test_top(self):
+        response = self.client.get(reverse('leaderboard'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['username'] for entry in response.json()['leaderboard']],
+                         ['user2', 'user1'])
+
+    # Test the logged in user's rank follows newly awarded points
+    def test_my_rank(self):
+        self.client.login(username='user1', password='pass')
+        self.assertEqual(self.client.get(reverse('leaderboard-me')).json()['rank'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PointsAwarded.objects.create(user=self.user1, points=25)
+
+        self.assertEqual(get_leaderboard().score(self.user1.id), 35)
+
+        data = self.client.get(reverse('leaderboard-me')).json()
+        self.assertEqual(data['rank'], 1)
+        self.assertEqual(data['around'][0]['username'], 'user1')
+
+    # Test points committed elsewhere show up once the leaderboard is rebuilt
+    def test_rebuilt_when_stale(self):
+        self.assertEqual(get_leaderboard().score(self.user1.id), 10)
+
+        # Without running the on commit callbacks, as in another process
+        PointsAwarded.objects.create(user=self.user1, points=25)
+
+        self.assertEqual(get_leaderboard().score(self.user1.id), 10)
+
+        with patch('app_leaderboard.ranking.LEADERBOARD_MAX_AGE', 0):
+            self.assertEqual(get_leaderboard().score(self.user1.id), 35)
+
+    # Test users must be logged in to see their rank
+    def test_my_rank_logged_out(self):
+        self.assertEqual(self.client.get(reverse('leaderboard-me')).status_code, 401)
+
+
+class PointsRollupTest(TestCase):
+    def setUp(self):
+        user_model = get_user_model()
+        self.user1 = user_model.objects.create_user(username='user1', password='pass')
+        self.user2 = user_model.objects.create_user(username='user2', password='pass')
+
+    def totals(self, window, today=None):
+        return [(row['user'], row['total']) for row in PointsRollup.totals(window, today)]
+
+    # Test awarding and removing points keeps today's bucket up to date
+    def test_award_updates_bucket(self):
+        award = PointsAwarded.objects.create(user=self.user1, points=10)
+        PointsAwarded.objects.create(user=self.user1, points=5)
+
+        bucket = PointsRollup.objects.get(user=self.user1)
+        self.assertEqual((bucket.span, bucket.start, bucket.points),
+                         (PointsRollup.Spans.DAY, timezone.localdate(), 15))
+
+        award.delete()
+        self.assertEqual(PointsRollup.objects.get(user=self.user1).points, 5)
+
+    # Test each window sums only the buckets inside it
+    def test_windows(self):
+        today = date(2026, 3, 10)
+        PointsRollup.add(self.user1.id, today, 5)
+        PointsRollup.add(self.user2.id, today - timedelta(days=3), 20)
+        PointsRollup.add(self.user1.id, today - timedelta(days=8), 100)
+        PointsRollup.add(self.user2.id, date(2026, 1, 1), 1000, PointsRollup.Spans.MONTH)
+
+        self.assertEqual(self.totals('today', today), [(self.user1.id, 5)])
+        self.assertEqual(self.totals('week', today), [(self.user2.id, 20), (self.user1.id, 5)])
+        self.assertEqual(self.totals('month', today), [(self.user1.id, 105), (self.user2.id, 20)])
+        self.assertEqual(self.totals('all', today), [(self.user2.id, 1020), (self.user1.id, 105)])
+
+    # Test old points go straight into their month's bucket
+    def test_bucket(self):
+        today = date(2026, 3, 10)
+
+        self.assertEqual(PointsRollup.bucket(date(2026, 2, 3), today),
+                         (PointsRollup.Spans.DAY, date(2026, 2, 3)))
+        self.assertEqual(PointsRollup.bucket(date(2026, 1, 31), today),
+                         (PointsRollup.Spans.MONTH, date(2026, 1, 1)))
+
+    # Test compacting merges old days into months without changing totals
+    def test_compact(self):
+        today = timezone.localdate()
+        old = PointsRollup.compact_before() - timedelta(days=1)
+        PointsRollup.add(self.user1.id, old, 10)
+        PointsRollup.add(self.user1.id, old.replace(day=1), 5)
+        PointsRollup.add(self.user1.id, today, 1)
+        before = self.totals('all')
+
+        call_command('compact_points_rollups', stdout=StringIO())
+
+        self.assertEqual(self.totals('all'), before)
+        self.assertEqual(PointsRollup.objects.get(user=self.user1, span=PointsRollup.Spans.MONTH).points, 15)
+        self.assertEqual(PointsRollup.objects.filter(span=PointsRollup.Spans.DAY).count(), 1)
+
+    # Test the backfill rebuilds the same buckets from the ledger
+    def test_backfill(self):
+        now = timezone.now()
+
+        for days_ago, points in ((0, 3), (0, 4), (2, 10), (90, 50), (400, 7)):
+            award = PointsAwarded.objects.create(user=self.user2, points=points)
+            PointsAwarded.objects.filter(id=award.id).update(time=now - timedelta(days=days_ago))
+
+        PointsAwarded.objects.create(user=self.user1, points=1)
+
+        call_command('backfill_points_rollups', chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(self.totals('all'), [(self.user2.id, 74), (self.user1.id, 1)])
+        self.assertEqual(self.totals('today'), [(self.user2.id, 7), (self.user1.id, 1)])
+        self.assertEqual(self.totals('week'), [(self.user2.id, 17), (self.user1.id, 1)])
+        self.assertEqual(PointsRollup.objects.filter(span=PointsRollup.Spans.MONTH).count(), 2)
+
+    # Test the backfill corrects existing rollups and removes ones with no awards
+    def test_backfill_existing(self):
+        PointsAwarded.objects.create(user=self.user1, points=5)
+        PointsRollup.objects.filter(user=self.user1).update(points=99)
+        PointsRollup.add(self.user2.id, timezone.localdate(), 20)
+
+        call_command('backfill_points_rollups', chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(self.totals('all'), [(self.user1.id, 5)])
+
+    # Test the windowed leaderboard view
+    def test_window_view(self):
+        PointsAwarded.objects.create(user=self.user1, points=10)
+        PointsRollup.add(self.user2.id, timezone.localdate() - timedelta(days=30), 50)
+        client = Client()
+
+        data = client.get(reverse('leaderboard'), {'window': 'today'}).json()
+        self.assertEqual([entry['username'] for entry in data['leaderboard']], ['user1'])
+        self.assertEqual(data['leaderboard'][0]['rank'], 1)
+
+        self.assertEqual(client.get(reverse('leaderboard'), {'window': 'year'}).status_code, 400)
+
+        # Negative limits show no one
+        for window in ('week', 'all'):
+            response = client.get(reverse('leaderboard'), {'window': window, 'limit': -1})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['leaderboard'], [])
+
+    # Test deleting a user with points doesn't leave buckets behind
+    def test_delete_user(self):
+        PointsAwarded.objects.create(user=self.user1, points=10)
+        self.user1.delete()
+
+        self.assertFalse(PointsRollup.objects.exists())
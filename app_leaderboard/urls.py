@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("", views.top, name="leaderboard"),
+    path("me/", views.my_rank, name="leaderboard-me"),
+]
@@ -1,3 +1,81 @@
-from django.shortcuts import render
+from django.http import JsonResponse
+from app_user.models import ExtendedUser
+from .models import PointsRollup
+from .ranking import get_leaderboard
 
-# Create your views here.
+# Most users shown on the global leaderboard
+TOP_LIMIT = 100
+
+# Users shown either side of the current user on their rank page
+AROUND_RADIUS = 5
+
+# Windows the leaderboard can be shown for, other than all-time
+WINDOWS = ("today", "week", "month")
+
+
+# Turns (rank, user id, score) entries into JSON, with usernames.
+def serialise(entries):
+    usernames = dict(ExtendedUser.objects.filter(id__in = [user_id for _, user_id, _ in entries])
+                     .values_list('id', 'username'))
+
+    return [{"rank": rank,
+             "user": user_id,
+             "username": usernames.get(user_id),
+             "score": score}
+            for rank, user_id, score in entries]
+
+
+# Top users over a window from the points rollups, as (rank, user id, score)
+# entries. Users with the same score share a rank.
+def window_entries(window, limit):
+    entries = []
+
+    for position, row in enumerate(PointsRollup.totals(window)[:limit], 1):
+        if entries and entries[-1][2] == row["total"]:
+            rank = entries[-1][0]
+        else:
+            rank = position
+
+        entries.append((rank, row["user"], row["total"]))
+
+    return entries
+
+
+# Global top 100, or fewer with ?limit=. ?window=today, week or month ranks
+# by the points earned in that window instead of all-time.
+def top(request):
+    try:
+        limit = max(0, min(int(request.GET.get('limit', TOP_LIMIT)), TOP_LIMIT))
+    except ValueError:
+        limit = TOP_LIMIT
+
+    window = request.GET.get('window', 'all')
+
+    if window in WINDOWS:
+        entries = window_entries(window, limit)
+
+        return JsonResponse({"window": window,
+                             "total": PointsRollup.totals(window).count(),
+                             "leaderboard": serialise(entries)})
+    elif window != 'all':
+        return JsonResponse({"error": "InvalidWindow"}, status = 400)
+
+    leaderboard = get_leaderboard()
+
+    return JsonResponse({"window": window,
+                         "total": len(leaderboard),
+                         "leaderboard": serialise(leaderboard.top(limit))})
+
+
+# The logged in user's rank and the users around them
+def my_rank(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "NotLoggedIn"}, status = 401)
+
+    leaderboard = get_leaderboard()
+    user_id = request.user.id
+
+    return JsonResponse({"rank": leaderboard.rank(user_id),
+                         "score": leaderboard.score(user_id),
+                         "total": len(leaderboard),
+                         "around": serialise(leaderboard.around(user_id, AROUND_RADIUS))})
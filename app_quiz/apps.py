@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppQuizConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_quiz'
+
+    def ready(self):
+        import app_quiz.signals
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Indexes existing sections. Where two share a position the first one
+# (by type then id) keeps it, as get_section used to prefer MCQs, and the
+# others are listed so they can be moved.
+def build_section_index(apps, schema_editor):
+    QuizSectionIndex = apps.get_model('app_quiz', 'QuizSectionIndex')
+    rows = {}
+    duplicates = []
+
+    for model_name, section_type in (('MultipleChoice', 'mcq'),
+                                     ('FillInBlank', 'fib'),
+                                     ('Information', 'inf')):
+        model = apps.get_model('app_quiz', model_name)
+
+        for section_id, quiz_id, position in model.objects.order_by('id') \
+                .values_list('id', 'quiz_id', 'position'):
+            if (quiz_id, position) in rows:
+                kept = rows[quiz_id, position]
+                duplicates.append("quiz %d position %d: %s %d not indexed, %s %d is"
+                                  % (quiz_id, position, section_type, section_id,
+                                     kept.section_type, kept.section_id))
+                continue
+
+            rows[quiz_id, position] = QuizSectionIndex(quiz_id=quiz_id,
+                                                       position=position,
+                                                       section_type=section_type,
+                                                       section_id=section_id)
+
+    QuizSectionIndex.objects.bulk_create(rows.values(), batch_size=500)
+
+    if duplicates:
+        print("\n  Sections sharing a position, move these to free positions:")
+
+        for duplicate in duplicates:
+            print("    " + duplicate)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_quiz', '0008_alter_fillinblankanswer_points_awarded_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizSectionIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('section_type', models.CharField(choices=[('mcq', 'MultipleChoice'), ('fib', 'FillInBlank'), ('inf', 'Information')], max_length=3)),
+                ('section_id', models.BigIntegerField()),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_quiz.quiz')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='quizsectionindex',
+            constraint=models.UniqueConstraint(fields=('quiz', 'position'), name='unique_quiz_section_position'),
+        ),
+        migrations.AddConstraint(
+            model_name='quizsectionindex',
+            constraint=models.UniqueConstraint(fields=('section_type', 'section_id'), name='unique_quiz_section'),
+        ),
+        migrations.RunPython(build_section_index, migrations.RunPython.noop),
+    ]
@@ -6,23 +6,11 @@ from app_user.models import ExtendedUser, PointsAwarded
 
 # Verifies that no two sections share the same positions
 def check_unique_pos(self):
-    quiz = self.quiz
-    pos = self.position
+    entry = QuizSectionIndex.objects.filter(quiz_id = self.quiz_id,
+                                            position = self.position).first()
 
-    mcq = MultipleChoice.objects.filter(quiz = quiz, position = pos)
-    fib = FillInBlank.objects.filter(quiz = quiz, position = pos)
-    inf = Information.objects.filter(quiz = quiz, position = pos)
-
-    if mcq.count() != 0:
-        if self.__class__ != MultipleChoice or mcq.count() != 1:
-            raise ValidationError(gettext("SectionAlreadyAtPosition"))
-
-    if fib.count() != 0:
-        if self.__class__ != FillInBlank or fib.count() != 1:
-            raise ValidationError(gettext("SectionAlreadyAtPosition"))
-
-    if inf.count() != 0:
-        if self.__class__ != Information or inf.count() != 1:
+    if entry is not None:
+        if entry.section_type != self.section_type or entry.section_id != self.id:
             raise ValidationError(gettext("SectionAlreadyAtPosition"))
 
 # Quiz model - stores which pathway the quiz is in and its name.
@@ -39,6 +27,28 @@ class Quiz(models.Model):
     pathway = models.CharField(choices = Pathways.choices, max_length = 7)
 
 
+# Index of which section is at each position of a quiz, across all three
+# section tables. Kept in sync by the signals in app_quiz.signals.
+class QuizSectionIndex(models.Model):
+    class SectionTypes(models.TextChoices):
+        MCQ = "mcq", gettext("MultipleChoice")
+        FIB = "fib", gettext("FillInBlank")
+        INF = "inf", gettext("Information")
+
+    quiz = models.ForeignKey(Quiz, on_delete = models.CASCADE)
+    position = models.IntegerField()
+    section_type = models.CharField(choices = SectionTypes.choices, max_length = 3)
+    section_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields = ["quiz", "position"],
+                                    name = "unique_quiz_section_position"),
+            models.UniqueConstraint(fields = ["section_type", "section_id"],
+                                    name = "unique_quiz_section"),
+        ]
+
+
 # Abstract class for a section within a quiz containing a title and position.
 class QuizSection(models.Model):
     title = models.CharField(max_length = 100)
@@ -51,6 +61,7 @@ class QuizSection(models.Model):
 
 # Multiple choice question, stores points awarded for correct answer.
 class MultipleChoice(QuizSection):
+    section_type = QuizSectionIndex.SectionTypes.MCQ
     points = models.IntegerField()
 
     def clean(self):
@@ -76,6 +87,8 @@ class MultipleChoiceOptions(models.Model):
 
 # Model for fill in the blank questions. No additional fields needed.
 class FillInBlank(QuizSection):
+    section_type = QuizSectionIndex.SectionTypes.FIB
+
     def clean(self):
         check_unique_pos(self)
 
@@ -109,6 +122,7 @@ class FillInBlankSentence(models.Model):
 
 # Model for an information screen that can be put in a quiz to give user info.
 class Information(QuizSection):
+    section_type = QuizSectionIndex.SectionTypes.INF
     content = models.TextField()
     image = models.ImageField(null = True, blank = True, upload_to = 'images/quizzes/info_sections')
 
@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Quiz, QuizSectionIndex, MultipleChoice, FillInBlank, Information
+
+
+SECTION_MODELS = (MultipleChoice, FillInBlank, Information)
+
+
+# Indexes whichever section is left at a position once the one indexed there
+# has gone, in case two were saved at the same position. The first by type
+# then id is picked, as the index was first built.
+def reindex_position(quiz_id, position):
+    if QuizSectionIndex.objects.filter(quiz_id=quiz_id, position=position).exists():
+        return
+
+    for model in SECTION_MODELS:
+        section_id = model.objects.filter(quiz_id=quiz_id, position=position) \
+            .order_by('id').values_list('id', flat=True).first()
+
+        if section_id is not None:
+            QuizSectionIndex.objects.create(quiz_id=quiz_id, position=position,
+                                            section_type=model.section_type,
+                                            section_id=section_id)
+            return
+
+
+# Points the index at a section's current position. If another section
+# already holds that position the index is left alone, check_unique_pos
+# then rejects the newcomer when it is cleaned. Any position the section
+# moved away from goes to a section left there.
+@receiver(post_save, sender=MultipleChoice)
+@receiver(post_save, sender=FillInBlank)
+@receiver(post_save, sender=Information)
+def section_saved(sender, instance, **kwargs):
+    with transaction.atomic():
+        moved = QuizSectionIndex.objects.filter(section_type=instance.section_type,
+                                                section_id=instance.id) \
+            .exclude(quiz_id=instance.quiz_id, position=instance.position)
+        freed = list(moved.values_list('quiz_id', 'position'))
+        moved.delete()
+
+        QuizSectionIndex.objects.get_or_create(quiz_id=instance.quiz_id,
+                                               position=instance.position,
+                                               defaults={"section_type": instance.section_type,
+                                                         "section_id": instance.id})
+
+        for quiz_id, position in freed:
+            reindex_position(quiz_id, position)
+
+
+@receiver(post_delete, sender=MultipleChoice)
+@receiver(post_delete, sender=FillInBlank)
+@receiver(post_delete, sender=Information)
+def section_deleted(sender, instance, origin=None, **kwargs):
+    # Nothing is left to index when the whole quiz is being deleted
+    quiz_deleted = isinstance(origin, Quiz) or getattr(origin, 'model', None) is Quiz
+
+    with transaction.atomic():
+        deleted, _ = QuizSectionIndex.objects.filter(section_type=instance.section_type,
+                                                     section_id=instance.id).delete()
+
+        if deleted and not quiz_deleted:
+            reindex_position(instance.quiz_id, instance.position)
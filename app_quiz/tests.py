@@ -1,3 +1,4 @@
+import json
 from django.test import TestCase, Client
 from django.urls import reverse
 from .models import *
@@ -196,6 +197,106 @@ class InformationTest(TestCase):
         i.full_clean()
 
 
+# Tests for the section position index
+class QuizSectionIndexTest(TestCase):
+    # Test saving a section indexes its position
+    def test_indexed_on_save(self):
+        quiz = create_quiz()
+
+        q = MultipleChoice(title="MCQ", quiz=quiz, position=1, points=25)
+        q.save()
+
+        entry = QuizSectionIndex.objects.get(quiz=quiz, position=1)
+        self.assertEqual(entry.section_type, "mcq")
+        self.assertEqual(entry.section_id, q.id)
+
+    # Test moving a section moves its index entry
+    def test_index_follows_position(self):
+        quiz = create_quiz()
+
+        i = Information(title="INF", quiz=quiz, position=1, content="Information section")
+        i.save()
+
+        i.position = 3
+        i.save()
+
+        self.assertFalse(QuizSectionIndex.objects.filter(quiz=quiz, position=1).exists())
+        self.assertEqual(QuizSectionIndex.objects.get(quiz=quiz, position=3).section_id, i.id)
+
+    # Test deleting a section frees its position
+    def test_index_removed_on_delete(self):
+        quiz = create_quiz()
+
+        q = FillInBlank(title="FIB", quiz=quiz, position=1)
+        q.save()
+        q.delete()
+
+        self.assertFalse(QuizSectionIndex.objects.filter(quiz=quiz).exists())
+
+        i = Information(title="INF", quiz=quiz, position=1, content="Information section")
+        i.save()
+        i.full_clean()
+
+    # Test sections of different types can't share a position
+    def test_unique_across_types(self):
+        quiz = create_quiz()
+
+        q = MultipleChoice(title="MCQ", quiz=quiz, position=1, points=25)
+        q.save()
+
+        i = Information(title="INF", quiz=quiz, position=1, content="Information section")
+        i.save()
+
+        with self.assertRaises(ValidationError):
+            i.full_clean()
+
+        with self.assertNumQueries(1):
+            q.clean()
+
+    # Test deleting a section indexes another left at its position
+    def test_reindexed_on_delete(self):
+        quiz = create_quiz()
+
+        q = MultipleChoice(title="MCQ", quiz=quiz, position=1, points=25)
+        q.save()
+
+        i = Information(title="INF", quiz=quiz, position=1, content="Information section")
+        i.save()
+
+        q.delete()
+
+        entry = QuizSectionIndex.objects.get(quiz=quiz, position=1)
+        self.assertEqual(entry.section_type, "inf")
+        self.assertEqual(entry.section_id, i.id)
+
+    # Test moving a section indexes another left at its old position
+    def test_reindexed_on_move(self):
+        quiz = create_quiz()
+
+        q = MultipleChoice(title="MCQ", quiz=quiz, position=1, points=25)
+        q.save()
+
+        i = Information(title="INF", quiz=quiz, position=1, content="Information section")
+        i.save()
+
+        q.position = 2
+        q.save()
+
+        self.assertEqual(QuizSectionIndex.objects.get(quiz=quiz, position=1).section_id, i.id)
+        self.assertEqual(QuizSectionIndex.objects.get(quiz=quiz, position=2).section_id, q.id)
+
+    # Test deleting a quiz with sections sharing a position
+    def test_quiz_deleted(self):
+        quiz = create_quiz()
+
+        MultipleChoice(title="MCQ", quiz=quiz, position=1, points=25).save()
+        Information(title="INF", quiz=quiz, position=1, content="Information section").save()
+
+        quiz.delete()
+
+        self.assertFalse(QuizSectionIndex.objects.exists())
+
+
 class AttemptTest(TestCase):
     def setUp(self):
         self.user = ExtendedUser.objects.create(username='testuser', password='testpassword')
@@ -278,3 +379,125 @@ class QuizViewTest(TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'quiz.html')
+
+
+class SubmitQuizViewTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = ExtendedUser.objects.create_user(username='testuser', password='testpassword')
+        self.quiz = Quiz.objects.create(name='Test Quiz', description='A quiz for testing', pathway='LOANS')
+
+        mcq = MultipleChoice.objects.create(title="MCQ", quiz=self.quiz, position=1, points=25)
+        self.right = MultipleChoiceOptions.objects.create(text="Option A", correct=True, question=mcq)
+        self.wrong = MultipleChoiceOptions.objects.create(text="Option B", correct=False, question=mcq)
+
+        fib = FillInBlank.objects.create(title="FIB", quiz=self.quiz, position=2)
+        self.sentence = FillInBlankSentence.objects.create(before="Before ", blank="Blank", after=" after",
+                                                           question=fib, points=5)
+
+        self.submit_url = reverse('quiz-views-submit', args=[self.quiz.id])
+
+    def submit(self, answers):
+        return self.client.post(self.submit_url, json.dumps({"answers": answers}),
+                                content_type="application/json")
+
+    # Test a whole attempt is graded and saved
+    def test_submit(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        response = self.submit([{"section_type": "mcq", "selected_id": self.right.id},
+                                {"section_type": "fib",
+                                 "sentences": [{"id": self.sentence.id, "blank": "blank"}]}])
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["awarded"], 30)
+        self.assertEqual(data["results"][0], {"type": "validated_mcq_answer", "correct": True, "awarded": 25})
+        self.assertEqual(data["results"][1]["correct"], [self.sentence.id])
+
+        attempt = Attempt.objects.get(id=data["attempt"])
+        self.assertTrue(attempt.completed)
+        self.assertFalse(attempt.quiz_open)
+        self.assertEqual(MultipleChoiceResponse.objects.get(attempt=attempt).answer, self.right)
+        self.assertEqual(FillInBlankAnswer.objects.get(response__attempt=attempt).points_awarded.points, 5)
+        self.assertEqual(sum(PointsAwarded.objects.filter(user=self.user).values_list('points', flat=True)), 30)
+
+    # Test wrong answers score nothing
+    def test_submit_wrong(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        response = self.submit([{"section_type": "mcq", "selected_id": self.wrong.id},
+                                {"section_type": "fib",
+                                 "sentences": [{"id": self.sentence.id, "blank": "wrong"}]}])
+
+        self.assertEqual(response.json()["awarded"], 0)
+        self.assertEqual(set(PointsAwarded.objects.filter(user=self.user).values_list('points', flat=True)), {0})
+
+    # Test malformed submissions are rejected without saving anything
+    def test_submit_invalid(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        response = self.submit([{"section_type": "essay"}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+
+    # Test empty and partial submissions are rejected without saving anything
+    def test_submit_incomplete(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        responses = [
+            self.submit([]),
+            self.submit([{"section_type": "mcq", "selected_id": self.right.id}]),
+            self.submit([{"section_type": "mcq", "selected_id": self.right.id},
+                         {"section_type": "fib", "sentences": []}]),
+        ]
+
+        for response in responses:
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+
+    # Test answers to another quiz's questions are rejected
+    def test_submit_other_quiz(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        other = Quiz.objects.create(name='Other Quiz', description='Another quiz', pathway='LOANS')
+        mcq = MultipleChoice.objects.create(title="MCQ", quiz=other, position=1, points=1000)
+        option = MultipleChoiceOptions.objects.create(text="Option A", correct=True, question=mcq)
+
+        response = self.submit([{"section_type": "mcq", "selected_id": option.id}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PointsAwarded.objects.exists())
+
+    # Test answering the same question or sentence twice is rejected
+    def test_submit_repeated(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        responses = [
+            self.submit([{"section_type": "mcq", "selected_id": self.right.id}] * 2),
+            self.submit([{"section_type": "mcq", "selected_id": self.wrong.id},
+                         {"section_type": "mcq", "selected_id": self.right.id}]),
+            self.submit([{"section_type": "fib",
+                          "sentences": [{"id": self.sentence.id, "blank": "blank"}] * 2}]),
+        ]
+
+        for response in responses:
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+
+    # Test blanks that aren't strings are rejected
+    def test_submit_blank_not_string(self):
+        self.client.login(username='testuser', password='testpassword')
+
+        response = self.submit([{"section_type": "fib",
+                                 "sentences": [{"id": self.sentence.id, "blank": 5}]}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attempt.objects.exists())
+
+    # Test users must be logged in
+    def test_submit_logged_out(self):
+        response = self.submit([])
+
+        self.assertEqual(response.status_code, 401)
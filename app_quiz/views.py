@@ -1,5 +1,11 @@
+import json
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
-from .models import Quiz
+from django.views.decorators.http import require_POST
+from app_streaming.buffer import write_answers
+from app_streaming.consumers import get_answer_key, grade_mcq, grade_fib
+from .models import Quiz, Attempt
 
 
 # Create your views here.
@@ -56,3 +62,79 @@ def quiz(request, qid):
     context["quiz"] = current_quiz
 
     return render(request, "quiz.html", context)
+
+
+# Raises ValueError unless every MCQ and blank in the quiz's key is answered
+# exactly once, and nothing else is. Nothing is looked up in the database, so
+# answers from other quizzes can't be graded.
+def check_answers(answer_key, answers):
+    questions = set()
+    sentences = set()
+
+    for answer in answers:
+        if answer["section_type"] == "mcq":
+            sid = int(answer["selected_id"])
+
+            if sid not in answer_key.options or answer_key.questions[sid] in questions:
+                raise ValueError(sid)
+
+            questions.add(answer_key.questions[sid])
+        elif answer["section_type"] == "fib":
+            for sentence in answer["sentences"]:
+                sid = int(sentence["id"])
+
+                if sid not in answer_key.sentences or sid in sentences:
+                    raise ValueError(sid)
+                if not isinstance(sentence["blank"], str):
+                    raise TypeError(sentence["blank"])
+
+                sentences.add(sid)
+
+    blanks = {sid for sid, (blank, _) in answer_key.sentences.items() if blank is not None}
+
+    if questions != set(answer_key.questions.values()) or not blanks <= sentences:
+        raise ValueError("IncompleteAnswers")
+
+
+# Grades a whole attempt in one request, as an alternative to keeping the
+# quiz WebSocket open. Takes {"answers": [...]} where each answer is shaped
+# like the WebSocket "answer" message, and returns the validated message
+# for each one in the same order.
+@require_POST
+def submit_quiz(request, qid):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "NotLoggedIn"}, status = 401)
+
+    try:
+        answers = json.loads(request.body)["answers"]
+        answer_key = get_answer_key(qid)
+        check_answers(answer_key, answers)
+
+        results = []
+        mcq = []
+        fib = []
+
+        for answer in answers:
+            if answer["section_type"] == "mcq":
+                message, sid, points = grade_mcq(answer_key, answer)
+                mcq.append((sid, points))
+            elif answer["section_type"] == "fib":
+                message, sentences = grade_fib(answer_key, answer)
+                fib.append(sentences)
+            else:
+                raise ValueError(answer["section_type"])
+
+            results.append(message)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "InvalidAnswers"}, status = 400)
+
+    with transaction.atomic():
+        attempt = Attempt.objects.create(user = request.user,
+                                         quiz_id = qid,
+                                         completed = True,
+                                         quiz_open = False)
+        write_answers(attempt, request.user, mcq, fib)
+
+    return JsonResponse({"attempt": attempt.id,
+                         "awarded": sum(result["awarded"] for result in results),
+                         "results": results})
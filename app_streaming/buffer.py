@@ -0,0 +1,105 @@
+import threading
+import time
+from django.conf import settings
+from django.db import transaction
+from app_quiz.models import *
+
+
+# How many answers, or how many seconds since the oldest unwritten answer, an
+# attempt buffers before writing to the database. The quiz consumers set a
+# timer for the seconds, so an idle client's answers are still written.
+WRITE_BUFFER_ANSWERS = getattr(settings, "QUIZ_WRITE_BUFFER_ANSWERS", 10)
+WRITE_BUFFER_SECONDS = getattr(settings, "QUIZ_WRITE_BUFFER_SECONDS", 30)
+
+
+# Holds the PointsAwarded and response rows for one attempt in memory and
+# writes them with bulk inserts in a single transaction. Rows stay in the
+# buffer until a flush commits, so a failed flush is retried by the next one.
+class AttemptWriteBuffer:
+    def __init__(self, attempt, user):
+        self.attempt = attempt
+        self.user = user
+        self.mcq = []  # (option id, points)
+        self.fib = []  # list of (sentence id, blank, points) per question
+        self.oldest = None
+        self._lock = threading.Lock()
+
+    def add_mcq(self, option_id, points):
+        with self._lock:
+            self.mcq.append((option_id, points))
+            self._touch()
+
+    def add_fib(self, answers):
+        with self._lock:
+            self.fib.append(list(answers))
+            self._touch()
+
+    def _touch(self):
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    # Number of answers waiting to be written.
+    def pending(self):
+        return len(self.mcq) + len(self.fib)
+
+    # Whether the buffer is full or has held an answer for too long, counting
+    # `extra` answers that are about to be added.
+    def due(self, extra=0):
+        if self.pending() + extra >= WRITE_BUFFER_ANSWERS:
+            return True
+
+        return self.oldest is not None and time.monotonic() - self.oldest >= WRITE_BUFFER_SECONDS
+
+    # Seconds until the oldest unwritten answer has been held for too long, or
+    # None if nothing is waiting.
+    def seconds_left(self):
+        oldest = self.oldest
+        if oldest is None:
+            return None
+
+        return max(0, WRITE_BUFFER_SECONDS - (time.monotonic() - oldest))
+
+    def flush(self):
+        with self._lock:
+            mcq = list(self.mcq)
+            fib = list(self.fib)
+
+            if not mcq and not fib:
+                return 0
+
+            with transaction.atomic():
+                write_answers(self.attempt, self.user, mcq, fib)
+
+            del self.mcq[:len(mcq)]
+            del self.fib[:len(fib)]
+            self.oldest = None if self.pending() == 0 else time.monotonic()
+
+            return len(mcq) + len(fib)
+
+
+# Bulk inserts the points and responses for a set of graded answers. Must be
+# called inside a transaction.
+def write_answers(attempt, user, mcq, fib):
+    awarded = [PointsAwarded(user=user, points=points) for _, points in mcq]
+    awarded += [PointsAwarded(user=user, points=points)
+                for answers in fib for _, _, points in answers]
+    PointsAwarded.bulk_award(awarded)
+
+    awarded = iter(awarded)
+
+    MultipleChoiceResponse.objects.bulk_create(
+        [MultipleChoiceResponse(attempt=attempt,
+                                answer_id=option_id,
+                                points_awarded=next(awarded))
+         for option_id, _ in mcq])
+
+    responses = FillInBlankReponse.objects.bulk_create(
+        [FillInBlankReponse(attempt=attempt) for _ in fib])
+
+    FillInBlankAnswer.objects.bulk_create(
+        [FillInBlankAnswer(response=response,
+                           blank=blank,
+                           points_awarded=next(awarded),
+                           sentence_id=sentence_id)
+         for response, answers in zip(responses, fib)
+         for sentence_id, blank, _ in answers])
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+from app_quiz.models import *
+
+
+# Number of quizzes kept in memory before the least recently used is dropped.
+SNAPSHOT_CACHE_SIZE = getattr(settings, "QUIZ_SNAPSHOT_CACHE_SIZE", 64)
+
+# Seconds a snapshot is used before the quiz is read again. Edits made in
+# this process drop snapshots straight away, ones made by other processes are
+# picked up once they're this old.
+SNAPSHOT_MAX_AGE = getattr(settings, "QUIZ_SNAPSHOT_MAX_AGE", 60)
+
+
+# Read-only copy of a quiz's content, indexed by section position. Built once
+# and then shared between every connection taking the quiz.
+class QuizSnapshot:
+    def __init__(self, quiz_id, name, version):
+        self.quiz_id = quiz_id
+        self.name = name
+        self.version = version
+        self.built = time.monotonic()
+        self.sections = {}
+        self.answer_key = AnswerKey(quiz_id)
+
+    # Returns the same structure get_section always has.
+    def section(self, pos):
+        if pos not in self.sections:
+            return {"section_type": "end", "section": {}}
+
+        section_type, section = self.sections[pos]
+
+        return {"section_type": section_type, "section": section}
+
+
+# Normalises a blank so answers are compared the same way everywhere.
+def normalise_blank(blank):
+    if blank is None:
+        return None
+
+    return blank.lower()
+
+
+# Answers for every question in a quiz, loaded with the snapshot. Maps option
+# id to (correct, points) and sentence id to (normalised blank, points), and
+# each option id to its question's id.
+class AnswerKey:
+    def __init__(self, quiz_id):
+        self.quiz_id = quiz_id
+        self.options = {}
+        self.questions = {}
+        self.sentences = {}
+
+    # Returns (correct, points) for an MCQ option, only hitting the database
+    # if the option isn't in this quiz's key yet. Options from other quizzes
+    # are never found.
+    def option(self, option_id):
+        if option_id not in self.options:
+            option = get_object_or_404(MultipleChoiceOptions.objects.select_related("question"),
+                                       id=option_id, question__quiz_id=self.quiz_id)
+            return option.correct, option.question.points
+
+        return self.options[option_id]
+
+    # Returns (normalised blank, points) for a FIB sentence, only hitting the
+    # database if the sentence isn't in this quiz's key yet.
+    def sentence(self, sentence_id):
+        if sentence_id not in self.sentences:
+            sentence = get_object_or_404(FillInBlankSentence, id=sentence_id,
+                                         question__quiz_id=self.quiz_id)
+            return normalise_blank(sentence.blank), sentence.points
+
+        return self.sentences[sentence_id]
+
+
+# Process-local LRU cache of quiz snapshots. Any change to quiz content bumps
+# the version, so snapshots built before the change are rebuilt on next use.
+class QuizSnapshotCache:
+    def __init__(self, size=SNAPSHOT_CACHE_SIZE):
+        self.size = size
+        self.version = 0
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Marks every cached snapshot as stale.
+    def bump_version(self):
+        with self._lock:
+            self.version += 1
+            self._snapshots.clear()
+
+    def clear(self):
+        self.bump_version()
+
+    # Returns the cached snapshot for a quiz without touching the database,
+    # or None if it isn't loaded (or is out of date).
+    def peek(self, quiz_id):
+        with self._lock:
+            snapshot = self._snapshots.get(quiz_id)
+
+            if snapshot is None or snapshot.version != self.version \
+                    or time.monotonic() - snapshot.built > SNAPSHOT_MAX_AGE:
+                return None
+
+            self._snapshots.move_to_end(quiz_id)
+            return snapshot
+
+    # Returns the snapshot for a quiz, loading it from the database on a miss.
+    def get(self, quiz_id):
+        snapshot = self.peek(quiz_id)
+
+        if snapshot is None:
+            snapshot = self.load(quiz_id)
+
+        return snapshot
+
+    def load(self, quiz_id):
+        version = self.version
+        snapshot = build_snapshot(quiz_id, version)
+
+        with self._lock:
+            # Content changed while loading, don't cache what we read.
+            if version != self.version:
+                return snapshot
+
+            self._snapshots[quiz_id] = snapshot
+            self._snapshots.move_to_end(quiz_id)
+
+            while len(self._snapshots) > self.size:
+                self._snapshots.popitem(last=False)
+
+        return snapshot
+
+
+# Reads a whole quiz into a snapshot, one query per table.
+def build_snapshot(quiz_id, version):
+    quiz = get_object_or_404(Quiz, id=quiz_id)
+    snapshot = QuizSnapshot(quiz.id, quiz.name, version)
+
+    # The section index decides which section holds each position.
+    positions = {(entry.section_type, entry.section_id): entry.position
+                 for entry in QuizSectionIndex.objects.filter(quiz=quiz)}
+    sections = {}
+
+    options = {}
+    correct = {}
+    for option in MultipleChoiceOptions.objects.filter(question__quiz=quiz).order_by("id"):
+        options.setdefault(option.question_id, []).append({"id": option.id,
+                                                           "text": option.text})
+        correct[option.id] = (option.question_id, option.correct)
+
+    points = {}
+    for q in MultipleChoice.objects.filter(quiz=quiz):
+        points[q.id] = q.points
+        section = {"sid": q.id,
+                   "title": q.title,
+                   "position": q.position,
+                   "options": options.get(q.id, [])}
+        sections[("mcq", q.id)] = section
+
+    for option_id, (question_id, is_correct) in correct.items():
+        snapshot.answer_key.options[option_id] = (is_correct, points[question_id])
+        snapshot.answer_key.questions[option_id] = question_id
+
+    fib_sentences = {}
+    for sentence in FillInBlankSentence.objects.filter(question__quiz=quiz).order_by("id"):
+        # There can be any number of sentences, not all will have a blank.
+        # The blank word can also be at any point in the sentence.
+        fib_sentences.setdefault(sentence.question_id, []).append({"id": sentence.id,
+                                                                   "before": sentence.before,
+                                                                   "blank": bool(sentence.blank),
+                                                                   "after": sentence.after})
+        snapshot.answer_key.sentences[sentence.id] = (normalise_blank(sentence.blank),
+                                                      sentence.points)
+
+    for q in FillInBlank.objects.filter(quiz=quiz):
+        section = {"sid": q.id,
+                   "title": q.title,
+                   "position": q.position,
+                   "sentences": fib_sentences.get(q.id, [])}
+        sections[("fib", q.id)] = section
+
+    for i in Information.objects.filter(quiz=quiz):
+        section = {"sid": i.id,
+                   "title": i.title,
+                   "position": i.position,
+                   "content": i.content,
+                   "image": "NO_IMAGE"}
+
+        if i.image:
+            section["image"] = i.image.url
+
+        sections[("inf", i.id)] = section
+
+    for key, pos in positions.items():
+        if key in sections:
+            snapshot.sections[pos] = (key[0], sections[key])
+
+    return snapshot
+
+
+snapshot_cache = QuizSnapshotCache()
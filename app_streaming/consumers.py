@@ -1,83 +1,243 @@
+import asyncio
 import json
 from channels.generic.websocket import WebsocketConsumer, AsyncWebsocketConsumer
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import SynchronousOnlyOperation
+from django.db import transaction
 from app_quiz.models import *
 from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from .buffer import AttemptWriteBuffer
+from .cache import snapshot_cache, normalise_blank
+from .dispatch import dispatcher
 
 
-# Retrieves question at specified position in a given quiz.
+# Retrieves question at specified position in a given quiz. Quiz content is
+# served from the snapshot cache, so a warm quiz costs no queries.
 def get_section(quiz, pos):
-    result = {}
+    quiz_id = getattr(quiz, "id", quiz)
 
-    mcq = MultipleChoice.objects.filter(quiz=quiz)
-    fib = FillInBlank.objects.filter(quiz=quiz)
-    inf = Information.objects.filter(quiz=quiz)
+    return snapshot_cache.get(quiz_id).section(pos)
 
-    section = {}
 
-    if mcq.filter(position=pos).count() == 1:
-        q = mcq.get(position=pos)
-        section["sid"] = q.id
-        section["title"] = q.title
-        section["position"] = pos
+# Retrieves the answer key used to grade a quiz, shared by all connections.
+def get_answer_key(quiz_id):
+    return snapshot_cache.get(quiz_id).answer_key
 
-        options = []
-        for option in MultipleChoiceOptions.objects.filter(question=q):
-            options.append({"id": option.id,
-                            "text": option.text})
 
-        section["options"] = options
-        result["section_type"] = "mcq"
+# Grades a MCQ answer. Returns the message for the client, the selected
+# option's id and the points awarded.
+def grade_mcq(answer_key, data):
+    sid = int(data["selected_id"])
 
-    elif fib.filter(position=pos).count() == 1:
-        q = fib.get(position=pos)
-        section["sid"] = q.id
-        section["title"] = q.title
-        section["position"] = pos
+    correct, question_points = answer_key.option(sid)
+    points = 0
 
-        sentences = []
-        for sentence in FillInBlankSentence.objects.filter(question=q):
-            blank = False
+    if correct:
+        points = question_points
+        message = {
+            "type": "validated_mcq_answer",
+            "correct": True,
+            "awarded": question_points
+        }
+    else:
+        message = {
+            "type": "validated_mcq_answer",
+            "correct": False,
+            "awarded": 0
+        }
 
-            if sentence.blank:
-                blank = True
+    return message, sid, points
 
-            # There can be any number of sentences, not all will have a blank.
-            # The blank word can also be at any point in the sentence.
-            sentences.append({"id": sentence.id,
-                              "before": sentence.before,
-                              "blank": blank,
-                              "after": sentence.after})
 
-        section["sentences"] = sentences
-        result["section_type"] = "fib"
+# Grades a FIB answer. Returns the message for the client and a
+# (sentence id, blank, points) tuple for each sentence.
+def grade_fib(answer_key, data):
+    total = 0
+    correct = []
+    answers = []
 
-    elif inf.filter(position=pos).count() == 1:
-        i = inf.get(position=pos)
-        section["sid"] = i.id
-        section["title"] = i.title
-        section["position"] = pos
-        section["content"] = i.content
-        section["image"] = "NO_IMAGE"
+    for sentence in data["sentences"]:
+        sid = int(sentence["id"])
+        blank = sentence["blank"]
+        points = 0
 
-        if i.image:
-            section["image"] = i.image.url
+        key_blank, sentence_points = answer_key.sentence(sid)
+        if key_blank is not None and normalise_blank(blank) == key_blank:
+            total += sentence_points
+            points = sentence_points
+            correct.append(sid)
 
-        result["section_type"] = "inf"
+        answers.append((sid, blank, points))
 
-    else:
-        result["section_type"] = "end"
+    message = {
+        "type": "validated_fib_answer",
+        "correct": correct,
+        "awarded": total
+    }
+
+    return message, answers
+
+
+# The quiz protocol (start/next/answer) shared by the sync and async
+# consumers. Each handler returns the messages to send back to the client and
+# whether the socket should then be closed.
+class QuizProtocol:
+    def setup(self):
+        self.user = self.scope["user"]  # for later use
+        self.attempt = None
+        self.buffer = None
+        self.flush_timer = None
+
+    def handle(self, data):
+        if data["type"] == "answer":
+            return self.handle_answer(data)
+        elif data["type"] == "next":
+            return self.handle_next(data)
+        elif data["type"] == "start":
+            return self.handle_start(data)
+
+        return [], False
+
+    # Client has submitted an answer for validation.
+    def handle_answer(self, data):
+        messages = []
+        answer_key = get_answer_key(self.attempt.quiz_id)
+
+        if data["section_type"] == "mcq":
+            message, sid, points = grade_mcq(answer_key, data)
+            messages.append(message)
+
+            self.buffer.add_mcq(sid, points)
+        elif data["section_type"] == "fib":
+            message, answers = grade_fib(answer_key, data)
+            messages.append(message)
+
+            self.buffer.add_fib(answers)
+
+        if self.buffer.due():
+            self.buffer.flush()
+
+        return messages, False
+
+    # Client ready for next question.
+    def handle_next(self, data):
+        qid = data["qid"]
+        position = data["position"]
+        result = get_section(qid, position + 1)
+
+        # No more questions, tell client & close WebSocket.
+        if result["section_type"] == "end":
+            attempt = self.attempt
+
+            with transaction.atomic():
+                self.buffer.flush()
+                attempt.completed = True
+                attempt.quiz_open = False
+                attempt.save()
+
+            return [{"type": "end_quiz"}], True
+
+        return [
+            {
+                "type": "next_section",
+                "section_type": result["section_type"],
+                "section": result["section"]
+            }
+        ], False
+
+    # Client ready for first question.
+    def handle_start(self, data):
+        qid = data["qid"]
+        result = get_section(qid, 1)
+
+        if self.buffer is not None:
+            self.buffer.flush()
+
+        attempt = Attempt(user=self.user,
+                          quiz_id=qid,
+                          completed=False,
+                          quiz_open=True)
+        attempt.save()
+
+        self.attempt = attempt
+        self.buffer = AttemptWriteBuffer(attempt, self.user)
+
+        return [
+            {
+                "type": "first_section",
+                "section_type": result["section_type"],
+                "section": result["section"]
+            }
+        ], False
+
+    # Whether handling a message would touch the database. False means it
+    # can be answered entirely from the snapshot cache and write buffer.
+    def needs_database(self, data):
+        if data["type"] == "answer":
+            if self.attempt is None:
+                return True
+
+            snapshot = snapshot_cache.peek(self.attempt.quiz_id)
+            if snapshot is None or self.buffer.due(extra=1):
+                return True
+
+            if data["section_type"] == "mcq":
+                return int(data["selected_id"]) not in snapshot.answer_key.options
+            elif data["section_type"] == "fib":
+                return any(int(sentence["id"]) not in snapshot.answer_key.sentences
+                           for sentence in data["sentences"])
+        elif data["type"] == "next":
+            snapshot = snapshot_cache.peek(data["qid"])
+            if snapshot is None or self.attempt is None:
+                return True
+
+            return snapshot.section(data["position"] + 1)["section_type"] == "end"
+
+        return True
+
+    # Writes out the buffer if its oldest answer has been held for too long.
+    def flush_due(self):
+        if self.buffer is not None and self.buffer.due():
+            self.buffer.flush()
 
-    result["section"] = section
+    # Sets a timer on the event loop for when the buffer's oldest answer will
+    # have been held for too long, so the answers of a client that stops
+    # sending are written without waiting for its next message.
+    async def schedule_flush(self):
+        delay = self.buffer.seconds_left() if self.buffer is not None else None
+        if delay is None or self.flush_timer is not None:
+            return
 
-    return result
+        self.flush_timer = asyncio.get_running_loop().call_later(
+            delay, lambda: asyncio.ensure_future(self.timed_flush()))
+
+    async def timed_flush(self):
+        self.flush_timer = None
+        await database_sync_to_async(self.flush_due)()
+        await self.schedule_flush()
+
+    async def cancel_flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+    # Writes out anything still buffered, so every answer the client was
+    # told about is saved on a normal close.
+    def close_attempt(self):
+        if self.attempt is None:
+            return
+
+        with transaction.atomic():
+            self.buffer.flush()
+            self.attempt.quiz_open = False
+            self.attempt.save()
 
 
 # Handles all quiz-related WebSocket activity.
-class QuizConsumer(WebsocketConsumer):
+class QuizConsumer(QuizProtocol, WebsocketConsumer):
     def connect(self):
         self.accept()
-        self.user = self.scope["user"]  # for later use
+        self.setup()
 
         self.send(text_data=json.dumps(
             {
@@ -86,141 +246,82 @@ class QuizConsumer(WebsocketConsumer):
         ))
 
     def disconnect(self, close_code):
-        self.attempt.quiz_open = False
-        self.attempt.save()
+        async_to_sync(self.cancel_flush)()
+        self.close_attempt()
 
     def receive(self, text_data):
         data = json.loads(text_data)
-        result = None
+        messages, close = self.handle(data)
 
-        # Client has submitted an answer for validation.
-        if data["type"] == "answer":
-            if data["section_type"] == "mcq":
-                qid = data["question_id"]
-                sid = data["selected_id"]
-
-                question = get_object_or_404(MultipleChoice, id=qid)
-                selected = get_object_or_404(MultipleChoiceOptions, id=sid)
-                points = 0
-
-                if selected.correct:
-                    points = question.points
-                    self.send(json.dumps(
-                        {
-                            "type": "validated_mcq_answer",
-                            "correct": True,
-                            "awarded": question.points
-                        }
-                    ))
-                else:
-                    self.send(json.dumps(
-                        {
-                            "type": "validated_mcq_answer",
-                            "correct": False,
-                            "awarded": 0
-                        }
-                    ))
-
-                awarded = PointsAwarded(user=self.user,
-                                        points=points)
-                awarded.save()
-
-                response = MultipleChoiceResponse(attempt=self.attempt,
-                                                  answer=selected,
-                                                  points_awarded=awarded)
-                response.save()
-            elif data["section_type"] == "fib":
-                total = 0
-                correct = []
-                response = FillInBlankReponse(attempt=self.attempt)
-                response.save()
-
-                for sentence in data["sentences"]:
-                    sid = sentence["id"]
-                    blank = sentence["blank"]
-                    points = 0
-
-                    s = get_object_or_404(FillInBlankSentence, id=sid)
-                    if blank.lower() == s.blank.lower():
-                        total += s.points
-                        points = s.points
-                        correct.append(sid)
-
-                    awarded = PointsAwarded(user=self.user,
-                                            points=points)
-                    awarded.save()
-
-                    answer = FillInBlankAnswer(response=response,
-                                               blank=blank,
-                                               points_awarded=awarded,
-                                               sentence=s)
-                    answer.save()
-
-                self.send(json.dumps(
-                    {
-                        "type": "validated_fib_answer",
-                        "correct": correct,
-                        "awarded": total
-                    }
-                ))
-
-        # Client ready for next question.
-        elif data["type"] == "next":
-            qid = data["qid"]
-            quiz = get_object_or_404(Quiz, id=qid)
-            position = data["position"]
-            result = get_section(quiz, position + 1)
-
-            # No more questions, tell client & close WebSocket.
-            if result["section_type"] == "end":
-                self.send(json.dumps(
-                    {
-                        "type": "end_quiz"
-                    }
-                ))
-                attempt = self.attempt
+        if self.flush_timer is None and self.buffer is not None and self.buffer.pending():
+            async_to_sync(self.schedule_flush)()
 
-                attempt.completed = True
-                attempt.quiz_open = False
-                attempt.save()
+        for message in messages:
+            self.send(json.dumps(message))
 
-                self.close()
-            else:
-                self.send(json.dumps(
-                    {
-                        "type": "next_section",
-                        "section_type": result["section_type"],
-                        "section": result["section"]
-                    }
-                ))
-
-        # Client ready for first question.    
-        elif data["type"] == "start":
-            qid = data["qid"]
-            quiz = get_object_or_404(Quiz, id=qid)
-            result = get_section(quiz, 1)
+        if close:
+            self.close()
 
-            print(self.user)
-            attempt = Attempt(user=self.user,
-                              quiz=quiz,
-                              completed=False,
-                              quiz_open=True)
-            attempt.save()
 
-            self.attempt = attempt
+# Async version of QuizConsumer. Messages that can be answered from cache run
+# on the event loop, anything else does all its database work in one call on
+# the thread pool.
+class AsyncQuizConsumer(QuizProtocol, AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept()
+        self.setup()
 
-            self.send(json.dumps(
-                {
-                    "type": "first_section",
-                    "section_type": result["section_type"],
-                    "section": result["section"]
-                }
-            ))
+        await self.send(text_data=json.dumps(
+            {
+                "type": "connected"
+            }
+        ))
+
+    async def disconnect(self, close_code):
+        await self.cancel_flush()
+        await database_sync_to_async(self.close_attempt)()
+
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+
+        if self.needs_database(data):
+            messages, close = await database_sync_to_async(self.handle)(data)
+        else:
+            try:
+                messages, close = self.handle(data)
+            except SynchronousOnlyOperation:
+                # Quiz content changed since the check, so the snapshot has
+                # to be reloaded from the database after all.
+                messages, close = await database_sync_to_async(self.handle)(data)
+
+        await self.schedule_flush()
 
+        for message in messages:
+            await self.send(json.dumps(message))
 
+        if close:
+            await self.close()
+
+
+# Channel group holding every notification socket a user has open.
+def notification_group(user_id):
+    return 'notifications_%d' % user_id
+
+
+# Each user only joins their own group, so a notification is delivered to
+# its target's sockets and nobody else's.
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.group_name = 'public_room'
+        user = self.scope.get("user")
+        self.group_name = None
+
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        dispatcher.attach(asyncio.get_running_loop())
+
+        self.group_name = notification_group(user.id)
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
@@ -228,6 +329,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        if self.group_name is None:
+            return
+
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
@@ -235,3 +339,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def send_notification(self, event):
         await self.send(text_data=json.dumps({ 'message': event['message'] , 'id' : event['id'], 'target' : event['target'] }))
+
+    # Several notifications for this user sent together by the dispatcher,
+    # still one frame each for the browser.
+    async def send_notifications(self, event):
+        for notification in event['notifications']:
+            await self.send_notification(notification)
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+
+# How long the dispatcher waits after the first notification of a burst, so
+# the rest of the burst can be sent to each recipient together.
+NOTIFICATION_DISPATCH_DELAY = getattr(settings, "NOTIFICATION_DISPATCH_DELAY", 0.01)
+
+# Number of recent send latencies kept for the stats.
+LATENCY_SAMPLES = 1000
+
+
+# Nearest-rank percentile of an already sorted list.
+def percentile(values, pct):
+    if not values:
+        return None
+
+    index = max(0, int(round(pct / 100 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+# Sends channel layer group messages from a background event loop, so the
+# thread that queued them never waits on the channel layer. Messages queued
+# for the same group while a batch is going out are sent together as one
+# "send_notifications" message.
+#
+# InMemoryChannelLayer is only safe to use from the event loop its consumers
+# run on, so once a consumer has attached its loop sends are run there.
+class NotificationDispatcher:
+    def __init__(self, layer_alias=DEFAULT_CHANNEL_LAYER, delay=NOTIFICATION_DISPATCH_DELAY):
+        self.layer_alias = layer_alias
+        self.delay = delay
+
+        self._pending = {}  # group -> [(time queued, message)]
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._loop = None
+        self._event = None
+        self._target = None
+
+        self.enqueued = 0
+        self.sent = 0
+        self.group_sends = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    # Sends from now on run on this loop, the one the consumers use.
+    def attach(self, loop):
+        self._target = loop
+
+    def enqueue(self, group, message):
+        with self._lock:
+            self._pending.setdefault(group, []).append((time.perf_counter(), message))
+            self._queued += 1
+            self.enqueued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queued)
+
+            if self._loop is None:
+                self._start()
+
+            loop = self._loop
+
+        loop.call_soon_threadsafe(self._event.set)
+
+    def _start(self):
+        self._loop = asyncio.new_event_loop()
+        self._event = asyncio.Event()
+
+        thread = threading.Thread(target=self._loop.run_until_complete, args=(self._drain(),),
+                                  name="notification-dispatcher", daemon=True)
+        thread.start()
+
+    async def _drain(self):
+        while True:
+            await self._event.wait()
+            await asyncio.sleep(self.delay)
+            self._event.clear()
+
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+
+            await asyncio.gather(*[self._send(group, items) for group, items in batch.items()])
+
+            with self._lock:
+                self._queued -= sum(len(items) for items in batch.values())
+                self._idle.notify_all()
+
+    async def _send(self, group, items):
+        messages = [message for _, message in items]
+
+        if len(messages) == 1:
+            message = messages[0]
+        else:
+            message = {"type": "send_notifications", "notifications": messages}
+
+        try:
+            send = get_channel_layer(self.layer_alias).group_send(group, message)
+            target = self._target
+
+            if target is not None and target.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(send, target))
+            else:
+                await send
+        except Exception as error:
+            self.errors += len(items)
+            self.last_error = repr(error)
+            return
+
+        now = time.perf_counter()
+        self.group_sends += 1
+        self.sent += len(items)
+        self.latencies.extend(now - queued for queued, _ in items)
+
+    # Blocks until everything queued so far has been sent, or the timeout
+    # runs out. Returns whether the queue emptied.
+    def wait_idle(self, timeout=None):
+        with self._idle:
+            return self._idle.wait_for(lambda: self._queued == 0, timeout)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+            return {
+                "queue_depth": self._queued,
+                "max_queue_depth": self.max_queue_depth,
+                "enqueued": self.enqueued,
+                "sent": self.sent,
+                "group_sends": self.group_sends,
+                "coalesced": self.sent - self.group_sends,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "latency_ms": {
+                    "p50": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+                    "p95": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+                    "max": round(latencies[-1] * 1000, 3) if latencies else None,
+                },
+            }
+
+
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import random
+import sqlite3
+import string
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel, id);
+CREATE INDEX IF NOT EXISTS channel_messages_expires ON channel_messages (expires);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+CREATE INDEX IF NOT EXISTS channel_groups_channel ON channel_groups (channel);
+"""
+
+# Most channels named in one query, below SQLite's variable limit.
+QUERY_CHANNELS = 500
+
+
+# Channel layer shared by every process on this machine that points at the
+# same SQLite file. Messages wait in a table until the process holding the
+# channel picks them up, so group sends reach sockets in other workers.
+#
+# All database work runs on one thread per layer. Each event loop has one
+# poller that fetches messages for every channel it's waiting on in a single
+# query, backing off while nothing arrives. Messages are stored as JSON.
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(self, path="channels.sqlite3", expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, poll_interval=0.002, max_poll_interval=0.05,
+                 cleanup_interval=1, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity,
+                         **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.cleanup_interval = cleanup_interval
+        self.client_prefix = "".join(random.choice(string.ascii_letters) for i in range(8))
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="channel-layer")
+        self._connection = None
+        self._last_cleanup = 0
+        self._receivers = weakref.WeakKeyDictionary()
+
+    # Database work, only ever run on the layer's thread
+
+    def _db(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+
+        return self._connection
+
+    def _cleanup(self, now):
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+
+        self._last_cleanup = now
+        db = self._db()
+
+        with db:
+            # A channel with expired messages isn't being read any more, so
+            # it's removed from its groups, as InMemoryChannelLayer does.
+            db.execute("DELETE FROM channel_groups WHERE channel IN "
+                       "(SELECT DISTINCT channel FROM channel_messages WHERE expires <= ?)", (now,))
+            db.execute("DELETE FROM channel_messages WHERE expires <= ?", (now,))
+            db.execute("DELETE FROM channel_groups WHERE expires <= ?", (now,))
+
+    def _send(self, channel, body, capacity, now):
+        self._cleanup(now)
+
+        # One statement, so the capacity check and insert are atomic.
+        cursor = self._db().execute(
+            "INSERT INTO channel_messages (channel, expires, body) SELECT ?, ?, ? "
+            "WHERE (SELECT COUNT(*) FROM channel_messages WHERE channel = ? AND expires > ?) < ?",
+            (channel, now + self.expiry, body, channel, now, capacity))
+
+        return cursor.rowcount == 1
+
+    def _group_send(self, group, body, now):
+        self._cleanup(now)
+        db = self._db()
+
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            counts = db.execute(
+                "SELECT g.channel, (SELECT COUNT(*) FROM channel_messages m "
+                "WHERE m.channel = g.channel AND m.expires > ?) "
+                "FROM channel_groups g WHERE g.group_name = ? AND g.expires > ?",
+                (now, group, now)).fetchall()
+
+            # Full channels are skipped, a group send never fails.
+            rows = [(channel, now + self.expiry, body)
+                    for channel, count in counts if count < self.get_capacity(channel)]
+            db.executemany("INSERT INTO channel_messages (channel, expires, body) VALUES (?, ?, ?)",
+                           rows)
+
+        return len(rows)
+
+    # Takes up to `limit` waiting messages for the given channels, oldest
+    # first, as (channel, body) pairs.
+    def _receive(self, channels, now, limit=100):
+        self._cleanup(now)
+        db = self._db()
+        messages = []
+
+        for i in range(0, len(channels), QUERY_CHANNELS):
+            chunk = channels[i:i + QUERY_CHANNELS]
+            placeholders = ",".join("?" * len(chunk))
+            messages += db.execute(
+                "DELETE FROM channel_messages WHERE id IN (SELECT id FROM channel_messages "
+                "WHERE channel IN (%s) AND expires > ? ORDER BY id LIMIT ?) "
+                "RETURNING id, channel, body" % placeholders,
+                (*chunk, now, limit)).fetchall()
+
+        return [(channel, body) for _, channel, body in sorted(messages)]
+
+    def _group_add(self, group, channel, now):
+        self._db().execute("INSERT OR REPLACE INTO channel_groups (group_name, channel, expires) "
+                           "VALUES (?, ?, ?)", (group, channel, now + self.group_expiry))
+
+    def _group_discard(self, group, channel):
+        self._db().execute("DELETE FROM channel_groups WHERE group_name = ? AND channel = ?",
+                           (group, channel))
+
+    def _flush(self):
+        db = self._db()
+
+        with db:
+            db.execute("DELETE FROM channel_messages")
+            db.execute("DELETE FROM channel_groups")
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor,
+                                                                partial(function, *args))
+
+    # Tells every poller in this process to check for messages now, rather
+    # than wait out its back off.
+    def _wake(self):
+        for receiver in list(self._receivers.values()):
+            receiver.wake()
+
+    def _receiver(self):
+        loop = asyncio.get_running_loop()
+        receiver = self._receivers.get(loop)
+
+        if receiver is None:
+            receiver = self._receivers[loop] = _Receiver(self, loop)
+
+        return receiver
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+
+        sent = await self._run(self._send, channel, json.dumps(message),
+                               self.get_capacity(channel), time.time())
+
+        if not sent:
+            raise ChannelFull(channel)
+
+        self._wake()
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+
+        return await self._receiver().receive(channel)
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.%s!%s" % (
+            prefix,
+            self.client_prefix,
+            "".join(random.choice(string.ascii_letters) for i in range(12)),
+        )
+
+    # Flush extension
+
+    async def flush(self):
+        await self._run(self._flush)
+
+    async def close(self):
+        await self._run(self._close)
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+
+        await self._run(self._group_add, group, channel, time.time())
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+
+        await self._run(self._group_discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+
+        if await self._run(self._group_send, group, json.dumps(message), time.time()):
+            self._wake()
+
+
+# Receives for every channel waited on in one event loop. Messages fetched
+# for a channel wait in its local queue until something receives them.
+class _Receiver:
+    def __init__(self, layer, loop):
+        self.layer = layer
+        self.loop = weakref.ref(loop)
+        self.queues = {}
+        self.waiting = {}
+        self.task = None
+        self.event = asyncio.Event()
+
+    def wake(self):
+        loop = self.loop()
+
+        try:
+            if loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # Closed in the meantime
+            pass
+
+    async def receive(self, channel):
+        queue = self.queues.setdefault(channel, asyncio.Queue())
+        self.waiting[channel] = self.waiting.get(channel, 0) + 1
+
+        try:
+            if queue.empty() and self.task is None:
+                self.task = asyncio.get_running_loop().create_task(self.poll())
+            elif queue.empty():
+                self.event.set()
+
+            return await queue.get()
+        finally:
+            self.waiting[channel] -= 1
+
+            if not self.waiting[channel]:
+                del self.waiting[channel]
+
+                if queue.empty():
+                    del self.queues[channel]
+
+    async def poll(self):
+        interval = self.layer.poll_interval
+
+        try:
+            while self.waiting:
+                self.event.clear()
+                messages = await self.layer._run(self.layer._receive,
+                                                 [channel for channel in self.waiting
+                                                  if self.queues[channel].empty()],
+                                                 time.time())
+
+                for channel, body in messages:
+                    self.queues.setdefault(channel, asyncio.Queue()).put_nowait(json.loads(body))
+
+                if messages:
+                    interval = self.layer.poll_interval
+                    continue
+
+                try:
+                    await asyncio.wait_for(self.event.wait(), interval)
+                    interval = self.layer.poll_interval
+                except asyncio.TimeoutError:
+                    interval = min(interval * 2, self.layer.max_poll_interval)
+        finally:
+            self.task = None
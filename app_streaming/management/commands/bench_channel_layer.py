@@ -0,0 +1,152 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from app_streaming.layers import SQLiteChannelLayer
+
+
+# Runs in a separate process: sends every message received on `channel`
+# straight back to the channel it names. The worker doesn't set up Django,
+# so this module mustn't import models at the top level.
+def echo(path, channel, count):
+    async def run():
+        layer = SQLiteChannelLayer(path=path)
+
+        for _ in range(count):
+            message = await layer.receive(channel)
+            await layer.send(message['reply'], message)
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    """Compares the SQLite channel layer with InMemoryChannelLayer: point to
+    point throughput, group fan-out and round trips to another process."""
+
+    help = 'Benchmark the SQLite channel layer against the in-memory layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000,
+                            help='Messages sent point to point')
+        parser.add_argument('--group-size', type=int, default=100,
+                            help='Channels in the group for the fan-out test')
+        parser.add_argument('--group-messages', type=int, default=20,
+                            help='Messages sent to the group')
+        parser.add_argument('--round-trips', type=int, default=200,
+                            help='Round trips to another process (SQLite layer only)')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'channels.sqlite3')
+            layers = {'memory': lambda: InMemoryChannelLayer(capacity=options['messages']),
+                      'sqlite': lambda: SQLiteChannelLayer(path=path, capacity=options['messages'])}
+            report = {}
+
+            for name, make_layer in layers.items():
+                report[name] = {
+                    'send_receive': asyncio.run(self.send_receive(make_layer(), options['messages'])),
+                    'group_send': asyncio.run(self.group_send(make_layer(), options['group_size'],
+                                                              options['group_messages'])),
+                }
+
+            report['sqlite']['cross_process'] = self.cross_process(path, options['round_trips'])
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as f:
+                f.write(output + '\n')
+
+        self.stdout.write(output)
+
+    # One task sends while another receives on the same channel.
+    async def send_receive(self, layer, count):
+        channel = await layer.new_channel()
+
+        async def send():
+            for i in range(count):
+                await layer.send(channel, {'type': 'bench', 'n': i})
+
+        async def receive():
+            for _ in range(count):
+                await layer.receive(channel)
+
+        start = time.perf_counter()
+        await asyncio.gather(send(), receive())
+        duration = time.perf_counter() - start
+
+        await layer.flush()
+
+        return {'messages': count,
+                'duration_s': round(duration, 3),
+                'messages_per_s': round(count / duration, 1)}
+
+    # Every channel in a group waits for every group message.
+    async def group_send(self, layer, size, count):
+        channels = [await layer.new_channel() for _ in range(size)]
+
+        for channel in channels:
+            await layer.group_add('bench', channel)
+
+        async def receive(channel):
+            for _ in range(count):
+                await layer.receive(channel)
+
+        receivers = asyncio.gather(*[receive(channel) for channel in channels])
+
+        start = time.perf_counter()
+        for i in range(count):
+            await layer.group_send('bench', {'type': 'bench', 'n': i})
+        await receivers
+        duration = time.perf_counter() - start
+
+        await layer.flush()
+
+        return {'channels': size,
+                'group_messages': count,
+                'deliveries_per_s': round(size * count / duration, 1)}
+
+    # Round trips through a worker process sharing the same file, which
+    # InMemoryChannelLayer can't do at all.
+    def cross_process(self, path, count):
+        from app_streaming.dispatch import percentile
+
+        async def run():
+            layer = SQLiteChannelLayer(path=path)
+            channel = await layer.new_channel()
+            reply = await layer.new_channel()
+
+            worker = multiprocessing.get_context('spawn').Process(target=echo,
+                                                                  args=(path, channel, count + 1))
+            worker.start()
+
+            latencies = []
+            try:
+                # Wait for the worker to start up before timing anything
+                await layer.send(channel, {'type': 'bench', 'reply': reply})
+                await asyncio.wait_for(layer.receive(reply), 60)
+
+                for i in range(count):
+                    start = time.perf_counter()
+                    await layer.send(channel, {'type': 'bench', 'n': i, 'reply': reply})
+                    await asyncio.wait_for(layer.receive(reply), 30)
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                worker.join(30)
+
+            return latencies
+
+        latencies = sorted(asyncio.run(run()))
+
+        return {'round_trips': count,
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3)}
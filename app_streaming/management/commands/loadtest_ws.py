@@ -0,0 +1,276 @@
+import asyncio
+import json
+import resource
+import threading
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from app_quiz.models import Quiz
+from app_streaming.dispatch import dispatcher, percentile
+from app_streaming.consumers import QuizConsumer, AsyncQuizConsumer, NotificationConsumer
+from app_user.models import ExtendedUser, Notification
+
+
+# Counts every query run on any database connection while installed.
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+
+        return execute(sql, params, many, context)
+
+    def install(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+        connection_created.connect(self.connection_created)
+
+    def uninstall(self):
+        connection_created.disconnect(self.connection_created)
+
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def connection_created(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+def summarise(latencies):
+    summary = {}
+
+    for message_type, values in sorted(latencies.items()):
+        values = sorted(values)
+        summary[message_type] = {"count": len(values),
+                                 "p50_ms": round(percentile(values, 50) * 1000, 3),
+                                 "p95_ms": round(percentile(values, 95) * 1000, 3),
+                                 "p99_ms": round(percentile(values, 99) * 1000, 3)}
+
+    return summary
+
+
+class Command(BaseCommand):
+    """Drives simulated clients through the quiz or notification WebSockets
+    in-process and reports throughput, latency, queries and memory."""
+
+    help = 'Load test ws/quiz-stream or ws/notify/ with simulated clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=['quiz', 'notify'], default='quiz')
+        parser.add_argument('--clients', type=int, default=10)
+        parser.add_argument('--quiz', type=int, help='Quiz id to take, defaults to the first quiz')
+        parser.add_argument('--consumer', choices=['sync', 'async'],
+                            default=getattr(settings, 'QUIZ_CONSUMER', 'sync'))
+        parser.add_argument('--idle', type=int, default=0,
+                            help='Extra notification sockets that are sent nothing, to show '
+                                 'delivery cost doesn\'t grow with connections')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the users the run creates, and their attempts, points and '
+                                 'notifications, instead of deleting them afterwards')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        # Every run has its own users, so deleting them afterwards removes
+        # everything the run wrote and nothing else
+        self.run_id = uuid.uuid4().hex[:8]
+        self.created = []
+
+        try:
+            self.load_test(options)
+        finally:
+            if not options['keep']:
+                ExtendedUser.objects.filter(id__in=self.created).delete()
+
+    def create_user(self, name):
+        username = 'loadtest-%s-%s' % (self.run_id, name)
+        user = ExtendedUser.objects.create(username=username, email='%s@example.com' % username)
+        self.created.append(user.id)
+
+        return user
+
+    def load_test(self, options):
+        users = [self.create_user(i) for i in range(options['clients'])]
+
+        report = {'scenario': options['scenario'], 'clients': len(users)}
+        latencies = {}
+        counter = QueryCounter()
+
+        if options['scenario'] == 'quiz':
+            if options['quiz'] is not None:
+                quiz = Quiz.objects.filter(id=options['quiz']).first()
+            else:
+                quiz = Quiz.objects.order_by('id').first()
+
+            if quiz is None:
+                raise CommandError('No quiz to load test, run seed first or pass --quiz')
+
+            consumer = AsyncQuizConsumer if options['consumer'] == 'async' else QuizConsumer
+            report['consumer'] = options['consumer']
+            report['quiz'] = quiz.id
+            run = self.run_quiz(consumer, quiz.id, users, latencies)
+        else:
+            idle = [self.create_user('idle-%d' % i) for i in range(options['idle'])]
+            report['idle_clients'] = len(idle)
+            run = self.run_notify(users, idle, latencies, report)
+
+        counter.install()
+        start = time.perf_counter()
+
+        try:
+            messages = async_to_sync(run)()
+        finally:
+            duration = time.perf_counter() - start
+            counter.uninstall()
+
+        report['duration_s'] = round(duration, 3)
+        report['messages'] = messages
+        report['messages_per_s'] = round(messages / duration, 1) if duration else None
+        report['latency'] = summarise(latencies)
+        report['queries'] = counter.count
+        report['queries_per_message'] = round(counter.count / messages, 3) if messages else None
+        # ru_maxrss is in kilobytes on Linux
+        report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as f:
+                f.write(output + '\n')
+
+        self.stdout.write(output)
+
+    # Every client takes the whole quiz: start, then answer and next until
+    # the server ends the quiz.
+    def run_quiz(self, consumer, quiz_id, users, latencies):
+        async def timed(communicator, message_type, message):
+            start = time.perf_counter()
+            await communicator.send_to(json.dumps(message))
+            data = json.loads(await communicator.receive_from(timeout=30))
+            latencies.setdefault(message_type, []).append(time.perf_counter() - start)
+
+            return data
+
+        async def client(user):
+            communicator = WebsocketCommunicator(consumer.as_asgi(), '/ws/quiz-stream')
+            communicator.scope['user'] = user
+
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected
+            await communicator.receive_from(timeout=30)
+
+            sent = 1
+            data = await timed(communicator, 'start', {'type': 'start', 'qid': quiz_id})
+
+            while data['type'] != 'end_quiz':
+                section = data['section']
+
+                if data['section_type'] == 'mcq' and section['options']:
+                    await timed(communicator, 'answer', {'type': 'answer',
+                                                         'section_type': 'mcq',
+                                                         'question_id': section['sid'],
+                                                         'selected_id': section['options'][0]['id']})
+                    sent += 1
+                elif data['section_type'] == 'fib':
+                    sentences = [{'id': sentence['id'], 'blank': ''}
+                                 for sentence in section['sentences'] if sentence['blank']]
+                    await timed(communicator, 'answer', {'type': 'answer',
+                                                         'section_type': 'fib',
+                                                         'sentences': sentences})
+                    sent += 1
+
+                data = await timed(communicator, 'next', {'type': 'next',
+                                                          'qid': quiz_id,
+                                                          'position': section['position']})
+                sent += 1
+
+            await communicator.disconnect()
+
+            return sent
+
+        async def run():
+            return sum(await asyncio.gather(*[client(user) for user in users]))
+
+        return run
+
+    # Every client connects, then one notification is created per client and
+    # the time until its target receives it is measured. Every frame any
+    # client receives is counted, to show the fan-out per notification. Idle
+    # clients connect too but are never notified.
+    def run_notify(self, users, idle, latencies, report):
+        async def connect(user):
+            communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notify/')
+            communicator.scope['user'] = user
+
+            connected, _ = await communicator.connect(timeout=30)
+            assert connected
+
+            return communicator
+
+        async def drain(communicator):
+            frames = 0
+
+            while not await communicator.receive_nothing(timeout=0.05):
+                await communicator.receive_from()
+                frames += 1
+
+            return frames
+
+        async def run():
+            communicators = [await connect(user) for user in users]
+            idle_communicators = [await connect(user) for user in idle]
+
+            created = {}
+
+            @database_sync_to_async
+            def notify(user):
+                created[user.id] = time.perf_counter()
+                Notification.objects.create(user=user, message='Load test')
+
+            async def wait(user, communicator):
+                frames = 0
+
+                while True:
+                    data = json.loads(await communicator.receive_from(timeout=30))
+                    frames += 1
+
+                    if data.get('target', user.id) == user.id:
+                        latencies.setdefault('notification', []).append(
+                            time.perf_counter() - created[user.id])
+                        break
+
+                return frames + await drain(communicator)
+
+            waiters = [asyncio.ensure_future(wait(user, communicator))
+                       for user, communicator in zip(users, communicators)]
+
+            for user in users:
+                await notify(user)
+
+            frames = sum(await asyncio.gather(*waiters))
+            frames += sum(await asyncio.gather(*[drain(communicator)
+                                                 for communicator in idle_communicators]))
+
+            for communicator in communicators + idle_communicators:
+                await communicator.disconnect()
+
+            report['frames_received'] = frames
+            report['dispatcher'] = dispatcher.stats()
+            report['frames_per_notification'] = round(frames / len(users), 3) if users else None
+
+            return len(users)
+
+        return run
@@ -1,7 +1,15 @@
+from django.conf import settings
 from django.urls import path, re_path
 from . import consumers
 
+# QUIZ_CONSUMER picks which implementation serves quizzes, so they can be
+# compared under load.
+if getattr(settings, "QUIZ_CONSUMER", "sync") == "async":
+    quiz_consumer = consumers.AsyncQuizConsumer
+else:
+    quiz_consumer = consumers.QuizConsumer
+
 ws_urlpatterns = [
-    path('ws/quiz-stream', consumers.QuizConsumer.as_asgi()),
+    path('ws/quiz-stream', quiz_consumer.as_asgi()),
     re_path(r"ws/notify/", consumers.NotificationConsumer.as_asgi()),
 ]
@@ -1,19 +1,37 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from app_user.models import Notification
+from app_quiz.models import Quiz, MultipleChoice, MultipleChoiceOptions, FillInBlank, \
+    FillInBlankSentence, Information, QuizSectionIndex
+from .cache import snapshot_cache
+from .consumers import notification_group
+from .dispatch import dispatcher
 
+# Notifications are pushed once they're committed, by the dispatcher's
+# background loop rather than the thread that saved them.
 @receiver(post_save, sender=Notification)
 def notification_created(sender, instance, created, **kwargs):
     if created:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'public_room',
-            {
-                "type": "send_notification",
-                "message": instance.message,
-                "id" : instance.id,
-                "target" : instance.user.id
-            }
-        )
\ No newline at end of file
+        group = notification_group(instance.user_id)
+        message = {
+            "type": "send_notification",
+            "message": instance.message,
+            "id" : instance.id,
+            "target" : instance.user_id
+        }
+        transaction.on_commit(lambda: dispatcher.enqueue(group, message))
+
+# Any change to quiz content makes cached snapshots stale. Done again once
+# the transaction commits, so a snapshot read from the old content in the
+# meantime isn't kept.
+@receiver([post_save, post_delete], sender=Quiz)
+@receiver([post_save, post_delete], sender=MultipleChoice)
+@receiver([post_save, post_delete], sender=MultipleChoiceOptions)
+@receiver([post_save, post_delete], sender=FillInBlank)
+@receiver([post_save, post_delete], sender=FillInBlankSentence)
+@receiver([post_save, post_delete], sender=Information)
+@receiver([post_save, post_delete], sender=QuizSectionIndex)
+def quiz_content_changed(sender, **kwargs):
+    snapshot_cache.bump_version()
+    transaction.on_commit(snapshot_cache.bump_version)
@@ -1,13 +1,33 @@
+import asyncio
 import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
 from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from app_streaming.consumers import get_section
+from app_streaming.consumers import get_section, get_answer_key
 from app_quiz.models import Quiz, MultipleChoice, MultipleChoiceOptions, FillInBlank, FillInBlankSentence, Information, \
-    Attempt
-from django.test import TestCase, AsyncClient
+    Attempt, PointsAwarded
+from django.core.management import call_command
+from django.db import transaction
+from django.http import Http404
+from django.test import TestCase, TransactionTestCase, AsyncClient, override_settings
+from channels.exceptions import ChannelFull
 from channels.testing import WebsocketCommunicator
-from app_streaming.consumers import QuizConsumer
+from app_streaming.consumers import QuizConsumer, AsyncQuizConsumer, NotificationConsumer
+from app_streaming.cache import QuizSnapshotCache, snapshot_cache
+from app_streaming.buffer import AttemptWriteBuffer
+from app_streaming.layers import SQLiteChannelLayer
+from app_streaming.dispatch import NotificationDispatcher
+from app_quiz.models import MultipleChoiceResponse, FillInBlankAnswer
+from app_user.models import Notification
+from django.contrib.auth.models import AnonymousUser
+
+
+# Tests use a cache of their own, not the shared one a dev server may be using
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 
 class GetSectionTest(TestCase):
@@ -51,7 +71,164 @@ class GetSectionTest(TestCase):
         self.assertEqual(section['section_type'], 'end')
 
 
+class QuizSnapshotCacheTest(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+
+        self.quiz = Quiz.objects.create(name='Test Quiz')
+        self.mcq = MultipleChoice.objects.create(quiz=self.quiz, title='MCQ Question', position=1, points=10)
+        MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 1', correct=True)
+
+    # Test a warm cache answers without any queries
+    def test_warm_cache_no_queries(self):
+        get_section(self.quiz.id, 1)
+
+        with self.assertNumQueries(0):
+            section = get_section(self.quiz.id, 1)
+            get_section(self.quiz.id, 2)
+
+        self.assertEqual(section['section_type'], 'mcq')
+
+    # Test editing quiz content invalidates the snapshot
+    def test_edit_invalidates(self):
+        self.assertEqual(len(get_section(self.quiz.id, 1)['section']['options']), 1)
+
+        MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 2', correct=False)
+
+        self.assertEqual(len(get_section(self.quiz.id, 1)['section']['options']), 2)
+
+        self.mcq.delete()
+
+        self.assertEqual(get_section(self.quiz.id, 1)['section_type'], 'end')
+
+    # Test a snapshot read before an edit commits is dropped once it does
+    def test_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 2', correct=False)
+            get_section(self.quiz.id, 1)
+            self.assertIsNotNone(snapshot_cache.peek(self.quiz.id))
+
+        self.assertIsNone(snapshot_cache.peek(self.quiz.id))
+
+    # Test snapshots are read again once they're too old, for edits made by
+    # other processes
+    def test_max_age(self):
+        get_section(self.quiz.id, 1)
+        self.assertIsNotNone(snapshot_cache.peek(self.quiz.id))
+
+        with patch('app_streaming.cache.SNAPSHOT_MAX_AGE', 0):
+            self.assertIsNone(snapshot_cache.peek(self.quiz.id))
+
+    # Test least recently used quiz is evicted
+    def test_lru_eviction(self):
+        cache = QuizSnapshotCache(size=1)
+        other = Quiz.objects.create(name='Other Quiz')
+
+        cache.get(self.quiz.id)
+        cache.get(other.id)
+
+        self.assertIsNone(cache.peek(self.quiz.id))
+        self.assertIsNotNone(cache.peek(other.id))
+
+
+class AnswerKeyTest(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+
+        self.quiz = Quiz.objects.create(name='Test Quiz')
+        self.mcq = MultipleChoice.objects.create(quiz=self.quiz, title='MCQ Question', position=1, points=10)
+        self.right = MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 1', correct=True)
+        self.wrong = MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 2', correct=False)
+
+        self.fib = FillInBlank.objects.create(quiz=self.quiz, title='FIB Question', position=2)
+        self.sentence = FillInBlankSentence.objects.create(question=self.fib, before='Before', blank='Blank',
+                                                           after='After', points=5)
+
+    # Test grading from a loaded key needs no queries
+    def test_grading_no_queries(self):
+        answer_key = get_answer_key(self.quiz.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(answer_key.option(self.right.id), (True, 10))
+            self.assertEqual(answer_key.option(self.wrong.id), (False, 10))
+            self.assertEqual(answer_key.sentence(self.sentence.id), ('blank', 5))
+
+    # Test options added after the key was loaded fall back to the database
+    def test_miss_falls_back(self):
+        answer_key = get_answer_key(self.quiz.id)
+        option = MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 3', correct=True)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(answer_key.option(option.id), (True, 10))
+
+    # Test options and sentences from another quiz aren't found
+    def test_other_quiz_not_found(self):
+        other = Quiz.objects.create(name='Other Quiz')
+        mcq = MultipleChoice.objects.create(quiz=other, title='Other MCQ', position=1, points=3)
+        option = MultipleChoiceOptions.objects.create(question=mcq, text='Option', correct=True)
+        fib = FillInBlank.objects.create(quiz=other, title='Other FIB', position=2)
+        sentence = FillInBlankSentence.objects.create(question=fib, before='Before', blank='Blank',
+                                                      after='After', points=5)
+
+        answer_key = get_answer_key(self.quiz.id)
+
+        with self.assertRaises(Http404):
+            answer_key.option(option.id)
+
+        with self.assertRaises(Http404):
+            answer_key.sentence(sentence.id)
+
+
+class AttemptWriteBufferTest(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='testuser', password='testpassword')
+        self.quiz = Quiz.objects.create(name='Test Quiz')
+        self.attempt = Attempt.objects.create(user=self.user, quiz=self.quiz)
+
+        mcq = MultipleChoice.objects.create(quiz=self.quiz, title='MCQ Question', position=1, points=10)
+        self.option = MultipleChoiceOptions.objects.create(question=mcq, text='Option 1', correct=True)
+
+        fib = FillInBlank.objects.create(quiz=self.quiz, title='FIB Question', position=2)
+        self.sentence = FillInBlankSentence.objects.create(question=fib, before='Before', blank='Blank',
+                                                           after='After', points=5)
+
+    # Test nothing is written until the buffer is flushed, then all of it is
+    def test_flush(self):
+        buffer = AttemptWriteBuffer(self.attempt, self.user)
+        buffer.add_mcq(self.option.id, 10)
+        buffer.add_fib([(self.sentence.id, 'blank', 5), (self.sentence.id, 'wrong', 0)])
+
+        self.assertEqual(PointsAwarded.objects.count(), 0)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(PointsAwarded.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(MultipleChoiceResponse.objects.get(attempt=self.attempt).points_awarded.points, 10)
+        self.assertEqual(sorted(FillInBlankAnswer.objects.values_list('points_awarded__points', flat=True)),
+                         [0, 5])
+
+    # Test the buffer is due after enough answers or enough time
+    def test_due(self):
+        buffer = AttemptWriteBuffer(self.attempt, self.user)
+        self.assertFalse(buffer.due())
+
+        buffer.add_mcq(self.option.id, 10)
+        self.assertFalse(buffer.due())
+
+        buffer.oldest -= 3600
+        self.assertTrue(buffer.due())
+
+        buffer.flush()
+        for _ in range(10):
+            buffer.add_mcq(self.option.id, 10)
+        self.assertTrue(buffer.due())
+
+
 class QuizConsumerTest(TestCase):
+    consumer_class = QuizConsumer
 
     # Create user asynchronously
     @database_sync_to_async
@@ -64,6 +241,16 @@ class QuizConsumerTest(TestCase):
 
         return Quiz.objects.create(name='Test Quiz')
 
+    # Add a question of each type to the quiz asynchronously
+    @database_sync_to_async
+    def create_sections(self):
+        self.mcq = MultipleChoice.objects.create(quiz=self.quiz, title='MCQ Question', position=1, points=10)
+        self.option = MultipleChoiceOptions.objects.create(question=self.mcq, text='Option 1', correct=True)
+
+        fib = FillInBlank.objects.create(quiz=self.quiz, title='FIB Question', position=2)
+        self.sentence = FillInBlankSentence.objects.create(question=fib, before='Before', blank='Blank',
+                                                           after='After', points=5)
+
     # Connect to the websocket
     async def connect(self):
 
@@ -75,7 +262,7 @@ class QuizConsumerTest(TestCase):
 
         await sync_to_async(self.client.login)(username='testuser', password='testpassword')
 
-        self.communicator = WebsocketCommunicator(QuizConsumer.as_asgi(), "/ws/quiz/")
+        self.communicator = WebsocketCommunicator(self.consumer_class.as_asgi(), "/ws/quiz/")
 
         self.communicator.scope['user'] = self.user
 
@@ -109,3 +296,347 @@ class QuizConsumerTest(TestCase):
         self.assertEqual(data, {"type": "first_section", "section_type": "end", "section": {}})
 
         await self.communicator.disconnect()
+
+    # Test answering questions over the websocket
+    async def test_answer(self):
+        await self.connect()
+        await self.create_sections()
+
+        await self.communicator.send_to(json.dumps({"type": "start", "qid": self.quiz.id}))
+        _ = await self.communicator.receive_from()
+
+        await self.communicator.send_to(json.dumps({"type": "answer", "section_type": "mcq",
+                                                    "question_id": self.mcq.id,
+                                                    "selected_id": str(self.option.id)}))
+        data = json.loads(await self.communicator.receive_from())
+        self.assertEqual(data, {"type": "validated_mcq_answer", "correct": True, "awarded": 10})
+
+        await self.communicator.send_to(json.dumps({"type": "answer", "section_type": "fib",
+                                                    "sentences": [{"id": self.sentence.id,
+                                                                   "blank": "BLANK"}]}))
+        data = json.loads(await self.communicator.receive_from())
+        self.assertEqual(data, {"type": "validated_fib_answer", "correct": [self.sentence.id],
+                                "awarded": 5})
+
+        await self.communicator.disconnect()
+
+        total = await database_sync_to_async(
+            lambda: sum(PointsAwarded.objects.filter(user=self.user).values_list('points', flat=True)))()
+        self.assertEqual(total, 15)
+
+
+    # Test buffered answers are written once they have waited long enough,
+    # without the client sending anything else
+    async def test_timed_flush(self):
+        await self.connect()
+        await self.create_sections()
+
+        await self.communicator.send_to(json.dumps({"type": "start", "qid": self.quiz.id}))
+        _ = await self.communicator.receive_from()
+
+        with patch('app_streaming.buffer.WRITE_BUFFER_SECONDS', 0.1):
+            await self.communicator.send_to(json.dumps({"type": "answer", "section_type": "mcq",
+                                                        "question_id": self.mcq.id,
+                                                        "selected_id": str(self.option.id)}))
+            _ = await self.communicator.receive_from()
+            await asyncio.sleep(0.5)
+
+        count = await database_sync_to_async(PointsAwarded.objects.filter(user=self.user).count)()
+        self.assertEqual(count, 1)
+
+        await self.communicator.disconnect()
+
+
+# Runs the same protocol tests against the async consumer
+class AsyncQuizConsumerTest(QuizConsumerTest):
+    consumer_class = AsyncQuizConsumer
+
+    # Test a warm quiz is answered without going through the thread pool
+    async def test_cached_next(self):
+        await self.connect()
+        await self.create_sections()
+
+        await self.communicator.send_to(json.dumps({"type": "start", "qid": self.quiz.id}))
+        _ = await self.communicator.receive_from()
+
+        with patch('app_streaming.consumers.database_sync_to_async') as offload:
+            await self.communicator.send_to(json.dumps({"type": "next", "qid": self.quiz.id,
+                                                        "position": 1}))
+            data = json.loads(await self.communicator.receive_from())
+
+            await self.communicator.send_to(json.dumps({"type": "answer", "section_type": "mcq",
+                                                        "question_id": self.mcq.id,
+                                                        "selected_id": str(self.option.id)}))
+            _ = await self.communicator.receive_from()
+
+            offload.assert_not_called()
+
+        self.assertEqual(data["type"], "next_section")
+        self.assertEqual(data["section_type"], "fib")
+
+        await self.communicator.disconnect()
+
+
+# Creates a notification and runs its on-commit push, which the test case's
+# transaction would otherwise hold back.
+@database_sync_to_async
+def create_notification(test, user, message):
+    with test.captureOnCommitCallbacks(execute=True):
+        return Notification.objects.create(user=user, message=message)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NotificationConsumerTest(TestCase):
+    @database_sync_to_async
+    def create_user(self, username):
+        return get_user_model().objects.create_user(username=username, password='testpassword')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), "/ws/notify/")
+        communicator.scope['user'] = user
+
+        connected, _ = await communicator.connect()
+
+        return connected, communicator
+
+    # Test a notification only reaches its own user's sockets
+    async def test_only_target_receives(self):
+        user1 = await self.create_user('user1')
+        user2 = await self.create_user('user2')
+        _, communicator1 = await self.connect(user1)
+        _, communicator2 = await self.connect(user2)
+
+        notification = await create_notification(self, user1, 'Hello')
+
+        data = json.loads(await communicator1.receive_from())
+        self.assertEqual(data, {"message": "Hello", "id": notification.id, "target": user1.id})
+        self.assertTrue(await communicator2.receive_nothing())
+
+        await communicator1.disconnect()
+        await communicator2.disconnect()
+
+    # Test logged out sockets are refused
+    async def test_anonymous_rejected(self):
+        connected, _ = await self.connect(AnonymousUser())
+
+        self.assertFalse(connected)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SQLiteChannelLayerTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'channels.sqlite3')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Each layer stands in for a separate worker process
+    def layer(self, **kwargs):
+        return SQLiteChannelLayer(path=self.path, **kwargs)
+
+    # Test messages and group sends reach a channel held by another layer
+    async def test_between_layers(self):
+        sender = self.layer()
+        receiver = self.layer()
+        channel = await receiver.new_channel()
+
+        await sender.send(channel, {"type": "direct"})
+        self.assertEqual(await asyncio.wait_for(receiver.receive(channel), 5), {"type": "direct"})
+
+        await receiver.group_add("group", channel)
+        await sender.group_send("group", {"type": "group", "value": 1})
+        self.assertEqual(await asyncio.wait_for(receiver.receive(channel), 5),
+                         {"type": "group", "value": 1})
+
+        await receiver.group_discard("group", channel)
+        await sender.group_send("group", {"type": "group", "value": 2})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(receiver.receive(channel), 0.2)
+
+    # Test a full channel refuses sends and is skipped by group sends
+    async def test_capacity(self):
+        layer = self.layer(capacity=2)
+        channel = await layer.new_channel()
+        await layer.group_add("group", channel)
+
+        await layer.send(channel, {"type": "message", "n": 1})
+        await layer.group_send("group", {"type": "message", "n": 2})
+
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {"type": "message", "n": 3})
+        await layer.group_send("group", {"type": "message", "n": 4})
+
+        self.assertEqual((await layer.receive(channel))["n"], 1)
+        self.assertEqual((await layer.receive(channel))["n"], 2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.2)
+
+    # Test expired messages are dropped along with their channel's groups
+    async def test_expiry(self):
+        layer = self.layer(expiry=0.05, cleanup_interval=0)
+        channel = await layer.new_channel()
+        await layer.group_add("group", channel)
+
+        await layer.send(channel, {"type": "message"})
+        await asyncio.sleep(0.1)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.2)
+
+        await layer.group_send("group", {"type": "message"})
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.2)
+
+    # Test notifications are delivered through the SQLite layer
+    async def test_notification_consumer(self):
+        layers = {'default': {'BACKEND': 'app_streaming.layers.SQLiteChannelLayer',
+                              'CONFIG': {'path': self.path}}}
+
+        with override_settings(CHANNEL_LAYERS=layers):
+            user = await database_sync_to_async(get_user_model().objects.create_user)(
+                username='testuser', password='testpassword')
+            communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), "/ws/notify/")
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await create_notification(self, user, 'Hello')
+
+            data = json.loads(await communicator.receive_from(timeout=5))
+            self.assertEqual(data['message'], 'Hello')
+
+            await communicator.disconnect()
+
+
+# Records group sends instead of delivering them.
+class StubLayer:
+    def __init__(self, error=None):
+        self.sends = []
+        self.error = error
+
+    async def group_send(self, group, message):
+        if self.error is not None:
+            raise self.error
+
+        self.sends.append((group, message))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NotificationDispatcherTest(TestCase):
+    def dispatch(self, layer, messages, delay=0.05):
+        dispatcher = NotificationDispatcher(delay=delay)
+
+        with patch('app_streaming.dispatch.get_channel_layer', return_value=layer):
+            for group, message in messages:
+                dispatcher.enqueue(group, message)
+
+            self.assertTrue(dispatcher.wait_idle(5))
+
+        return dispatcher
+
+    # Test a burst for one recipient goes out as a single group send
+    def test_coalesces_per_group(self):
+        layer = StubLayer()
+        messages = [('a', {'type': 'send_notification', 'id': i}) for i in range(3)]
+        messages.append(('b', {'type': 'send_notification', 'id': 3}))
+
+        stats = self.dispatch(layer, messages).stats()
+
+        sends = dict(layer.sends)
+        self.assertEqual(sends['a'], {'type': 'send_notifications',
+                                      'notifications': [message for _, message in messages[:3]]})
+        self.assertEqual(sends['b'], messages[3][1])
+        self.assertEqual((stats['queue_depth'], stats['sent'], stats['group_sends'], stats['coalesced']),
+                         (0, 4, 2, 2))
+        self.assertIsNotNone(stats['latency_ms']['p95'])
+
+    # Test failed sends are counted rather than raised
+    def test_errors(self):
+        stats = self.dispatch(StubLayer(error=RuntimeError('down')),
+                              [('a', {'type': 'send_notification'})]).stats()
+
+        self.assertEqual((stats['sent'], stats['errors']), (0, 1))
+        self.assertIn('down', stats['last_error'])
+
+    # Test notifications are only queued once their transaction commits
+    def test_rolled_back_not_queued(self):
+        user = get_user_model().objects.create_user(username='testuser', password='testpassword')
+
+        with patch('app_streaming.signals.dispatcher') as dispatcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        Notification.objects.create(user=user, message='Rolled back')
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+
+            dispatcher.enqueue.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.create(user=user, message='Committed')
+
+            dispatcher.enqueue.assert_called_once()
+
+
+class LoadTestCommandTest(TestCase):
+
+    def setUp(self):
+        snapshot_cache.clear()
+
+        self.quiz = Quiz.objects.create(name='Test Quiz')
+        mcq = MultipleChoice.objects.create(quiz=self.quiz, title='MCQ Question', position=1, points=10)
+        MultipleChoiceOptions.objects.create(question=mcq, text='Option 1', correct=True)
+        Information.objects.create(quiz=self.quiz, title='Information', content='Content', position=2)
+
+    # Test the quiz scenario runs every client through the quiz
+    def test_quiz_scenario(self):
+        out = StringIO()
+        call_command('loadtest_ws', clients=2, quiz=self.quiz.id, keep=True, stdout=out)
+        report = json.loads(out.getvalue())
+
+        # start, answer, next, next for each client
+        self.assertEqual(report['messages'], 8)
+        self.assertEqual(report['latency']['answer']['count'], 2)
+        self.assertEqual(report['latency']['next']['count'], 4)
+        self.assertIn('queries_per_message', report)
+        self.assertIn('peak_rss_kb', report)
+        self.assertEqual(Attempt.objects.filter(completed=True).count(), 2)
+
+    # Test the users a run creates, and their attempts, are deleted afterwards
+    def test_cleans_up(self):
+        call_command('loadtest_ws', clients=2, quiz=self.quiz.id, stdout=StringIO())
+
+        self.assertFalse(get_user_model().objects.filter(username__startswith='loadtest-').exists())
+        self.assertFalse(Attempt.objects.exists())
+        self.assertFalse(PointsAwarded.objects.exists())
+
+    # Test the channel layer benchmark covers both layers
+    def test_bench_channel_layer(self):
+        out = StringIO()
+        call_command('bench_channel_layer', messages=20, group_size=3, group_messages=2,
+                     round_trips=3, stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(set(report), {'memory', 'sqlite'})
+        self.assertEqual(report['sqlite']['cross_process']['round_trips'], 3)
+
+
+# Notifications are only pushed on commit, so this needs real transactions
+@override_settings(CACHES=TEST_CACHES)
+class LoadTestNotifyCommandTest(TransactionTestCase):
+
+    # Test the notification scenario delivers one notification per client
+    def test_notify_scenario(self):
+        out = StringIO()
+        call_command('loadtest_ws', scenario='notify', clients=2, idle=3, stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['latency']['notification']['count'], 2)
+        self.assertEqual(report['idle_clients'], 3)
+        # Idle sockets receive nothing, each notification is one frame
+        self.assertEqual(report['frames_per_notification'], 1)
+        self.assertEqual(report['dispatcher']['queue_depth'], 0)
+        self.assertFalse(get_user_model().objects.filter(username__startswith='loadtest-').exists())
+        self.assertFalse(Notification.objects.exists())
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+from .mortgage import calculate, MortgageError
+
+
+# MortgageForm inputs the calculators understand, in the order they're sent.
+CALCULATOR_INPUTS = ["loan_amount", "home_value", "downpayment", "interest_rate", "duration_years",
+                     "monthly_hoa", "annual_property_tax", "annual_home_insurance"]
+
+
+# Raised when an external calculator can't be reached or gives no answer.
+class CalculatorUnavailable(MortgageError):
+    pass
+
+
+# Works out monthly and annual payments and total interest from the
+# MortgageForm inputs, in the shape app_tools.mortgage.calculate returns.
+class CalculatorBackend:
+    def __init__(self, **options):
+        pass
+
+    def calculate(self, **inputs):
+        raise NotImplementedError
+
+
+# Works everything out in process, with no network calls.
+class LocalBackend(CalculatorBackend):
+    def calculate(self, **inputs):
+        return calculate(**inputs)
+
+
+# Inputs with the empty ones left out and numbers in one canonical form, so
+# the same mortgage entered two ways is one cache entry and one request.
+def normalise(inputs):
+    return tuple((name, "%.15g" % float(inputs[name])) for name in CALCULATOR_INPUTS
+                 if inputs.get(name) not in (None, ""))
+
+
+# Calls an api-ninjas style mortgage calculator over HTTP. Connections are
+# kept in a pooled session, every call has connect and read timeouts, and
+# results are kept in an LRU cache for `cache_seconds`. Concurrent calls for
+# the same inputs share a single request.
+class HTTPCalculatorBackend(CalculatorBackend):
+    def __init__(self, url, api_key="", connect_timeout=3.05, read_timeout=10, pool_size=10,
+                 cache_size=1024, cache_seconds=3600, **options):
+        if not url:
+            raise ImproperlyConfigured("HTTPCalculatorBackend needs a url")
+
+        self.url = url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache_size = cache_size
+        self.cache_seconds = cache_seconds
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cache = OrderedDict()  # inputs -> (time stored, result)
+        self._in_flight = {}  # inputs -> Future
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.requests = 0
+        self.errors = 0
+
+    def calculate(self, **inputs):
+        key = normalise(inputs)
+
+        with self._lock:
+            cached = self._cache.get(key)
+
+            if cached is not None and time.monotonic() - cached[0] < self.cache_seconds:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+
+            self.misses += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Waits no longer than the leader's request can take
+            try:
+                return future.result(timeout=sum(self.timeout) + 1)
+            except TimeoutError as error:
+                raise CalculatorUnavailable("The mortgage calculator didn't answer in time") from error
+
+        try:
+            result = self._fetch(key)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            self._store(key, result)
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _fetch(self, params):
+        with self._lock:
+            self.requests += 1
+
+        try:
+            response = self.session.get(self.url, params=params, timeout=self.timeout,
+                                        headers={"X-Api-Key": self.api_key})
+        except requests.RequestException as error:
+            with self._lock:
+                self.errors += 1
+            raise CalculatorUnavailable("The mortgage calculator couldn't be reached") from error
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+
+        if response.status_code != requests.codes.ok or not isinstance(body, dict):
+            with self._lock:
+                self.errors += 1
+
+            if response.status_code == requests.codes.ok:
+                raise CalculatorUnavailable("The mortgage calculator gave an answer that couldn't be read")
+
+            message = body.get("error") if isinstance(body, dict) else None
+            raise CalculatorUnavailable(message or "The mortgage calculator returned %d"
+                                        % response.status_code)
+
+        return body
+
+    def _store(self, key, result):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), result)
+            self._cache.move_to_end(key)
+
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                    "requests": self.requests, "errors": self.errors, "cached": len(self._cache)}
+
+    def close(self):
+        self.session.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# The calculator set in MORTGAGE_CALCULATOR, made once per process so its
+# connection pool and cache are shared by every request.
+def get_backend():
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, "MORTGAGE_CALCULATOR", {})
+                backend = import_string(config.get("BACKEND", "app_tools.backends.LocalBackend"))
+                _backend = backend(**config.get("OPTIONS", {}))
+
+    return _backend
+
+
+# Drops the calculator so the next use makes it again from the settings.
+def reset_backend():
+    global _backend
+
+    with _backend_lock:
+        _backend = None
@@ -0,0 +1,41 @@
+from .mortgage import schedule_chunks
+
+
+SCHEDULE_COLUMNS = ["month", "payment", "interest", "principal", "balance"]
+
+CSV_ROW = "%d,%.2f,%.2f,%.2f,%.2f\r\n"
+NDJSON_ROW = ('{"month": %d, "payment": %.2f, "interest": %.2f, '
+              '"principal": %.2f, "balance": %.2f}\n')
+
+
+def _rows(chunk):
+    return zip(*(chunk[column].tolist() for column in SCHEDULE_COLUMNS))
+
+
+# A schedule as CSV, one string per chunk of months.
+def csv_schedule(principal, interest_rate, months):
+    yield ",".join(SCHEDULE_COLUMNS) + "\r\n"
+
+    for chunk in schedule_chunks(principal, interest_rate, months):
+        yield "".join(CSV_ROW % row for row in _rows(chunk))
+
+
+# A schedule as newline delimited JSON, one object per month.
+def ndjson_schedule(principal, interest_rate, months):
+    for chunk in schedule_chunks(principal, interest_rate, months):
+        yield "".join(NDJSON_ROW % row for row in _rows(chunk))
+
+
+# Content type and row generator for each ?format=.
+SCHEDULE_FORMATS = {
+    "csv": ("text/csv", csv_schedule),
+    "ndjson": ("application/x-ndjson", ndjson_schedule),
+}
+
+
+# Hands a generator's strings to an ASGI server one at a time. Django reads
+# a sync iterator into a list before serving it over ASGI, which would hold
+# the whole schedule in memory.
+async def stream(strings):
+    for string in strings:
+        yield string
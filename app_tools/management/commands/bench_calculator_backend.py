@@ -0,0 +1,80 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.management.base import BaseCommand
+
+from app_streaming.dispatch import percentile
+from app_tools.backends import HTTPCalculatorBackend, normalise
+from app_tools.stub_server import StubCalculatorServer
+
+
+class Command(BaseCommand):
+    """Django command to benchmark HTTPCalculatorBackend against a new
+    connection per call, both talking to the local stub calculator."""
+
+    help = 'Benchmark the pooled, cached mortgage calculator client against the stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=2000, help='Calculations asked for')
+        parser.add_argument('--distinct', type=int, default=50,
+                            help='Different mortgages among the calls')
+        parser.add_argument('--concurrency', type=int, default=50, help='Threads making calls')
+        parser.add_argument('--latency', type=float, default=20,
+                            help='Milliseconds the stub takes to answer')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        mortgages = [{'loan_amount': 100000 + 5000 * i, 'interest_rate': 3.5, 'duration_years': 25}
+                     for i in range(max(options['distinct'], 1))]
+        random.seed(0)
+        calls = [random.choice(mortgages) for _ in range(options['calls'])]
+
+        with StubCalculatorServer(delay=options['latency'] / 1000) as stub:
+            def unpooled(inputs):
+                return requests.get(stub.url, params=normalise(inputs), timeout=(3.05, 10)).json()
+
+            report = {'calls': len(calls), 'distinct': len(mortgages),
+                      'concurrency': options['concurrency'], 'latency_ms': options['latency']}
+
+            stub.requests = 0
+            report['unpooled'] = self.run(unpooled, calls, options['concurrency'])
+            report['unpooled']['server_requests'] = stub.requests
+
+            # Pooled connections and coalescing alone, then with the cache too
+            for name, cache_seconds in (('backend_uncached', 0), ('backend', 3600)):
+                backend = HTTPCalculatorBackend(url=stub.url, pool_size=options['concurrency'],
+                                                cache_seconds=cache_seconds)
+                stub.requests = 0
+                report[name] = self.run(lambda inputs: backend.calculate(**inputs), calls,
+                                        options['concurrency'])
+                report[name]['server_requests'] = stub.requests
+                report[name]['stats'] = backend.stats()
+                backend.close()
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as f:
+                f.write(output + '\n')
+
+        self.stdout.write(output)
+
+    def run(self, calculate, calls, concurrency):
+        def timed(inputs):
+            start = time.perf_counter()
+            calculate(inputs)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+            latencies = sorted(pool.map(timed, calls))
+        duration = time.perf_counter() - start
+
+        return {'duration_s': round(duration, 3),
+                'calls_per_s': round(len(calls) / duration, 1),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3)}
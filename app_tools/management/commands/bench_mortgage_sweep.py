@@ -0,0 +1,84 @@
+import json
+import math
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from app_tools.mortgage import sweep, MONTHS_PER_YEAR
+
+
+# The same grid worked out one loan at a time, for comparison.
+def sweep_loop(home_value, rates, years, deposits):
+    payments = []
+
+    for rate in rates:
+        for term in years:
+            for deposit in deposits:
+                principal = home_value - deposit
+                months = round(term * MONTHS_PER_YEAR)
+                monthly = rate / 100 / MONTHS_PER_YEAR
+
+                if monthly == 0:
+                    payments.append(principal / months)
+                else:
+                    growth = math.pow(1 + monthly, months)
+                    payments.append(principal * monthly * growth / (growth - 1))
+
+    return payments
+
+
+class Command(BaseCommand):
+    """Django command to time the vectorised mortgage sweep against a loop."""
+
+    help = 'Benchmark the mortgage sweep grid against working out each loan in turn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rates', type=int, default=100, help='Interest rates in the grid')
+        parser.add_argument('--terms', type=int, default=40, help='Terms in the grid')
+        parser.add_argument('--deposits', type=int, default=25, help='Deposits in the grid')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each, the best is kept')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        home_value = 400000
+        rates = np.linspace(0, 10, options['rates'])
+        years = np.arange(1, options['terms'] + 1, dtype=float)
+        deposits = np.linspace(0, home_value * 0.5, options['deposits'])
+        repeat = max(options['repeat'], 1)
+
+        vectorised = self.best(lambda: sweep(home_value, rates, years, deposits), repeat)
+        loop = self.best(lambda: sweep_loop(home_value, rates.tolist(), years.tolist(),
+                                            deposits.tolist()), repeat)
+
+        payments, interest = sweep(home_value, rates, years, deposits)
+        serialise = self.best(lambda: json.dumps({'monthly_payment': payments.round(2).tolist(),
+                                                  'total_interest': interest.round(2).tolist()}),
+                              repeat)
+
+        expected = sweep_loop(home_value, rates.tolist(), years.tolist(), deposits.tolist())
+        report = {'cells': payments.size,
+                  'vectorised_ms': round(vectorised * 1000, 3),
+                  'loop_ms': round(loop * 1000, 3),
+                  'speedup': round(loop / vectorised, 1),
+                  'serialise_ms': round(serialise * 1000, 3),
+                  'max_difference': float(np.abs(payments.ravel() - np.array(expected)).max())}
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as f:
+                f.write(output + '\n')
+
+        self.stdout.write(output)
+
+    def best(self, function, repeat):
+        times = []
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+
+        return min(times)
@@ -0,0 +1,72 @@
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from app_tools.pension import project, contributions
+
+
+# The same simulation one path and one year at a time, for comparison.
+def project_loop(paths, pot, yearly, mean_return, volatility, seed):
+    rng = np.random.default_rng(seed)
+    sigma = np.log(1 + (volatility / 100) ** 2 / (1 + mean_return / 100) ** 2) ** 0.5
+    mu = np.log(1 + mean_return / 100) - sigma ** 2 / 2
+    finals = []
+
+    for _ in range(paths):
+        value = pot
+        for amount in yearly:
+            value = (value + amount) * np.exp(rng.normal(mu, sigma))
+        finals.append(value)
+
+    return finals
+
+
+class Command(BaseCommand):
+    """Django command to measure pension projection paths per second."""
+
+    help = 'Benchmark the pension projection with 1 or more processes against a plain loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', type=int, default=100000, help='Paths simulated')
+        parser.add_argument('--years', type=int, default=45, help='Years to retirement')
+        parser.add_argument('--workers', default='1,2,4',
+                            help='Comma separated process counts to try')
+        parser.add_argument('--loop-paths', type=int, default=2000,
+                            help='Paths simulated by the plain loop')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        inputs = {'current_age': 22, 'retirement_age': 22 + options['years'], 'salary': 30000,
+                  'pot': 0, 'paths': options['paths'], 'seed': 0}
+        report = {'paths': options['paths'], 'years': options['years'], 'vectorised': {}}
+        medians = set()
+
+        for workers in [int(workers) for workers in options['workers'].split(',')]:
+            start = time.perf_counter()
+            results = project(**inputs, workers=workers)
+            duration = time.perf_counter() - start
+
+            medians.add(results['final']['50'])
+            report['vectorised'][workers] = {'duration_s': round(duration, 3),
+                                             'paths_per_s': round(options['paths'] / duration, 1)}
+
+        # Same seed, so the answer mustn't depend on how the work was shared
+        report['same_results'] = len(medians) == 1
+
+        yearly = contributions(30000, options['years'], 5, 3, 2)
+        start = time.perf_counter()
+        project_loop(options['loop_paths'], 0, yearly, 5, 12, 0)
+        duration = time.perf_counter() - start
+        report['loop'] = {'paths': options['loop_paths'], 'duration_s': round(duration, 3),
+                          'paths_per_s': round(options['loop_paths'] / duration, 1)}
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as f:
+                f.write(output + '\n')
+
+        self.stdout.write(output)
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+import tracemalloc
+from urllib.parse import urlencode
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from app_streaming.dispatch import percentile
+
+
+class Command(BaseCommand):
+    """Django command to benchmark many concurrent mortgage schedule downloads
+    through the ASGI handler, as daphne would serve them."""
+
+    help = 'Benchmark concurrent streaming downloads of the mortgage schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--downloads', type=int, default=2000,
+                            help='Downloads in total')
+        parser.add_argument('--concurrency', type=int, default=1000,
+                            help='Downloads in progress at once')
+        parser.add_argument('--years', type=int, default=40,
+                            help='Term of the loan downloaded')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--host', default='localhost',
+                            help='Host header sent, which must be allowed')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        application = get_asgi_application()
+        query = urlencode({'loan_amount': 250000, 'interest_rate': 4.5,
+                           'duration_years': options['years'], 'format': options['format']})
+        concurrency = max(options['concurrency'], 1)
+
+        report = {'years': options['years'], 'format': options['format'],
+                  'concurrency': concurrency}
+        report['throughput'] = asyncio.run(self.run(application, query, options['downloads'],
+                                                    concurrency, options['host']))
+
+        # Memory is traced separately as tracing slows everything down. With
+        # every download in progress at once, the peak shows how much each
+        # one holds.
+        tracemalloc.start()
+        try:
+            memory = asyncio.run(self.run(application, query, concurrency, concurrency,
+                                          options['host']))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        report['memory'] = {'downloads': concurrency,
+                            'peak_kb': round(peak / 1024, 1),
+                            'peak_kb_per_download': round(peak / 1024 / concurrency, 2),
+                            'body_kb_per_download': memory['body_kb']}
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as f:
+                f.write(output + '\n')
+
+        self.stdout.write(output)
+
+    async def run(self, application, query, downloads, concurrency, host):
+        limit = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with limit:
+                return await self.download(application, query, host)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[limited() for _ in range(downloads)])
+        duration = time.perf_counter() - start
+
+        failed = [status for status, *_ in results if status != 200]
+        if failed:
+            raise CommandError('%d downloads failed, first with status %s' % (len(failed), failed[0]))
+
+        first_byte = sorted(result[1] for result in results)
+        total = sorted(result[2] for result in results)
+
+        return {'downloads': downloads,
+                'duration_s': round(duration, 3),
+                'downloads_per_s': round(downloads / duration, 1),
+                'body_kb': round(results[0][3] / 1024, 1),
+                'body_messages': results[0][4],
+                'first_byte_ms': {'p50': round(percentile(first_byte, 50) * 1000, 3),
+                                  'p95': round(percentile(first_byte, 95) * 1000, 3)},
+                'complete_ms': {'p50': round(percentile(total, 50) * 1000, 3),
+                                'p95': round(percentile(total, 95) * 1000, 3)}}
+
+    # One GET through the ASGI application. Returns the status, time to the
+    # first body bytes and to the end, the body size and how many messages
+    # it came in.
+    async def download(self, application, query, host):
+        path = reverse('mortgage-schedule')
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                 'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+                 'query_string': query.encode(), 'root_path': '',
+                 'headers': [(b'host', host.encode())],
+                 'client': ('127.0.0.1', 50000), 'server': (host, 80)}
+        requested = False
+        finished = asyncio.Event()
+        result = {'status': None, 'first': None, 'size': 0, 'messages': 0}
+
+        async def receive():
+            nonlocal requested
+
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                result['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                if message.get('body'):
+                    if result['first'] is None:
+                        result['first'] = time.perf_counter()
+                    result['size'] += len(message['body'])
+                    result['messages'] += 1
+
+        start = time.perf_counter()
+        await application(scope, receive, send)
+        end = time.perf_counter()
+        finished.set()
+
+        return (result['status'], (result['first'] or end) - start, end - start,
+                result['size'], result['messages'])
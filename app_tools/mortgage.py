@@ -0,0 +1,211 @@
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+from django.conf import settings
+
+
+MONTHS_PER_YEAR = 12
+
+# Used when no duration is given, as the api-ninjas calculator did.
+DEFAULT_DURATION_YEARS = 30
+
+# Longest term and highest interest rate a mortgage is worked out for.
+# Beyond these the schedule gets needlessly long and the payment overflows.
+MAX_DURATION_YEARS = 50
+MAX_INTEREST_RATE = 100
+
+# Months of the schedule worked out at a time when streaming it.
+SCHEDULE_CHUNK_MONTHS = 120
+
+# Most loans worked out in one sweep.
+SWEEP_MAX_CELLS = getattr(settings, "MORTGAGE_SWEEP_MAX_CELLS", 100000)
+
+
+# Raised for inputs no mortgage can be worked out from.
+class MortgageError(ValueError):
+    pass
+
+
+# Rounds half up to whole pennies, as money is shown. np.round rounds half
+# to even, so this goes through Decimal.
+def pennies(value):
+    return float(Decimal(repr(float(value))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+# The amount borrowed: the loan amount if given, otherwise the home value
+# less the downpayment.
+def loan_principal(loan_amount=None, home_value=None, downpayment=None):
+    if loan_amount:
+        principal = loan_amount
+    elif home_value:
+        principal = home_value - (downpayment or 0)
+    else:
+        raise MortgageError("Either a loan amount or a home value is needed")
+
+    if principal <= 0:
+        raise MortgageError("The amount borrowed must be more than zero")
+
+    return principal
+
+
+def loan_months(duration_years=None):
+    months = int(round((duration_years or DEFAULT_DURATION_YEARS) * MONTHS_PER_YEAR))
+
+    if months <= 0:
+        raise MortgageError("The duration must be at least a month")
+    if months > MAX_DURATION_YEARS * MONTHS_PER_YEAR:
+        raise MortgageError("The duration can't be more than %d years" % MAX_DURATION_YEARS)
+
+    return months
+
+
+# The amount borrowed and the number of months to pay it back over, from
+# the MortgageForm inputs. Other costs are accepted and ignored.
+def loan_terms(interest_rate, loan_amount=None, home_value=None, downpayment=None,
+               duration_years=None, **costs):
+    if interest_rate is None or interest_rate < 0:
+        raise MortgageError("The interest rate can't be negative")
+    if interest_rate > MAX_INTEREST_RATE:
+        raise MortgageError("The interest rate can't be more than %d%%" % MAX_INTEREST_RATE)
+
+    return loan_principal(loan_amount, home_value, downpayment), loan_months(duration_years)
+
+
+# Fixed monthly repayment for a repayment mortgage. Every argument may be a
+# NumPy array, and they broadcast against each other, so a whole grid of
+# loans is worked out at once.
+def monthly_payment(principal, interest_rate, months):
+    principal = np.asarray(principal, dtype=float)
+    rate = np.asarray(interest_rate, dtype=float) / 100 / MONTHS_PER_YEAR
+    months = np.asarray(months, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + rate) ** months
+        payment = np.where(rate == 0, principal / months,
+                           principal * rate * growth / (growth - 1))
+
+    return payment
+
+
+# Months start to stop - 1 (counting from 0) of the schedule, as arrays:
+# month number, payment, interest and principal paid and the balance left
+# afterwards. Balances come from the closed form rather than a running
+# total, so any slice can be worked out on its own and rounding never
+# accumulates.
+def _schedule(principal, interest_rate, months, payment, start, stop):
+    rate = interest_rate / 100 / MONTHS_PER_YEAR
+    month = np.arange(start, stop + 1)
+
+    if rate == 0:
+        balance = principal - payment * month
+    else:
+        growth = (1 + rate) ** month
+        balance = principal * growth - payment * (growth - 1) / rate
+
+    interest = balance[:-1] * rate
+    balance = balance[1:]
+
+    if stop == months:
+        balance[-1] = 0
+
+    return {
+        "month": month[1:],
+        "payment": np.full(stop - start, payment),
+        "interest": interest,
+        "principal": payment - interest,
+        "balance": np.maximum(balance, 0),
+    }
+
+
+# The whole schedule at once.
+def amortisation_schedule(principal, interest_rate, months):
+    payment = float(monthly_payment(principal, interest_rate, months))
+
+    return _schedule(principal, interest_rate, months, payment, 0, months)
+
+
+# The same schedule a chunk of months at a time, so however long the term
+# only one chunk is ever held in memory.
+def schedule_chunks(principal, interest_rate, months, chunk_months=SCHEDULE_CHUNK_MONTHS):
+    payment = float(monthly_payment(principal, interest_rate, months))
+
+    for start in range(0, months, chunk_months):
+        yield _schedule(principal, interest_rate, months, payment, start,
+                        min(start + chunk_months, months))
+
+
+# Monthly and annual payments and total interest for the MortgageForm
+# inputs, in the shape the api-ninjas mortgage calculator returned.
+def calculate(interest_rate, loan_amount=None, home_value=None, downpayment=None,
+              duration_years=None, monthly_hoa=None, annual_property_tax=None,
+              annual_home_insurance=None):
+    principal, months = loan_terms(interest_rate, loan_amount, home_value, downpayment,
+                                   duration_years)
+    mortgage = float(monthly_payment(principal, interest_rate, months))
+
+    hoa = monthly_hoa or 0
+    property_tax = (annual_property_tax or 0) / MONTHS_PER_YEAR
+    insurance = (annual_home_insurance or 0) / MONTHS_PER_YEAR
+    monthly_total = mortgage + hoa + property_tax + insurance
+
+    return {
+        "monthly_payment": {
+            "total": pennies(monthly_total),
+            "mortgage": pennies(mortgage),
+            "property_tax": pennies(property_tax),
+            "hoa": pennies(hoa),
+            "annual_home_ins": pennies(insurance),
+        },
+        "annual_payment": {
+            "total": pennies(monthly_total * MONTHS_PER_YEAR),
+            "mortgage": pennies(mortgage * MONTHS_PER_YEAR),
+            "property_tax": pennies(annual_property_tax or 0),
+            "hoa": pennies(hoa * MONTHS_PER_YEAR),
+            "home_insurance": pennies(annual_home_insurance or 0),
+        },
+        "total_interest_paid": pennies(mortgage * months - principal),
+    }
+
+
+# Values from start to stop inclusive, step apart. A single value if there's
+# no stop.
+def sweep_values(start, stop=None, step=None):
+    if stop is None or stop == start:
+        return np.array([start], dtype=float)
+
+    if not step or step <= 0 or stop < start:
+        raise MortgageError("A range needs a positive step and to end after it starts")
+
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+
+    if count > SWEEP_MAX_CELLS:
+        raise MortgageError("The grid can't have more than %d loans" % SWEEP_MAX_CELLS)
+
+    return start + step * np.arange(count)
+
+
+# Monthly payment and total interest for every combination of interest
+# rate, term in years and deposit, as arrays indexed [rate, term, deposit].
+# Worked out in one broadcast rather than loan by loan.
+def sweep(home_value, rates, years, deposits):
+    rates, years, deposits = (np.asarray(values, dtype=float) for values in (rates, years, deposits))
+    cells = rates.size * years.size * deposits.size
+
+    if cells > SWEEP_MAX_CELLS:
+        raise MortgageError("The grid can't have more than %d loans" % SWEEP_MAX_CELLS)
+    if (rates < 0).any():
+        raise MortgageError("The interest rate can't be negative")
+    if (rates > MAX_INTEREST_RATE).any():
+        raise MortgageError("The interest rate can't be more than %d%%" % MAX_INTEREST_RATE)
+    if (years <= 0).any():
+        raise MortgageError("The duration must be at least a month")
+    if (deposits < 0).any() or (deposits >= home_value).any():
+        raise MortgageError("Deposits must be less than the home value")
+
+    # Checked as single loans are, so terms rounding to no months are refused
+    months = np.array([loan_months(duration) for duration in years], dtype=float)
+
+    principal = home_value - deposits[None, None, :]
+    months = months[None, :, None]
+    payment = monthly_payment(principal, rates[:, None, None], months)
+
+    return payment, payment * months - principal
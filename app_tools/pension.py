@@ -0,0 +1,99 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from django.conf import settings
+
+
+# Most paths simulated for one projection.
+PENSION_MAX_PATHS = getattr(settings, "PENSION_MAX_PATHS", 200000)
+
+# Paths simulated together, each from its own seed. Results depend only on
+# the seed, not on how many processes the chunks are shared between.
+PENSION_CHUNK_PATHS = 10000
+
+# Most paid into pensions each year without tax, as the pension quiz teaches
+# for 2024/25.
+PENSION_ANNUAL_ALLOWANCE = getattr(settings, "PENSION_ANNUAL_ALLOWANCE", 60000)
+
+# Share of a pension that can be taken as a tax-free lump sum.
+TAX_FREE_LUMP_SUM = 0.25
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+# Raised for inputs no projection can be made from.
+class PensionError(ValueError):
+    pass
+
+
+# Amount paid in at the start of each year until retirement: the employee's
+# and employer's percentages of a salary growing each year, capped at the
+# annual allowance.
+def contributions(salary, years, employee_rate, employer_rate, salary_growth):
+    salaries = salary * (1 + salary_growth / 100) ** np.arange(years)
+
+    return np.minimum(salaries * (employee_rate + employer_rate) / 100, PENSION_ANNUAL_ALLOWANCE)
+
+
+# The pot at the end of each year on `paths` paths, as a (paths x years)
+# array. Yearly returns are lognormal with the given mean and volatility.
+# A pot at the end of year t is pot * G_0..G_t plus each year's contribution
+# grown from when it was paid in, so it comes from cumulative products
+# rather than a loop over the years.
+def simulate(seed, paths, pot, yearly, mean_return, volatility):
+    rng = np.random.default_rng(seed)
+    sigma = np.log(1 + (volatility / 100) ** 2 / (1 + mean_return / 100) ** 2) ** 0.5
+    mu = np.log(1 + mean_return / 100) - sigma ** 2 / 2
+
+    growth = np.exp(rng.normal(mu, sigma, size=(paths, len(yearly))))
+    grown = np.cumprod(growth, axis=1)
+    before = np.concatenate([np.ones((paths, 1)), grown[:, :-1]], axis=1)
+
+    return grown * (pot + np.cumsum(yearly / before, axis=1))
+
+
+def _simulate(args):
+    return simulate(*args)
+
+
+# Percentile bands of the pot at each age up to retirement, in today's money,
+# over `paths` simulated paths. With more than one worker the paths are
+# shared between that many processes.
+def project(current_age, retirement_age, salary, pot=0, employee_rate=5, employer_rate=3,
+            salary_growth=2, mean_return=5, volatility=12, inflation=2, paths=10000, seed=None,
+            workers=1):
+    years = retirement_age - current_age
+
+    if years <= 0:
+        raise PensionError("The retirement age must be after the current age")
+    if not 0 < paths <= PENSION_MAX_PATHS:
+        raise PensionError("Between 1 and %d paths can be simulated" % PENSION_MAX_PATHS)
+    if min(salary, pot, employee_rate, employer_rate, volatility) < 0 or mean_return <= -100:
+        raise PensionError("Amounts and rates can't be negative")
+
+    yearly = contributions(salary, years, employee_rate, employer_rate, salary_growth)
+    sizes = [min(PENSION_CHUNK_PATHS, paths - start) for start in range(0, paths, PENSION_CHUNK_PATHS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [(chunk_seed, size, pot, yearly, mean_return, volatility)
+              for chunk_seed, size in zip(seeds, sizes)]
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            pots = np.concatenate(list(pool.map(_simulate, chunks)))
+    else:
+        pots = np.concatenate([simulate(*chunk) for chunk in chunks])
+
+    pots /= (1 + inflation / 100) ** np.arange(1, years + 1)
+    bands = np.percentile(pots, PERCENTILES, axis=0).round(2)
+
+    return {
+        "ages": list(range(current_age + 1, retirement_age + 1)),
+        "percentiles": PERCENTILES,
+        "bands": {str(pct): band.tolist() for pct, band in zip(PERCENTILES, bands)},
+        "final": {str(pct): float(band[-1]) for pct, band in zip(PERCENTILES, bands)},
+        "tax_free_lump_sum": {str(pct): round(float(band[-1]) * TAX_FREE_LUMP_SUM, 2)
+                              for pct, band in zip(PERCENTILES, bands)},
+        "contributed": round(float(yearly.sum()), 2),
+        "paths": paths,
+    }
@@ -0,0 +1,94 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+from .mortgage import calculate, MortgageError
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for every benchmark thread connecting at once
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients that timed out hang up before their answer is written
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+# Local stand-in for the api-ninjas mortgage calculator, answering from
+# app_tools.mortgage, so HTTPCalculatorBackend can be tested and benchmarked
+# without network access. `delay` seconds are added to every response.
+class StubCalculatorServer:
+    path = "/v1/mortgagecalculator"
+
+    def __init__(self, api_key="", delay=0):
+        self.api_key = api_key
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%d%s" % (host, port, self.path)
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+
+                if stub.delay:
+                    time.sleep(stub.delay)
+
+                url = urlparse(self.path)
+
+                if url.path != stub.path:
+                    return self.reply(404, {"error": "Not found"})
+                if stub.api_key and self.headers.get("X-Api-Key") != stub.api_key:
+                    return self.reply(401, {"error": "Invalid API Key."})
+
+                try:
+                    inputs = {name: float(value) for name, value in parse_qsl(url.query)}
+                    self.reply(200, calculate(**inputs))
+                except (TypeError, ValueError, MortgageError) as error:
+                    self.reply(400, {"error": str(error)})
+
+            def reply(self, status, body):
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-calculator",
+                                        daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+# Income tax and employee National Insurance for each tax year, for England,
+# Wales and Northern Ireland. Each band is (lower limit, rate): income tax
+# bands are on taxable income, after the personal allowance, and National
+# Insurance bands are on annual earnings. A band runs up to the next one's
+# lower limit. The personal allowance goes down by £1 for every £2 of
+# income over allowance_taper_from.
+TAX_YEARS = {
+    "2024/25": {
+        "personal_allowance": 12570,
+        "allowance_taper_from": 100000,
+        "income_tax": [(0, 0.20), (37700, 0.40), (125140, 0.45)],
+        "national_insurance": [(12570, 0.08), (50270, 0.02)],
+    },
+    "2025/26": {
+        "personal_allowance": 12570,
+        "allowance_taper_from": 100000,
+        "income_tax": [(0, 0.20), (37700, 0.40), (125140, 0.45)],
+        "national_insurance": [(12570, 0.08), (50270, 0.02)],
+    },
+}
+
+# The tax year the tax pathway quizzes teach.
+DEFAULT_TAX_YEAR = "2024/25"
+
+# Most salaries worked out in one batch.
+TAX_BATCH_MAX_SALARIES = 100000
+
+
+# Raised for an unknown tax year or salaries no tax can be worked out for.
+class TaxError(ValueError):
+    pass
+
+
+def tax_year_table(tax_year=DEFAULT_TAX_YEAR):
+    try:
+        return TAX_YEARS[tax_year]
+    except KeyError:
+        raise TaxError("No tax bands for %s" % tax_year)
+
+
+# Tax on each amount for a list of (lower limit, rate) bands. Each amount's
+# share of each band is worked out at once as an (amounts x bands) array.
+def banded(amounts, bands):
+    lows = np.array([low for low, _ in bands], dtype=float)
+    rates = np.array([rate for _, rate in bands], dtype=float)
+    widths = np.append(lows[1:], np.inf) - lows
+
+    return np.clip(amounts[:, None] - lows, 0, widths) @ rates
+
+
+# Income tax, National Insurance and take-home pay for many annual salaries
+# at once, as arrays in the order given.
+def take_home_batch(salaries, tax_year=DEFAULT_TAX_YEAR):
+    table = tax_year_table(tax_year)
+    gross = np.asarray(salaries, dtype=float).ravel()
+
+    if gross.size > TAX_BATCH_MAX_SALARIES:
+        raise TaxError("No more than %d salaries at once" % TAX_BATCH_MAX_SALARIES)
+    if not np.isfinite(gross).all() or (gross < 0).any():
+        raise TaxError("Salaries can't be negative")
+
+    taper = np.floor(np.maximum(gross - table["allowance_taper_from"], 0) / 2)
+    allowance = np.maximum(table["personal_allowance"] - taper, 0)
+    taxable = np.maximum(gross - allowance, 0)
+
+    income_tax = np.round(banded(taxable, table["income_tax"]), 2)
+    national_insurance = np.round(banded(gross, table["national_insurance"]), 2)
+    net = gross - income_tax - national_insurance
+
+    return {
+        "gross": gross,
+        "personal_allowance": allowance,
+        "taxable_income": taxable,
+        "income_tax": income_tax,
+        "national_insurance": national_insurance,
+        "net_pay": np.round(net, 2),
+        "monthly_net_pay": np.round(net / 12, 2),
+    }
+
+
+# The same for one salary, as plain numbers.
+def take_home(salary, tax_year=DEFAULT_TAX_YEAR):
+    return {name: float(values[0]) for name, values in take_home_batch([salary], tax_year).items()}
@@ -1,7 +1,25 @@
 from app_tools.views import MortgageForm
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
 from django.contrib.auth import get_user_model
 from app_tools.views import mortgage
+from app_tools.mortgage import calculate, amortisation_schedule, monthly_payment, sweep, sweep_values, MortgageError
+from app_tools.backends import HTTPCalculatorBackend, CalculatorUnavailable, get_backend, reset_backend
+from app_tools.stub_server import StubCalculatorServer
+from app_tools.tax import take_home, take_home_batch, TaxError, TAX_YEARS
+from app_tools.pension import project, contributions, PensionError
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+from django.conf import settings
+from decimal import Decimal, ROUND_HALF_UP, getcontext
+from io import StringIO
+from django.core.management import call_command
+from django.urls import reverse
+import json
+import numpy as np
+
+
+# Tests use a cache of their own, not the shared one a dev server may be using
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
 
 
 class MortgageFormTest(TestCase):
@@ -35,6 +53,7 @@ class MortgageFormTest(TestCase):
         self.assertFalse(form.is_valid())
 
 
+@override_settings(CACHES=TEST_CACHES)
 class MortgageViewTest(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -47,3 +66,484 @@ class MortgageViewTest(TestCase):
         request.user = self.user
         response = mortgage(request)
         self.assertEqual(response.status_code, 200)
+
+    # Test a submitted form is worked out locally
+    def test_mortgage_view_results(self):
+        request = self.factory.get('/mortgage', {'loan_amount': 200000, 'interest_rate': 3.5})
+        request.user = self.user
+        response = mortgage(request)
+        self.assertContains(response, '898.09')
+        self.assertContains(response, '123312.18')
+
+    # Test a form with no amount borrowed shows an error
+    def test_mortgage_view_error(self):
+        request = self.factory.get('/mortgage', {'interest_rate': 3.5})
+        request.user = self.user
+        response = mortgage(request)
+        self.assertContains(response, 'Either a loan amount or a home value is needed')
+
+
+# Exact reference for the fixtures, worked out in Decimal.
+def reference_payment(principal, interest_rate, months):
+    getcontext().prec = 50
+    principal = Decimal(str(principal))
+    rate = Decimal(str(interest_rate)) / 100 / 12
+
+    if rate == 0:
+        return principal / months
+
+    growth = (1 + rate) ** months
+    return principal * rate * growth / (growth - 1)
+
+
+def to_pennies(value):
+    return float(Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+class MortgageEngineTest(TestCase):
+    FIXTURES = [
+        {'loan_amount': 200000, 'interest_rate': 3.5},
+        {'loan_amount': 100000, 'interest_rate': 3.5, 'duration_years': 30, 'monthly_hoa': 100,
+         'annual_property_tax': 2000, 'annual_home_insurance': 1000},
+        {'home_value': 350000, 'downpayment': 35000, 'interest_rate': 5.25, 'duration_years': 25},
+        {'loan_amount': 1250000, 'interest_rate': 7.99, 'duration_years': 40},
+        {'loan_amount': 85000, 'interest_rate': 0, 'duration_years': 15},
+        {'loan_amount': 54321.99, 'interest_rate': 1.1, 'duration_years': 10,
+         'annual_property_tax': 1234.56},
+    ]
+
+    # Test results match the Decimal reference to the penny
+    def test_fixtures(self):
+        for fixture in self.FIXTURES:
+            principal = fixture.get('loan_amount') or fixture['home_value'] - fixture['downpayment']
+            months = int(fixture.get('duration_years', 30) * 12)
+            payment = reference_payment(principal, fixture['interest_rate'], months)
+            results = calculate(**fixture)
+
+            self.assertEqual(results['monthly_payment']['mortgage'], to_pennies(payment), fixture)
+            self.assertEqual(results['annual_payment']['mortgage'], to_pennies(payment * 12), fixture)
+            self.assertEqual(results['total_interest_paid'],
+                             to_pennies(payment * months - Decimal(str(principal))), fixture)
+
+    # Test a worked example with every cost filled in
+    def test_known_values(self):
+        results = calculate(loan_amount=200000, interest_rate=3.5, duration_years=30,
+                            monthly_hoa=100, annual_property_tax=2400, annual_home_insurance=1200)
+        self.assertEqual(results['monthly_payment'], {'total': 1298.09, 'mortgage': 898.09,
+                                                      'property_tax': 200.0, 'hoa': 100.0,
+                                                      'annual_home_ins': 100.0})
+        self.assertEqual(results['total_interest_paid'], 123312.18)
+
+    # Test the schedule pays the loan off and matches a running Decimal balance
+    def test_schedule(self):
+        for principal, rate, months in [(200000, 3.5, 360), (85000, 0, 180), (1250000, 7.99, 480)]:
+            schedule = amortisation_schedule(principal, rate, months)
+            self.assertEqual(len(schedule['month']), months)
+            self.assertAlmostEqual(schedule['principal'].sum(), principal, places=4)
+            self.assertEqual(schedule['balance'][-1], 0)
+
+            payment = reference_payment(principal, rate, months)
+            balance = Decimal(str(principal))
+            for i in range(months):
+                interest = balance * Decimal(str(rate)) / 100 / 12
+                balance -= payment - interest
+                self.assertEqual(round(schedule['interest'][i], 2), float(round(interest, 2)))
+
+    # Test grids of loans can be worked out at once
+    def test_vectorised(self):
+        payments = monthly_payment(200000, np.array([[0], [3.5]]), np.array([120, 360]))
+        self.assertEqual(payments.shape, (2, 2))
+        self.assertAlmostEqual(payments[0, 0], 200000 / 120)
+        self.assertAlmostEqual(payments[1, 1], float(reference_payment(200000, 3.5, 360)))
+
+    # Test inputs nothing can be worked out from
+    def test_errors(self):
+        with self.assertRaises(MortgageError):
+            calculate(interest_rate=3.5)
+        with self.assertRaises(MortgageError):
+            calculate(interest_rate=3.5, home_value=1000, downpayment=1000)
+        with self.assertRaises(MortgageError):
+            calculate(interest_rate=-1, loan_amount=1000)
+        with self.assertRaises(MortgageError):
+            calculate(interest_rate=3.5, loan_amount=1000, duration_years=1e9)
+        with self.assertRaises(MortgageError):
+            calculate(interest_rate=1e6, loan_amount=1000)
+
+
+class MortgageScheduleViewTest(TestCase):
+    # Test the CSV download has a row per month matching the schedule
+    def test_csv(self):
+        response = self.client.get(reverse('mortgage-schedule'),
+                                   {'loan_amount': 200000, 'interest_rate': 3.5, 'duration_years': 40})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('mortgage-schedule.csv', response['Content-Disposition'])
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        schedule = amortisation_schedule(200000, 3.5, 480)
+        self.assertEqual(lines[0], 'month,payment,interest,principal,balance')
+        self.assertEqual(len(lines), 481)
+        self.assertEqual(lines[1], '1,%.2f,%.2f,%.2f,%.2f' % (
+            schedule['payment'][0], schedule['interest'][0], schedule['principal'][0],
+            schedule['balance'][0]))
+        self.assertTrue(lines[-1].startswith('480,') and lines[-1].endswith(',0.00'))
+
+    # Test the NDJSON download is one object per month
+    def test_ndjson(self):
+        response = self.client.get(reverse('mortgage-schedule'),
+                                   {'home_value': 300000, 'downpayment': 60000, 'interest_rate': 0,
+                                    'duration_years': 1, 'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[0], {'month': 1, 'payment': 20000.0, 'interest': 0.0,
+                                   'principal': 20000.0, 'balance': 220000.0})
+
+    # Test bad inputs are rejected before anything is streamed
+    def test_errors(self):
+        response = self.client.get(reverse('mortgage-schedule'), {'loan_amount': 1000})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'InvalidMortgage')
+
+        response = self.client.get(reverse('mortgage-schedule'), {'interest_rate': 3})
+        self.assertEqual(response.json()['error'], 'InvalidMortgage')
+
+        response = self.client.get(reverse('mortgage-schedule'),
+                                   {'loan_amount': 1000, 'interest_rate': 3, 'format': 'xml'})
+        self.assertEqual(response.json()['error'], 'InvalidFormat')
+
+        response = self.client.get(reverse('mortgage-schedule'),
+                                   {'loan_amount': 1000, 'interest_rate': 3, 'duration_years': 1e9})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("more than", response.json()['message'])
+
+    # Test the benchmark streams every download in chunks through ASGI
+    def test_bench_schedule_export(self):
+        out = StringIO()
+        call_command('bench_schedule_export', downloads=10, concurrency=5, years=40,
+                     host='testserver', stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['throughput']['downloads'], 10)
+        # The header and four chunks of 120 months
+        self.assertEqual(report['throughput']['body_messages'], 5)
+
+
+class MortgageSweepTest(TestCase):
+    # Test the grid covers every combination and matches single loans
+    def test_sweep_view(self):
+        response = self.client.get(reverse('mortgage-sweep'), {
+            'home_value': 300000, 'rate_from': 2, 'rate_to': 5, 'rate_step': 1.5,
+            'years_from': 20, 'years_to': 30, 'years_step': 5,
+            'deposit_from': 30000, 'deposit_to': 60000, 'deposit_step': 30000})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        self.assertEqual(data['rates'], [2.0, 3.5, 5.0])
+        self.assertEqual(data['years'], [20.0, 25.0, 30.0])
+        self.assertEqual(data['deposits'], [30000.0, 60000.0])
+        self.assertEqual(np.array(data['monthly_payment']).shape, (3, 3, 2))
+
+        results = calculate(interest_rate=3.5, home_value=300000, downpayment=60000, duration_years=25)
+        self.assertEqual(data['monthly_payment'][1][1][1], results['monthly_payment']['mortgage'])
+        self.assertEqual(data['total_interest'][1][1][1], results['total_interest_paid'])
+
+    # Test a single rate with the default term and no deposit
+    def test_sweep_defaults(self):
+        data = self.client.get(reverse('mortgage-sweep'), {'home_value': 200000, 'rate_from': 3.5}).json()
+        self.assertEqual(data['monthly_payment'], [[[898.09]]])
+
+    # Test grids over the cap and bad ranges are refused
+    def test_sweep_errors(self):
+        response = self.client.get(reverse('mortgage-sweep'), {
+            'home_value': 300000, 'rate_from': 0, 'rate_to': 10, 'rate_step': 0.001,
+            'years_from': 1, 'years_to': 40, 'years_step': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("more than", response.json()['message'])
+
+        response = self.client.get(reverse('mortgage-sweep'), {
+            'home_value': 300000, 'rate_from': 5, 'rate_to': 2, 'rate_step': 1})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse('mortgage-sweep'), {
+            'home_value': 300000, 'rate_from': 5, 'deposit_from': 300000})
+        self.assertEqual(response.status_code, 400)
+
+        with self.assertRaises(MortgageError):
+            sweep(1000, sweep_values(0, 10, 0.001), sweep_values(1, 40, 1), [0])
+
+        # Terms rounding to no months, or over the longest term
+        for years_from in (0.01, 60):
+            response = self.client.get(reverse('mortgage-sweep'), {
+                'home_value': 300000, 'rate_from': 5, 'years_from': years_from})
+            self.assertEqual(response.status_code, 400)
+
+    # Test the benchmark agrees with the loop
+    def test_bench_mortgage_sweep(self):
+        out = StringIO()
+        call_command('bench_mortgage_sweep', rates=10, terms=5, deposits=2, repeat=1, stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['cells'], 100)
+        self.assertLess(report['max_difference'], 1e-6)
+
+
+class HTTPCalculatorBackendTest(TestCase):
+    def setUp(self):
+        self.stub = StubCalculatorServer(api_key='key').start()
+        reset_backend()
+
+    def tearDown(self):
+        self.stub.stop()
+        reset_backend()
+
+    def backend(self, **options):
+        return HTTPCalculatorBackend(url=self.stub.url, api_key='key', **options)
+
+    # Test answers come back through the stub, and the same mortgage entered
+    # differently is fetched once
+    def test_calculate_cached(self):
+        backend = self.backend()
+        results = backend.calculate(loan_amount=200000, interest_rate=3.5, duration_years=None)
+
+        self.assertEqual(results, calculate(loan_amount=200000, interest_rate=3.5))
+        self.assertEqual(backend.calculate(loan_amount=200000.0, interest_rate=3.50, monthly_hoa=''),
+                         results)
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(backend.stats()['hits'], 1)
+
+    # Test entries expire and the least recently used is dropped
+    def test_cache_expiry_and_size(self):
+        backend = self.backend(cache_seconds=0)
+        backend.calculate(loan_amount=1000, interest_rate=1)
+        backend.calculate(loan_amount=1000, interest_rate=1)
+        self.assertEqual(self.stub.requests, 2)
+
+        backend = self.backend(cache_size=1)
+        backend.calculate(loan_amount=1000, interest_rate=1)
+        backend.calculate(loan_amount=2000, interest_rate=1)
+        backend.calculate(loan_amount=1000, interest_rate=1)
+        self.assertEqual(self.stub.requests, 5)
+
+    # Test concurrent calls for the same mortgage share one request
+    def test_coalescing(self):
+        self.stub.delay = 0.2
+        backend = self.backend()
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda _: backend.calculate(loan_amount=1000, interest_rate=1),
+                                    range(5)))
+
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(len({json.dumps(result) for result in results}), 1)
+        self.assertEqual(backend.stats()['coalesced'], 4)
+
+    # Test slow answers and errors raise CalculatorUnavailable and aren't cached
+    def test_errors(self):
+        self.stub.delay = 0.5
+        with self.assertRaises(CalculatorUnavailable):
+            self.backend(read_timeout=0.1).calculate(loan_amount=1000, interest_rate=1)
+
+        self.stub.delay = 0
+        backend = HTTPCalculatorBackend(url=self.stub.url, api_key='wrong')
+        with self.assertRaisesMessage(CalculatorUnavailable, 'Invalid API Key.'):
+            backend.calculate(loan_amount=1000, interest_rate=1)
+        with self.assertRaises(CalculatorUnavailable):
+            backend.calculate(loan_amount=1000, interest_rate=1)
+        self.assertEqual(backend.stats()['errors'], 2)
+
+    # Test answers that aren't JSON objects raise CalculatorUnavailable
+    def test_unreadable_answers(self):
+        backend = self.backend()
+        responses = [Mock(status_code=200, json=Mock(side_effect=ValueError)),
+                     Mock(status_code=200, json=Mock(return_value=[1, 2])),
+                     Mock(status_code=500, json=Mock(return_value="error")),
+                     Mock(status_code=500, json=Mock(side_effect=ValueError))]
+
+        for response in responses:
+            with patch.object(backend.session, 'get', return_value=response):
+                with self.assertRaises(CalculatorUnavailable):
+                    backend.calculate(loan_amount=1000, interest_rate=1)
+
+        self.assertEqual(backend.stats()['errors'], 4)
+
+    # Test the mortgage view uses the backend in the settings
+    def test_mortgage_view(self):
+        with override_settings(MORTGAGE_CALCULATOR={
+                'BACKEND': 'app_tools.backends.HTTPCalculatorBackend',
+                'OPTIONS': {'url': self.stub.url, 'api_key': 'key'}}):
+            response = self.client.get(reverse('mortgage-calculator'),
+                                       {'loan_amount': 200000, 'interest_rate': 3.5})
+
+            self.assertContains(response, '898.09')
+            self.assertIsInstance(get_backend(), HTTPCalculatorBackend)
+            self.assertEqual(self.stub.requests, 1)
+
+    # Test the benchmark sends each mortgage to the stub once
+    def test_bench_calculator_backend(self):
+        out = StringIO()
+        call_command('bench_calculator_backend', calls=40, distinct=4, concurrency=4, latency=1,
+                     stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['unpooled']['server_requests'], 40)
+        self.assertEqual(report['backend']['server_requests'], 4)
+
+
+class TaxEngineTest(TestCase):
+    # Test the 2024/25 bands agree with what the tax quiz teaches
+    def test_quiz_figures(self):
+        path = settings.BASE_DIR / 'app_quiz' / 'json_pathways' / 'tax_data' / 'calc_tax_data.json'
+        with open(path, encoding='utf8') as f:
+            questions = {question['question']: question
+                         for section in json.load(f)['sections'] for question in section.get('questions', [])}
+
+        basic_rate = questions['What is the current basic rate of income tax in the UK?']['correct_option']
+        allowance = next(question['blank'] for text, question in questions.items()
+                         if 'personal allowance' in text and '2024/25' in text)
+
+        self.assertEqual(TAX_YEARS['2024/25']['income_tax'][0][1], int(basic_rate.rstrip('%')) / 100)
+        self.assertEqual(TAX_YEARS['2024/25']['personal_allowance'], int(allowance.replace(',', '')))
+        # No tax on earnings up to the allowance, the basic rate on the next pound
+        self.assertEqual(take_home(12570)['income_tax'], 0)
+        self.assertEqual(take_home(12571)['income_tax'], 0.2)
+
+    # Test worked examples across every band and the allowance taper
+    def test_worked_examples(self):
+        examples = [
+            # salary, income tax, National Insurance, net pay
+            (0, 0, 0, 0),
+            (20000, 1486, 594.4, 17919.6),
+            (30000, 3486, 1394.4, 25119.6),
+            (60000, 11432, 3210.6, 45357.4),
+            (110000, 33432, 4210.6, 72357.4),
+            (150000, 53703, 5010.6, 91286.4),
+        ]
+
+        for salary, income_tax, national_insurance, net_pay in examples:
+            results = take_home(salary)
+            self.assertEqual((results['income_tax'], results['national_insurance'], results['net_pay']),
+                             (income_tax, national_insurance, net_pay), salary)
+
+        self.assertEqual(take_home(110000)['personal_allowance'], 7570)
+        self.assertEqual(take_home(150000)['personal_allowance'], 0)
+
+    # Test a batch gives the same answers as one salary at a time
+    def test_batch(self):
+        salaries = np.random.default_rng(0).uniform(0, 250000, 5000).round(2)
+        batch = take_home_batch(salaries, '2025/26')
+
+        for i in range(0, 5000, 250):
+            single = take_home(salaries[i], '2025/26')
+            for name, value in single.items():
+                self.assertEqual(batch[name][i], value)
+
+    # Test bad inputs
+    def test_errors(self):
+        with self.assertRaises(TaxError):
+            take_home(30000, '1999/00')
+        with self.assertRaises(TaxError):
+            take_home(-1)
+        with self.assertRaises(TaxError):
+            take_home_batch(np.zeros(100001))
+
+    # Test the calculator page
+    def test_take_home_pay_view(self):
+        response = self.client.get(reverse('take-home-pay'), {'salary': 30000, 'tax_year': '2024/25'})
+        self.assertContains(response, '25119.60')
+
+        response = self.client.get(reverse('take-home-pay'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('results', response.context)
+
+    # Test the batch API
+    def test_take_home_pay_batch_view(self):
+        response = self.client.post(reverse('take-home-pay-batch'),
+                                    json.dumps({'salaries': [20000, 60000]}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['net_pay'], [17919.6, 45357.4])
+        self.assertEqual(response.json()['tax_year'], '2024/25')
+
+        response = self.client.post(reverse('take-home-pay-batch'), 'nope', content_type='application/json')
+        self.assertEqual(response.json()['error'], 'InvalidJSON')
+
+        response = self.client.post(reverse('take-home-pay-batch'),
+                                    json.dumps({'salaries': [20000], 'tax_year': '1999/00'}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['error'], 'InvalidBatch')
+
+        response = self.client.post(reverse('take-home-pay-batch'),
+                                    json.dumps({'salaries': ['a lot']}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PensionProjectionTest(TestCase):
+    # Test with no volatility every path matches saving year by year
+    def test_deterministic(self):
+        results = project(30, 35, 30000, pot=10000, volatility=0, inflation=0, paths=100)
+
+        pot = 10000
+        for year in range(5):
+            pot = (pot + 30000 * 1.02 ** year * 0.08) * 1.05
+            for pct in results['percentiles']:
+                self.assertAlmostEqual(results['bands'][str(pct)][year], pot, places=1)
+
+        self.assertEqual(results['ages'], [31, 32, 33, 34, 35])
+        self.assertAlmostEqual(results['tax_free_lump_sum']['50'], results['final']['50'] * 0.25, places=1)
+
+    # Test contributions are capped at the annual allowance the pension quiz teaches
+    def test_annual_allowance(self):
+        path = settings.BASE_DIR / 'app_quiz' / 'json_pathways' / 'pension_data' / 'what_is_pension_data.json'
+        with open(path, encoding='utf8') as f:
+            allowance = next(question['correct_option'] for section in json.load(f)['sections']
+                             for question in section.get('questions', [])
+                             if 'annual allowance' in question['question'])
+
+        yearly = contributions(1000000, 3, 10, 10, 0)
+        self.assertEqual(yearly.tolist(), [float(allowance.strip('£').replace(',', ''))] * 3)
+
+    # Test bands are ordered and the same seed gives the same answer however
+    # many processes share the paths
+    def test_seeded_bands(self):
+        results = project(25, 65, 30000, paths=20000, seed=1)
+        finals = [results['final'][str(pct)] for pct in results['percentiles']]
+        self.assertEqual(finals, sorted(finals))
+        self.assertEqual(len(results['bands']['50']), 40)
+
+        self.assertEqual(project(25, 65, 30000, paths=20000, seed=1, workers=2), results)
+        self.assertNotEqual(project(25, 65, 30000, paths=20000, seed=2), results)
+
+    # Test inputs nothing can be projected from
+    def test_errors(self):
+        with self.assertRaises(PensionError):
+            project(65, 60, 30000)
+        with self.assertRaises(PensionError):
+            project(30, 60, 30000, paths=0)
+        with self.assertRaises(PensionError):
+            project(30, 60, -1)
+
+    # Test the projection page
+    def test_pension_view(self):
+        response = self.client.get(reverse('pension-projection'), {
+            'current_age': 30, 'retirement_age': 67, 'salary': 30000, 'paths': 1000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['results']['paths'], 1000)
+        # Every 5 years from 31, and the retirement age
+        self.assertEqual([age for age, _ in response.context['rows']],
+                         [31, 36, 41, 46, 51, 56, 61, 66, 67])
+
+        response = self.client.get(reverse('pension-projection'), {
+            'current_age': 60, 'retirement_age': 55, 'salary': 30000})
+        self.assertContains(response, 'The retirement age must be after the current age')
+
+    # Test the benchmark
+    def test_bench_pension_projection(self):
+        out = StringIO()
+        call_command('bench_pension_projection', paths=1000, years=10, workers='1', loop_paths=10,
+                     stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertTrue(report['same_results'])
+        self.assertIn('1', report['vectorised'])
@@ -1,6 +1,16 @@
+import json
+from django.conf import settings
 from django.shortcuts import render
-import requests
 from django import forms
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from .backends import get_backend
+from .mortgage import loan_terms, sweep, sweep_values, MortgageError, DEFAULT_DURATION_YEARS
+from .export import SCHEDULE_FORMATS, stream
+from .tax import take_home, take_home_batch, TaxError, TAX_YEARS, DEFAULT_TAX_YEAR
+from .pension import project, PensionError, PENSION_MAX_PATHS
 # Create your views here.
 
 class MortgageForm(forms.Form):
@@ -26,6 +36,46 @@ class MortgageForm(forms.Form):
     #         print("compulsory field missing")
     #     return cleaned_data
 
+class TaxForm(forms.Form):
+    salary = forms.FloatField(required=True, min_value=0) # annual, before tax
+    tax_year = forms.ChoiceField(choices=[(year, year) for year in TAX_YEARS],
+                                 initial=DEFAULT_TAX_YEAR)
+
+class PensionForm(forms.Form):
+    current_age = forms.IntegerField(required=True, min_value=16, max_value=100)
+    retirement_age = forms.IntegerField(required=True, min_value=17, max_value=100)
+    salary = forms.FloatField(required=True, min_value=0) # annual, before tax
+    pot = forms.FloatField(required=False, min_value=0) # saved so far
+
+    # optional, percentages of salary, defaulting to the auto-enrolment minimums
+    employee_rate = forms.FloatField(required=False, min_value=0, max_value=100)
+    employer_rate = forms.FloatField(required=False, min_value=0, max_value=100)
+
+    # optional, yearly percentages
+    salary_growth = forms.FloatField(required=False)
+    mean_return = forms.FloatField(required=False, min_value=-50, max_value=50)
+    volatility = forms.FloatField(required=False, min_value=0, max_value=100)
+    inflation = forms.FloatField(required=False, min_value=-10, max_value=50)
+
+    paths = forms.IntegerField(required=False, min_value=1, max_value=PENSION_MAX_PATHS)
+
+# Ranges for the sweep. Each goes from _from to _to in steps of _step, or is
+# the single _from value without a _to.
+class MortgageSweepForm(forms.Form):
+    home_value = forms.FloatField(required=True)
+
+    rate_from = forms.FloatField(required=True)
+    rate_to = forms.FloatField(required=False)
+    rate_step = forms.FloatField(required=False)
+
+    years_from = forms.FloatField(required=False) # defaults to 30 years
+    years_to = forms.FloatField(required=False)
+    years_step = forms.FloatField(required=False)
+
+    deposit_from = forms.FloatField(required=False) # defaults to no deposit
+    deposit_to = forms.FloatField(required=False)
+    deposit_step = forms.FloatField(required=False)
+
 # TODO:
 #### keep submitted details in form
 def mortgage(request):
@@ -33,25 +83,126 @@ def mortgage(request):
 
     if request.method == 'GET':
         form = MortgageForm(request.GET)
-        api_url = 'https://api.api-ninjas.com/v1/mortgagecalculator?'
+        context['submissions'] = form.data
+
+        # Nothing to work out until the form has been submitted
+        if form.data:
+            if form.is_valid():
+                try:
+                    context['results'] = get_backend().calculate(**form.cleaned_data)
+                except MortgageError as error:
+                    context['error'] = {'error': str(error)}
+            else:
+                context['error'] = {'error': 'Please enter an interest rate and a loan amount or home value'}
+
+    context['form'] = MortgageForm()
+    return render(request, "mortgage.html", context)
+
+# The month by month schedule for the MortgageForm inputs as a CSV or NDJSON
+# (?format=ndjson) download, generated as it's sent.
+def mortgage_schedule(request):
+    form = MortgageForm(request.GET)
+    export_format = request.GET.get('format', 'csv')
+
+    if export_format not in SCHEDULE_FORMATS:
+        return JsonResponse({"error": "InvalidFormat"}, status = 400)
+
+    if not form.is_valid():
+        return JsonResponse({"error": "InvalidMortgage", "fields": form.errors}, status = 400)
+
+    try:
+        principal, months = loan_terms(**form.cleaned_data)
+    except MortgageError as error:
+        return JsonResponse({"error": "InvalidMortgage", "message": str(error)}, status = 400)
 
-        context['submissions'] = form.data 
-        dict = context["submissions"].dict()
+    content_type, schedule = SCHEDULE_FORMATS[export_format]
+    rows = schedule(principal, form.cleaned_data['interest_rate'], months)
 
-        for key, value in dict.items():
-            if bool(value):
-                api_url += (key + "=" + value + "&")
+    if isinstance(request, ASGIRequest):
+        rows = stream(rows)
 
-        response = requests.get(api_url, headers={
-            'X-Api-Key': 'iDj1OIcpx1Ulk/xRIBmk9Q==qnEkfnb7lGtejdWX'})
+    response = StreamingHttpResponse(rows, content_type = content_type)
+    response['Content-Disposition'] = 'attachment; filename="mortgage-schedule.%s"' % export_format
+    return response
 
-        if response.status_code == requests.codes.ok:
-            results = response.json()
-            context['results'] = results
+# Monthly payments and total interest for every combination of the given
+# ranges of rates, terms and deposits, indexed [rate][term][deposit].
+def mortgage_sweep(request):
+    form = MortgageSweepForm(request.GET)
+
+    if not form.is_valid():
+        return JsonResponse({"error": "InvalidSweep", "fields": form.errors}, status = 400)
+
+    data = form.cleaned_data
+
+    try:
+        rates = sweep_values(data['rate_from'], data['rate_to'], data['rate_step'])
+        years = sweep_values(data['years_from'] or DEFAULT_DURATION_YEARS, data['years_to'],
+                             data['years_step'])
+        deposits = sweep_values(data['deposit_from'] or 0, data['deposit_to'], data['deposit_step'])
+        payments, interest = sweep(data['home_value'], rates, years, deposits)
+    except MortgageError as error:
+        return JsonResponse({"error": "InvalidSweep", "message": str(error)}, status = 400)
+
+    return JsonResponse({"rates": rates.round(4).tolist(),
+                         "years": years.round(4).tolist(),
+                         "deposits": deposits.round(2).tolist(),
+                         "monthly_payment": payments.round(2).tolist(),
+                         "total_interest": interest.round(2).tolist()})
+
+# Income tax, National Insurance and take-home pay for an annual salary.
+def take_home_pay(request):
+    context = {}
+    form = TaxForm(request.GET or None)
+
+    if form.is_valid():
+        try:
+            context['results'] = take_home(form.cleaned_data['salary'], form.cleaned_data['tax_year'])
+        except TaxError as error:
+            context['error'] = str(error)
+
+    context['form'] = form
+    return render(request, "tax.html", context)
+
+# The same for many salaries in one request. Takes a JSON body of
+# {"salaries": [...], "tax_year": "2024/25"} and answers with an array per
+# figure, in the order the salaries were given.
+@csrf_exempt
+@require_POST
+def take_home_pay_batch(request):
+    try:
+        data = json.loads(request.body)
+        salaries = data["salaries"]
+        tax_year = data.get("tax_year", DEFAULT_TAX_YEAR)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({"error": "InvalidJSON"}, status = 400)
+
+    try:
+        results = take_home_batch(salaries, tax_year)
+    except (TaxError, TypeError, ValueError) as error:
+        return JsonResponse({"error": "InvalidBatch", "message": str(error)}, status = 400)
+
+    return JsonResponse({"tax_year": tax_year,
+                         **{name: values.tolist() for name, values in results.items()}})
+
+# Percentile bands of a pension pot up to retirement, from simulating many
+# paths of contributions and investment returns.
+def pension_projection(request):
+    context = {}
+    form = PensionForm(request.GET or None)
+
+    if form.is_valid():
+        inputs = {name: value for name, value in form.cleaned_data.items() if value is not None}
+
+        try:
+            context['results'] = project(**inputs, workers=getattr(settings, 'PENSION_WORKERS', 1))
+        except PensionError as error:
+            context['error'] = str(error)
         else:
-            context['errorcode'] = response.status_code
-            context['error'] = response.json()
-            print(response.json())
+            results = context['results']
+            context['rows'] = [(age, [results['bands'][str(pct)][i] for pct in results['percentiles']])
+                               for i, age in enumerate(results['ages'])
+                               if (age - results['ages'][0]) % 5 == 0 or age == results['ages'][-1]]
 
-    context['form'] = MortgageForm()
-    return render(request, "mortgage.html", context)
+    context['form'] = form
+    return render(request, "pension.html", context)
@@ -4,6 +4,6 @@ from .models import *
 
 admin.site.register(ExtendedUser)
 admin.site.register(PointsAwarded)
-admin.site.register(Friend)
+admin.site.register(Friendship)
 admin.site.register(FriendRequest)
 admin.site.register(Notification)
@@ -5,4 +5,5 @@ class AppUserConfig(AppConfig):
     name = 'app_user'
 
     def ready(self):
+        import app_user.signals
         import app_streaming.signals
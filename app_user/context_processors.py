@@ -1,8 +1,12 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+from .notifications import get_unread_count
 
+# The header only needs the unread count, which is cached. The dropdown loads
+# its items from notification_feed.
 def notification_list(request):
     if request.user.is_authenticated:
-        notifications = Notification.objects.all().filter(user=request.user)
+        user = request.user
+        notification_count = SimpleLazyObject(lambda: get_unread_count(user.id))
     else:
-        notifications = {}
-    return {'notifications':notifications}
+        notification_count = 0
+    return {'notification_count':notification_count}
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from .models import ExtendedUser, Friendship, FriendRequest
+
+
+# Users shown per page of the friends page directory.
+DIRECTORY_PAGE_SIZE = getattr(settings, "DIRECTORY_PAGE_SIZE", 25)
+
+# Sorts after any character a username can contain.
+PREFIX_END = "\U0010ffff"
+
+
+# One page of other users, in username order, each annotated with whether
+# they're already a friend and whether a request is pending either way.
+# `query` matches the start of the username as a range on the username
+# index, `after` is the last username of the previous page. Returns the page
+# and the `after` for the next page, or None on the last page.
+def user_directory(user, query="", after=None, size=DIRECTORY_PAGE_SIZE, include_friends=True):
+    users = ExtendedUser.objects.exclude(id=user.id)
+
+    if query:
+        users = users.filter(username__gte=query, username__lt=query + PREFIX_END)
+
+    if after:
+        users = users.filter(username__gt=after)
+
+    users = users.annotate(
+        is_friend=Exists(Friendship.objects.filter(Q(low_id=user.id, high_id=OuterRef("pk"))
+                                                   | Q(low_id=OuterRef("pk"), high_id=user.id))),
+        request_sent=Exists(FriendRequest.objects.filter(sent_from_id=user.id,
+                                                         sent_to_id=OuterRef("pk"))),
+        request_received=Exists(FriendRequest.objects.filter(sent_from_id=OuterRef("pk"),
+                                                             sent_to_id=user.id)),
+    ).order_by("username")
+
+    if not include_friends:
+        users = users.filter(is_friend=False)
+
+    # One extra row says whether there's another page.
+    page = list(users[:size + 1])
+    next_after = page[size - 1].username if len(page) > size else None
+
+    return page[:size], next_after
@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from app_user.models import Notification
+from app_user.notifications import delete_notifications
+
+
+class Command(BaseCommand):
+    """Django command to delete expired notifications a batch at a time."""
+
+    help = 'Delete notifications older than the retention period, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90),
+                            help='Delete notifications older than this many days')
+        parser.add_argument('--read-days', type=int,
+                            default=getattr(settings, 'NOTIFICATION_READ_RETENTION_DAYS', 30),
+                            help='Delete read notifications older than this many days')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Most rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches, to let other writers in')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        now = timezone.now()
+        batch_size = max(options['batch_size'], 1)
+        total = 0
+
+        for expired in (Notification.objects.filter(date_created__lt=now - timezone.timedelta(days=options['days'])),
+                        Notification.objects.filter(is_read=True,
+                                                    date_created__lt=now - timezone.timedelta(days=options['read_days']))):
+            while True:
+                # Each batch is its own short transaction, so the write lock
+                # is never held for long.
+                with transaction.atomic():
+                    rows = list(expired.order_by('id').values_list('id', 'user_id')[:batch_size])
+
+                    if not rows:
+                        break
+
+                    deleted = delete_notifications([id for id, _ in rows],
+                                                   {user_id for _, user_id in rows})
+
+                total += deleted
+                self.stdout.write('Deleted %d notifications' % deleted)
+
+                if len(rows) < batch_size:
+                    break
+
+                if options['pause']:
+                    time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS('Pruned %d notifications.' % total))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from app_user.models import PointsAwarded, PointsBalance
+
+
+class Command(BaseCommand):
+    """Django command to rebuild points balances from the PointsAwarded ledger."""
+
+    help = 'Rebuild every PointsBalance from PointsAwarded and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report drift, don\'t fix it')
+
+    def handle(self, *args, **options):
+        """Handle the command."""
+
+        with transaction.atomic():
+            totals = dict(PointsAwarded.objects.values('user')
+                          .annotate(total=Sum('points'))
+                          .values_list('user', 'total'))
+            balances = {balance.user_id: balance
+                        for balance in PointsBalance.objects.select_for_update()}
+
+            drifted = []
+            missing = []
+
+            for user_id in sorted(set(totals) | set(balances)):
+                total = totals.get(user_id, 0)
+                balance = balances.get(user_id)
+                earned = balance.earned if balance is not None else 0
+
+                if earned == total:
+                    continue
+
+                self.stdout.write('User %d: balance %d, ledger %d (drift %+d)'
+                                  % (user_id, earned, total, earned - total))
+
+                if balance is None:
+                    missing.append(PointsBalance(user_id=user_id, earned=total))
+                else:
+                    balance.earned = total
+                    drifted.append(balance)
+
+            if not options['dry_run']:
+                PointsBalance.objects.bulk_update(drifted, ['earned'], batch_size=500)
+                PointsBalance.objects.bulk_create(missing, batch_size=500)
+
+        count = len(drifted) + len(missing)
+
+        if count == 0:
+            self.stdout.write(self.style.SUCCESS('All balances match the ledger.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING('%d balances have drifted.' % count))
+        else:
+            self.stdout.write(self.style.SUCCESS('Fixed %d balances.' % count))
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+# Builds every user's balance from the ledger with one aggregate query.
+def build_balances(apps, schema_editor):
+    PointsAwarded = apps.get_model('app_user', 'PointsAwarded')
+    PointsBalance = apps.get_model('app_user', 'PointsBalance')
+
+    totals = PointsAwarded.objects.values('user').annotate(total=Sum('points'))
+    PointsBalance.objects.bulk_create(
+        [PointsBalance(user_id=row['user'], earned=row['total']) for row in totals],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_user', '0009_merge_20240507_2222'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsBalance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='points_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('earned', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_user', '0010_pointsbalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-date_created'], name='notification_user_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['date_created'], name='notification_date_created'),
+        ),
+    ]
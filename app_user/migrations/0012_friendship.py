@@ -0,0 +1,70 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Every pair that appears in either user's Friend list becomes one
+# friendship.
+def copy_friends(apps, schema_editor):
+    Friend = apps.get_model('app_user', 'Friend')
+    Friendship = apps.get_model('app_user', 'Friendship')
+
+    pairs = set()
+    for user_id, friend_id in Friend.users.through.objects \
+            .values_list('friend__current_user_id', 'extendeduser_id').iterator():
+        if user_id is not None and user_id != friend_id:
+            pairs.add((min(user_id, friend_id), max(user_id, friend_id)))
+
+    Friendship.objects.bulk_create([Friendship(low_id=low, high_id=high) for low, high in pairs],
+                                   batch_size=500, ignore_conflicts=True)
+
+
+# Rebuilds each user's Friend list with both sides of every friendship.
+def copy_friendships(apps, schema_editor):
+    Friend = apps.get_model('app_user', 'Friend')
+    Friendship = apps.get_model('app_user', 'Friendship')
+
+    edges = []
+    for low, high in Friendship.objects.values_list('low_id', 'high_id').iterator():
+        edges += [(low, high), (high, low)]
+
+    friends = {user_id: Friend(current_user_id=user_id) for user_id in {user_id for user_id, _ in edges}}
+    Friend.objects.bulk_create(friends.values(), batch_size=500)
+
+    Friend.users.through.objects.bulk_create(
+        [Friend.users.through(friend_id=friends[user_id].id, extendeduser_id=friend_id)
+         for user_id, friend_id in edges],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_user', '0011_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships_high', to=settings.AUTH_USER_MODEL)),
+                ('low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships_low', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('low', 'high'), name='unique_friendship'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(check=models.Q(('low__lt', models.F('high'))), name='friendship_low_below_high'),
+        ),
+        migrations.RunPython(copy_friends, copy_friendships),
+        migrations.DeleteModel(
+            name='Friend',
+        ),
+    ]
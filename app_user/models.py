@@ -2,7 +2,11 @@
     adding avatars and decorations
 """
 from datetime import datetime
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
 
@@ -44,13 +48,21 @@ class ExtendedUser(AbstractUser):
         return self.username
 
     def points(self):
-        points = PointsAwarded.objects.filter(user = self)
-        total = 0
+        earned = PointsBalance.objects.filter(user = self).values_list('earned', flat = True).first()
 
-        for i in points:
-            total += i.points
+        return (earned or 0) - self.spentPoints
 
-        return total - self.spentPoints
+    # Spends points if the user has enough, as one conditional UPDATE so two
+    # purchases at once can't both spend the same points. Users who have
+    # never been awarded points have no balance and count as having none.
+    def spend_points(self, cost):
+        spent = ExtendedUser.objects.annotate(earned = Coalesce('points_balance__earned', 0)) \
+            .filter(id = self.id, earned__gte = F('spentPoints') + cost) \
+            .update(spentPoints = F('spentPoints') + cost)
+
+        self.refresh_from_db(fields = ['spentPoints'])
+
+        return spent == 1
 
 # Model to track when a user recieves points
 class PointsAwarded(models.Model):
@@ -58,24 +70,110 @@ class PointsAwarded(models.Model):
     points = models.IntegerField()
     time = models.DateTimeField(auto_now_add = True)
 
-class Friend(models.Model):
-    users = models.ManyToManyField(ExtendedUser)
-    current_user = models.ForeignKey(ExtendedUser, related_name='owner',
-                                     null=True, on_delete= models.CASCADE)
+    # Saves many awards at once, bulk_create skips the signals that keep
+    # balances up to date so they're updated here instead.
+    @classmethod
+    def bulk_award(cls, awards):
+        totals = {}
+
+        with transaction.atomic():
+            cls.objects.bulk_create(awards)
+
+            for award in awards:
+                totals[award.user_id] = totals.get(award.user_id, 0) + award.points
 
+            for user_id, points in totals.items():
+                PointsBalance.add(user_id, points, time = awards[0].time)
+
+        return awards
+
+# Sent with user_id, points and the time they were awarded whenever a user's
+# PointsBalance changes.
+points_balance_changed = Signal()
+
+# Total points a user has been awarded, kept up to date as PointsAwarded rows
+# are created and deleted so it never has to be summed from the ledger.
+# reconcile_points rebuilds it from the ledger if they drift apart.
+class PointsBalance(models.Model):
+    user = models.OneToOneField(ExtendedUser, primary_key = True, on_delete = models.CASCADE,
+                                related_name = 'points_balance')
+    earned = models.IntegerField(default = 0)
+
+    # Atomically adds to a user's balance, creating it on their first award.
+    @classmethod
+    def add(cls, user_id, points, create = True, time = None):
+        updated = cls.objects.filter(user_id = user_id).update(earned = F('earned') + points)
+
+        if not updated and create:
+            try:
+                with transaction.atomic():
+                    cls.objects.create(user_id = user_id, earned = points)
+            except IntegrityError:
+                # Created by someone else in the meantime
+                cls.objects.filter(user_id = user_id).update(earned = F('earned') + points)
+
+            updated = 1
+
+        if updated:
+            points_balance_changed.send(sender = cls, user_id = user_id, points = points,
+                                        time = time or timezone.now())
+
+# Sent with the pair's user ids whenever a friendship is added or removed.
+friendship_changed = Signal()
+
+# One row per pair of friends, stored with the lower user id first so each
+# friendship has exactly one row whichever side added it.
+class Friendship(models.Model):
+    low = models.ForeignKey(ExtendedUser, related_name='friendships_low', on_delete=models.CASCADE)
+    high = models.ForeignKey(ExtendedUser, related_name='friendships_high', on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['low', 'high'], name='unique_friendship'),
+            models.CheckConstraint(check=models.Q(low__lt=F('high')), name='friendship_low_below_high'),
+        ]
+
+    @staticmethod
+    def pair(user, other):
+        user_id = getattr(user, 'id', user)
+        other_id = getattr(other, 'id', other)
+
+        return min(user_id, other_id), max(user_id, other_id)
+
+    # Makes two users friends with one INSERT, doing nothing if they
+    # already are.
     @classmethod
-    def make_friend(cls, current_user, new_friend):
-        friend, created = cls.objects.get_or_create(
-            current_user=current_user
-        )
-        friend.users.add(new_friend)
+    def add(cls, user, other):
+        low, high = cls.pair(user, other)
+        cls.objects.bulk_create([cls(low_id=low, high_id=high)], ignore_conflicts=True)
+        friendship_changed.send(sender=cls, user_ids=(low, high))
 
+    # One DELETE. Returns whether they were friends.
     @classmethod
-    def remove_friend(cls, current_user, new_friend):
-        friend, created = cls.objects.get_or_create(
-            current_user=current_user
-        )
-        friend.users.remove(new_friend)
+    def remove(cls, user, other):
+        low, high = cls.pair(user, other)
+        deleted, _ = cls.objects.filter(low_id=low, high_id=high).delete()
+
+        if deleted:
+            friendship_changed.send(sender=cls, user_ids=(low, high))
+
+        return deleted > 0
+
+    @classmethod
+    def are_friends(cls, user, other):
+        low, high = cls.pair(user, other)
+
+        return cls.objects.filter(low_id=low, high_id=high).exists()
+
+    # A user's friends, found through the index on each side of the pair.
+    @classmethod
+    def friends_of(cls, user):
+        user_id = getattr(user, 'id', user)
+
+        return ExtendedUser.objects.filter(
+            models.Q(id__in=cls.objects.filter(low_id=user_id).values('high_id'))
+            | models.Q(id__in=cls.objects.filter(high_id=user_id).values('low_id')))
 
 class FriendRequest(models.Model):
     # store the user that has sent the request
@@ -91,3 +189,11 @@ class Notification(models.Model):
     message = models.CharField(max_length=100)
     user = models.ForeignKey(ExtendedUser, on_delete=models.CASCADE)
     date_created = models.DateTimeField(default=datetime.now)
+
+    class Meta:
+        indexes = [
+            # A user's unread notifications, newest first
+            models.Index(fields=['user', 'is_read', '-date_created'], name='notification_user_unread'),
+            # Expired notifications for prune_notifications
+            models.Index(fields=['date_created'], name='notification_date_created'),
+        ]
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import Notification
+
+
+# Number of notifications shown in the header dropdown.
+NOTIFICATION_DROPDOWN_SIZE = getattr(settings, "NOTIFICATION_DROPDOWN_SIZE", 10)
+
+# Summaries are rebuilt at least this often, in case an update bypassed the
+# signals (e.g. a queryset update).
+NOTIFICATION_CACHE_SECONDS = getattr(settings, "NOTIFICATION_CACHE_SECONDS", 300)
+
+# Ids deleted per statement, well under SQLite's limit on query parameters.
+DELETE_BATCH_SIZE = 500
+
+
+def cache_key(user_id):
+    return "notifications:%d" % user_id
+
+
+# A user's unread count and latest unread notifications, built with two
+# queries on a cache miss and none on a hit.
+def get_summary(user_id):
+    key = cache_key(user_id)
+    summary = cache.get(key)
+
+    if summary is None:
+        unread = Notification.objects.filter(user_id=user_id, is_read=False)
+        summary = {
+            "unread": unread.count(),
+            "latest": [{"id": notification.id,
+                        "message": notification.message,
+                        "date_created": notification.date_created.isoformat()}
+                       for notification in unread.order_by("-date_created", "-id")
+                       [:NOTIFICATION_DROPDOWN_SIZE]],
+        }
+        cache.set(key, summary, NOTIFICATION_CACHE_SECONDS)
+
+    return summary
+
+
+def get_unread_count(user_id):
+    return get_summary(user_id)["unread"]
+
+
+# Drops a user's cached summary. Done again once the transaction commits, so
+# a summary rebuilt from uncommitted data in the meantime isn't kept.
+def invalidate(user_id):
+    key = cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+# Marks all of a user's notifications read with a single UPDATE.
+def mark_all_read(user_id):
+    updated = Notification.objects.filter(user_id=user_id, is_read=False).update(is_read=True)
+    invalidate(user_id)
+
+    return updated
+
+
+# Deletes notifications by id, DELETE_BATCH_SIZE ids per DELETE.
+# queryset.delete() would load every row to send post_delete, so the given
+# users' summaries are invalidated here instead.
+def delete_notifications(ids, user_ids):
+    ids = list(ids)
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    column = connection.ops.quote_name(Notification._meta.pk.column)
+    deleted = 0
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            cursor.execute("DELETE FROM %s WHERE %s IN (%s)" % (table, column, ",".join(["%s"] * len(batch))),
+                           batch)
+            deleted += cursor.rowcount
+
+    for user_id in user_ids:
+        invalidate(user_id)
+
+    return deleted
+
+
+def clear_all(user_id):
+    ids = Notification.objects.filter(user_id=user_id).values_list('id', flat=True)
+    return delete_notifications(ids, [user_id])
@@ -0,0 +1,112 @@
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from .models import ExtendedUser, Friendship, FriendRequest
+
+
+# Number of "people you may know" recommendations kept per user.
+RECOMMENDATION_COUNT = getattr(settings, "RECOMMENDATION_COUNT", 10)
+
+# Rankings are kept in the default cache, which every worker shares, so one
+# dropped by any worker is rebuilt by all. They're also rebuilt at least this
+# often, in case an update bypassed friendship_changed (e.g. a user being
+# deleted).
+RECOMMENDATION_CACHE_SECONDS = getattr(settings, "RECOMMENDATION_CACHE_SECONDS", 600)
+
+
+def cache_key(user_id):
+    return "recommendations:%d" % user_id
+
+
+# Every friendship within two hops of a user: their own and their friends'.
+def _two_hop_edges(user_id):
+    friend_ids = (Q(id__in=Friendship.objects.filter(low_id=user_id).values('high_id'))
+                  | Q(id__in=Friendship.objects.filter(high_id=user_id).values('low_id')))
+    friends = ExtendedUser.objects.filter(friend_ids).values('id')
+
+    return Friendship.objects.filter(Q(low_id__in=friends) | Q(high_id__in=friends)) \
+        .values_list('low_id', 'high_id')
+
+
+# Users two hops away who aren't already friends, with how many mutual
+# friends they have, expanded from one query. The user's own friendships
+# come back with their friends', which gives the friend list too.
+def mutual_friend_counts(user_id):
+    edges = list(_two_hop_edges(user_id))
+    friends = {high if low == user_id else low for low, high in edges if user_id in (low, high)}
+    counts = Counter()
+
+    for low, high in edges:
+        if user_id in (low, high):
+            continue
+
+        for friend, other in ((low, high), (high, low)):
+            if friend in friends and other not in friends:
+                counts[other] += 1
+
+    return counts
+
+
+# Up to `count` (user id, mutual friends) pairs, most mutual friends first,
+# leaving out anyone the user has a pending request with.
+def _recommend(user_id, count):
+    counts = mutual_friend_counts(user_id)
+
+    if counts:
+        for sent_from, sent_to in FriendRequest.objects.filter(
+                Q(sent_from_id=user_id) | Q(sent_to_id=user_id)).values_list('sent_from_id', 'sent_to_id'):
+            counts.pop(sent_from, None)
+            counts.pop(sent_to, None)
+
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:count]
+
+
+# People a user may know, each with a mutual_friends attribute. The ranking
+# is cached, so a hit costs one query for the users themselves.
+def people_you_may_know(user, count=RECOMMENDATION_COUNT):
+    key = cache_key(user.id)
+    ranked = cache.get(key)
+
+    if ranked is None:
+        ranked = _recommend(user.id, RECOMMENDATION_COUNT)
+        cache.set(key, ranked, RECOMMENDATION_CACHE_SECONDS)
+
+    ranked = ranked[:count]
+    users = ExtendedUser.objects.in_bulk([user_id for user_id, _ in ranked])
+    people = []
+
+    for user_id, mutual in ranked:
+        if user_id in users:
+            users[user_id].mutual_friends = mutual
+            people.append(users[user_id])
+
+    return people
+
+
+# These users and all of their friends.
+def _friends_and(user_ids):
+    user_ids = set(user_ids)
+
+    for low, high in Friendship.objects.filter(Q(low_id__in=user_ids) | Q(high_id__in=user_ids)) \
+            .values_list('low_id', 'high_id'):
+        user_ids.update((low, high))
+
+    return user_ids
+
+
+# Drops the cached recommendations of these users, now and again once the
+# transaction commits, so a ranking rebuilt from uncommitted data in the
+# meantime isn't kept. With `and_friends`, their friends' are dropped too
+# once committed, as a friendship changing alters who is two hops from each
+# of them. Looking the friends up then keeps the write transaction short.
+def invalidate(user_ids, and_friends=False):
+    keys = [cache_key(user_id) for user_id in set(user_ids)]
+    cache.delete_many(keys)
+
+    if and_friends:
+        transaction.on_commit(lambda: cache.delete_many(
+            [cache_key(user_id) for user_id in _friends_and(user_ids)]))
+    else:
+        transaction.on_commit(lambda: cache.delete_many(keys))
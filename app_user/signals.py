@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import PointsAwarded, PointsBalance, Notification, FriendRequest, friendship_changed
+from .notifications import invalidate
+from . import recommendations
+from .suggestions import update_completion, recheck_completion
+from app_quiz.models import Attempt
+
+# Keeps each user's PointsBalance in step with their PointsAwarded rows.
+@receiver(post_save, sender=PointsAwarded)
+def points_awarded(sender, instance, created, **kwargs):
+    if created:
+        PointsBalance.add(instance.user_id, instance.points, time=instance.time)
+
+# The balance isn't recreated here, it may already have been deleted along
+# with its user.
+@receiver(post_delete, sender=PointsAwarded)
+def points_removed(sender, instance, **kwargs):
+    PointsBalance.add(instance.user_id, -instance.points, create=False, time=instance.time)
+
+# Any change to a user's notifications makes their cached summary stale.
+@receiver([post_save, post_delete], sender=Notification)
+def notification_changed(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+# Drops cached recommendations that a friendship or request changes.
+@receiver(friendship_changed)
+def friendship_updated(sender, user_ids, **kwargs):
+    recommendations.invalidate(user_ids, and_friends=True)
+
+@receiver([post_save, post_delete], sender=FriendRequest)
+def friend_request_changed(sender, instance, **kwargs):
+    recommendations.invalidate((instance.sent_from_id, instance.sent_to_id))
+
+# Keeps the friend suggestion completion matrix up to date once attempts
+# are committed.
+@receiver(post_save, sender=Attempt)
+def attempt_saved(sender, instance, **kwargs):
+    if instance.completed:
+        user_id, quiz_id = instance.user_id, instance.quiz_id
+        transaction.on_commit(lambda: update_completion(user_id, quiz_id, True))
+
+@receiver(post_delete, sender=Attempt)
+def attempt_deleted(sender, instance, **kwargs):
+    if instance.completed:
+        user_id, quiz_id = instance.user_id, instance.quiz_id
+        transaction.on_commit(lambda: recheck_completion(user_id, quiz_id))
@@ -0,0 +1,201 @@
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from app_quiz.models import Attempt
+from .models import Friendship, FriendRequest
+
+
+# Number of most similar users kept per user between changes.
+SUGGESTION_CACHE_CANDIDATES = getattr(settings, "SUGGESTION_CACHE_CANDIDATES", 50)
+
+# Seconds a process uses its matrix before building it again. Completions
+# committed in the same process are applied straight away, ones committed by
+# other processes show up once rebuilt.
+COMPLETION_MATRIX_MAX_AGE = getattr(settings, "COMPLETION_MATRIX_MAX_AGE", 300)
+
+
+# Which users have completed which quizzes, one row per user and one column
+# per quiz, grown as new users and quizzes appear. Similarity between users
+# is the Jaccard index of their completed quizzes.
+class CompletionMatrix:
+    def __init__(self, completions=()):
+        self.rows = {}  # user id -> row
+        self.columns = {}  # quiz id -> column
+        self.user_ids = np.zeros(16, dtype=np.int64)
+        self.quiz_ids = np.zeros(16, dtype=np.int64)
+        self.matrix = np.zeros((16, 16), dtype=bool)
+        self.counts = np.zeros(16, dtype=np.int32)
+        self.version = 0
+        self._cache = {}
+        self._lock = threading.RLock()
+
+        for user_id, quiz_id in completions:
+            self.set(user_id, quiz_id, True)
+
+    def _row(self, user_id):
+        if user_id not in self.rows:
+            row = len(self.rows)
+
+            if row == len(self.user_ids):
+                self.user_ids = np.concatenate([self.user_ids, np.zeros_like(self.user_ids)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+                self.matrix = np.vstack([self.matrix, np.zeros_like(self.matrix)])
+
+            self.rows[user_id] = row
+            self.user_ids[row] = user_id
+
+        return self.rows[user_id]
+
+    def _column(self, quiz_id):
+        if quiz_id not in self.columns:
+            column = len(self.columns)
+
+            if column == len(self.quiz_ids):
+                self.quiz_ids = np.concatenate([self.quiz_ids, np.zeros_like(self.quiz_ids)])
+                self.matrix = np.hstack([self.matrix, np.zeros_like(self.matrix)])
+
+            self.columns[quiz_id] = column
+            self.quiz_ids[column] = quiz_id
+
+        return self.columns[quiz_id]
+
+    def set(self, user_id, quiz_id, completed=True):
+        with self._lock:
+            row = self._row(user_id)
+            column = self._column(quiz_id)
+
+            if self.matrix[row, column] != completed:
+                self.matrix[row, column] = completed
+                self.counts[row] += 1 if completed else -1
+                self.version += 1
+                self._cache.clear()
+
+    def completed(self, user_id):
+        with self._lock:
+            row = self.rows.get(user_id)
+
+            if row is None:
+                return []
+
+            return self.quiz_ids[:len(self.columns)][self.matrix[row, :len(self.columns)]].tolist()
+
+    # Quizzes both users have completed.
+    def shared(self, user_id, other_id):
+        with self._lock:
+            if user_id not in self.rows or other_id not in self.rows:
+                return []
+
+            columns = len(self.columns)
+            both = self.matrix[self.rows[user_id], :columns] & self.matrix[self.rows[other_id], :columns]
+
+            return self.quiz_ids[:columns][both].tolist()
+
+    # Up to `count` (user id, similarity) pairs for the users most like this
+    # one, best first. Only users sharing at least one quiz are included.
+    def similar(self, user_id, count=SUGGESTION_CACHE_CANDIDATES):
+        with self._lock:
+            cached = self._cache.get(user_id)
+
+            if cached is not None and len(cached[0]) >= min(count, cached[1]):
+                return cached[0][:count]
+
+            result, available = self._similar(user_id, count)
+            self._cache[user_id] = (result, available)
+
+            return result
+
+    def _similar(self, user_id, count):
+        row = self.rows.get(user_id)
+
+        if row is None or self.counts[row] == 0 or count <= 0:
+            return [], 0
+
+        users = len(self.rows)
+        columns = np.flatnonzero(self.matrix[row, :len(self.columns)])
+
+        # |A ∩ B| for every user at once, from just this user's columns
+        shared = self.matrix[:users, columns].sum(axis=1)
+        union = self.counts[:users] + self.counts[row] - shared
+        scores = np.divide(shared, union, out=np.zeros(users), where=union > 0)
+        scores[row] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > count:
+            candidates = candidates[np.argpartition(-scores[candidates], count - 1)[:count]]
+
+        # Best first, ties by user id so results are stable
+        candidates = candidates[np.lexsort((self.user_ids[candidates], -scores[candidates]))]
+
+        return ([(int(self.user_ids[i]), float(scores[i])) for i in candidates],
+                int(np.count_nonzero(scores > 0)))
+
+
+_matrix = None
+_matrix_built = 0
+_matrix_lock = threading.Lock()
+
+
+def _matrix_stale():
+    return _matrix is None or time.monotonic() - _matrix_built > COMPLETION_MATRIX_MAX_AGE
+
+
+# Returns this process's completion matrix, built with one query when first
+# needed and again once it's COMPLETION_MATRIX_MAX_AGE old.
+def get_matrix():
+    global _matrix, _matrix_built
+
+    if _matrix_stale():
+        with _matrix_lock:
+            if _matrix_stale():
+                _matrix = CompletionMatrix(Attempt.objects.filter(completed=True)
+                                           .values_list('user_id', 'quiz_id').distinct())
+                _matrix_built = time.monotonic()
+
+    return _matrix
+
+
+# Drops the matrix so the next use rebuilds it.
+def reset_matrix():
+    global _matrix
+
+    with _matrix_lock:
+        _matrix = None
+
+
+# Records a completion, if the matrix has been built yet.
+def update_completion(user_id, quiz_id, completed):
+    if _matrix is not None:
+        _matrix.set(user_id, quiz_id, completed)
+
+
+# Rechecks a user and quiz after a completed attempt is deleted, as another
+# attempt may still have completed it.
+def recheck_completion(user_id, quiz_id):
+    if _matrix is not None:
+        _matrix.set(user_id, quiz_id, Attempt.objects.filter(user_id=user_id, quiz_id=quiz_id,
+                                                             completed=True).exists())
+
+
+# Up to `count` (user id, similarity) suggestions for a user, leaving out
+# their friends and anyone they have a pending request with.
+def suggest_friends(user, count=5):
+    excluded = set()
+
+    for low, high in Friendship.objects.filter(Q(low_id=user.id) | Q(high_id=user.id)) \
+            .values_list('low_id', 'high_id'):
+        excluded.update((low, high))
+
+    for sent_from, sent_to in FriendRequest.objects.filter(Q(sent_from_id=user.id) | Q(sent_to_id=user.id)) \
+            .values_list('sent_from_id', 'sent_to_id'):
+        excluded.update((sent_from, sent_to))
+
+    matrix = get_matrix()
+    candidates = matrix.similar(user.id)
+
+    # Fall back to scoring everyone if the cached candidates were all excluded
+    if len([user_id for user_id, _ in candidates if user_id not in excluded]) < count:
+        candidates = matrix.similar(user.id, len(matrix.rows))
+
+    return [(user_id, score) for user_id, score in candidates if user_id not in excluded][:count]
@@ -1,18 +1,29 @@
 from django.contrib import auth
 from django.contrib.auth.models import AnonymousUser
 from django.http import HttpResponseRedirect
-from django.test import TestCase, Client, RequestFactory
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
 from django import forms
 from app_quiz.models import Attempt, Quiz
 from .context_processors import notification_list
 from .forms import UserCreationWithEmailForm, GoogleUserChangeUsername, LoginForm
-from .models import ExtendedUser, Decoration, Avatar, PointsAwarded, Friend, Notification, FriendRequest
+from .models import ExtendedUser, Decoration, Avatar, PointsAwarded, PointsBalance, Friendship, Notification, FriendRequest
+from io import StringIO
+from django.core.management import call_command
 from pathlib import Path
 from django.test import TestCase
 from django.core.files.images import ImageFile
 from unittest.mock import patch
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, IntegrityError
+from django.test.utils import CaptureQueriesContext
+from .directory import user_directory
+from .recommendations import mutual_friend_counts, people_you_may_know
+from .suggestions import CompletionMatrix, get_matrix, reset_matrix, suggest_friends
+from .notifications import get_summary, mark_all_read, clear_all
+from datetime import timedelta
+from django.utils import timezone
 
 # Sample data located om sample_data folder
 # Includes a placeholder image
@@ -20,6 +31,10 @@ ROOT_DIR = Path('sample_data')
 IMAGE_PATH = 'Placeholder image.png'
 
 
+# Tests use a cache of their own, not the shared one a dev server may be using
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
 class DecorationTests(TestCase):
     @classmethod
     # Create a valid Decoration
@@ -128,7 +143,56 @@ class PointsAwardedModelTest(TestCase):
         self.assertEqual(self.points_awarded.points, 10)
 
 
+# Test cases for the materialised points balance
+class PointsBalanceTest(TestCase):
+    def setUp(self):
+        self.user = ExtendedUser.objects.create(username='testuser', email='testuser@test.com')
+
+    # Test awarding and removing points keeps the balance up to date
+    def test_balance_follows_ledger(self):
+        PointsAwarded.objects.create(user=self.user, points=10)
+        award = PointsAwarded.objects.create(user=self.user, points=5)
+        PointsAwarded.bulk_award([PointsAwarded(user=self.user, points=7),
+                                  PointsAwarded(user=self.user, points=3)])
+
+        self.assertEqual(self.user.points(), 25)
+
+        award.delete()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.user.points(), 20)
+
+    # Test spending only succeeds when the user can afford it
+    def test_spend_points(self):
+        PointsAwarded.objects.create(user=self.user, points=30)
+
+        self.assertTrue(self.user.spend_points(25))
+        self.assertFalse(self.user.spend_points(25))
+        self.assertEqual(self.user.spentPoints, 25)
+        self.assertEqual(self.user.points(), 5)
+
+    # Test users never awarded points can only spend nothing
+    def test_spend_points_no_balance(self):
+        self.assertTrue(self.user.spend_points(0))
+        self.assertFalse(self.user.spend_points(1))
+        self.assertEqual(self.user.spentPoints, 0)
+
+    # Test reconcile_points reports and fixes drift
+    def test_reconcile_points(self):
+        PointsAwarded.objects.create(user=self.user, points=10)
+        PointsBalance.objects.filter(user=self.user).update(earned=99)
+
+        out = StringIO()
+        call_command('reconcile_points', dry_run=True, stdout=out)
+        self.assertIn('drift +89', out.getvalue())
+        self.assertEqual(PointsBalance.objects.get(user=self.user).earned, 99)
+
+        call_command('reconcile_points', stdout=StringIO())
+        self.assertEqual(PointsBalance.objects.get(user=self.user).earned, 10)
+
+
 # Test cases for templates
+@override_settings(CACHES=TEST_CACHES)
 class TemplateTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -163,28 +227,49 @@ class TemplateTests(TestCase):
         self.assertTemplateUsed(response, 'shop.html')
 
 
-# Test cases for the Friend model
-class FriendModelTest(TestCase):
+# Test cases for the Friendship model
+@override_settings(CACHES=TEST_CACHES)
+class FriendshipModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
         cls.user1 = ExtendedUser.objects.create(username='testuser1', email='testuser1@test.com')
         cls.user2 = ExtendedUser.objects.create(username='testuser2', email='testuser2@test.com')
 
-    # Test the make_friend method
-    def test_make_friend(self):
-        Friend.make_friend(self.user1, self.user2)
-        friend = Friend.objects.get(current_user=self.user1)
-        self.assertIn(self.user2, friend.users.all())
+    # Test adding a friend is one statement and works both ways
+    def test_add(self):
+        with self.assertNumQueries(1):
+            Friendship.add(self.user2, self.user1)
 
-    # Test the remove_friend method
-    def test_remove_friend(self):
-        Friend.make_friend(self.user1, self.user2)
-        Friend.remove_friend(self.user1, self.user2)
-        friend = Friend.objects.get(current_user=self.user1)
-        self.assertNotIn(self.user2, friend.users.all())
+        self.assertTrue(Friendship.are_friends(self.user1, self.user2))
+        self.assertTrue(Friendship.are_friends(self.user2, self.user1))
+        self.assertIn(self.user2, Friendship.friends_of(self.user1))
+        self.assertIn(self.user1, Friendship.friends_of(self.user2))
+
+    # Test adding the same friendship again from either side keeps one row
+    def test_add_twice(self):
+        Friendship.add(self.user1, self.user2)
+        Friendship.add(self.user2, self.user1)
+
+        self.assertEqual(Friendship.objects.count(), 1)
+
+    # Test removing a friend is one statement
+    def test_remove(self):
+        Friendship.add(self.user1, self.user2)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(Friendship.remove(self.user2, self.user1))
+
+        self.assertFalse(Friendship.are_friends(self.user1, self.user2))
+        self.assertFalse(Friendship.remove(self.user1, self.user2))
+
+    # Test the pair must be stored in order
+    def test_check_constraint(self):
+        with self.assertRaises(IntegrityError):
+            Friendship.objects.create(low=self.user2, high=self.user1)
 
 
 # Test cases for the Notification model
+@override_settings(CACHES=TEST_CACHES)
 class NotificationModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -211,6 +296,7 @@ class NotificationModelTest(TestCase):
             Notification.objects.get(id=notification.id)
 
 
+@override_settings(CACHES=TEST_CACHES)
 class TestViews(TestCase):
 
     def setUp(self):
@@ -327,6 +413,7 @@ class AuthGoogleTestCase(TestCase):
         self.assertTrue('_auth_user_id' in self.client.session)
 
 
+@override_settings(CACHES=TEST_CACHES)
 class ChangeUsernameTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -351,6 +438,7 @@ class ChangeUsernameTest(TestCase):
         self.assertEqual(self.user.username, 'newusername')
 
 
+@override_settings(CACHES=TEST_CACHES)
 class UserLoginTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -394,6 +482,7 @@ class UserLogoutTest(TestCase):
         self.assertRedirects(response, reverse('login'))
 
 
+@override_settings(CACHES=TEST_CACHES)
 class UserSettingsTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -411,32 +500,31 @@ class UserSettingsTest(TestCase):
         self.assertTemplateUsed(response, 'settings.html')
 
 
+@override_settings(CACHES=TEST_CACHES)
 class RemoveFriendTest(TestCase):
     def setUp(self):
         self.client = Client()
         self.user_model = get_user_model()
         self.user1 = self.user_model.objects.create_user(username='user1', password='pass')
         self.user2 = self.user_model.objects.create_user(username='user2', password='pass')
-        Friend.make_friend(self.user1, self.user2)
-        Friend.make_friend(self.user2, self.user1)
+        Friendship.add(self.user1, self.user2)
 
     # Test removing a friend
     def test_remove_friend(self):
         self.client.login(username='user1', password='pass')
         response = self.client.get(reverse('remove-friend', args=[self.user2.pk]))
         self.assertEqual(response.status_code, 302)
-        self.assertFalse(Friend.objects.filter(current_user=self.user1, users__in=[self.user2]).exists())
-        self.assertFalse(Friend.objects.filter(current_user=self.user2, users__in=[self.user1]).exists())
+        self.assertFalse(Friendship.are_friends(self.user1, self.user2))
 
 
+@override_settings(CACHES=TEST_CACHES)
 class UserFriendsTest(TestCase):
     def setUp(self):
         self.client = Client()
         self.user_model = get_user_model()
         self.user1 = self.user_model.objects.create_user(username='user1', password='pass')
         self.user2 = self.user_model.objects.create_user(username='user2', password='pass')
-        Friend.make_friend(self.user1, self.user2)
-        Friend.make_friend(self.user2, self.user1)
+        Friendship.add(self.user1, self.user2)
 
     # Test user friend functionality
     def test_user_friends(self):
@@ -451,6 +539,120 @@ class UserFriendsTest(TestCase):
         self.assertIn(self.user2, response.context['friends'])
 
 
+@override_settings(CACHES=TEST_CACHES)
+class PeopleYouMayKnowTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.a, self.b, self.c, self.d, self.e = [
+            ExtendedUser.objects.create_user(username=name, password='pass')
+            for name in ['me', 'a', 'b', 'c', 'd', 'e']]
+        # c is a friend of both a and b, d and e of a only
+        for user, other in [(self.me, self.a), (self.me, self.b), (self.a, self.b),
+                            (self.a, self.c), (self.b, self.c), (self.a, self.d), (self.a, self.e)]:
+            Friendship.add(user, other)
+
+    def tearDown(self):
+        cache.clear()
+
+    # Test two hops are expanded in one query and ranked by mutual friends
+    def test_mutual_friend_counts(self):
+        with self.assertNumQueries(1):
+            counts = mutual_friend_counts(self.me.id)
+
+        self.assertEqual(counts, {self.c.id: 2, self.d.id: 1, self.e.id: 1})
+        self.assertEqual([(user, user.mutual_friends) for user in people_you_may_know(self.me)],
+                         [(self.c, 2), (self.d, 1), (self.e, 1)])
+
+    # Test pending requests either way are left out
+    def test_excludes_requests(self):
+        FriendRequest.objects.create(sent_from=self.me, sent_to=self.d)
+        FriendRequest.objects.create(sent_from=self.e, sent_to=self.me)
+
+        self.assertEqual(people_you_may_know(self.me), [self.c])
+
+    # Test cached rankings are used, and dropped for both ends of a changed
+    # friendship and their friends
+    def test_cache_invalidation(self):
+        people_you_may_know(self.me)
+        people_you_may_know(self.c)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(people_you_may_know(self.me), [self.c, self.d, self.e])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.add(self.d, self.e)
+        self.assertEqual(people_you_may_know(self.c), [self.me, self.d, self.e])
+
+        # me is a friend of a, so a new friend of a is now two hops away
+        new = ExtendedUser.objects.create_user(username='new', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.add(self.a, new)
+        self.assertIn(new, people_you_may_know(self.me))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.add(self.me, self.c)
+        self.assertNotIn(self.c, people_you_may_know(self.me))
+        self.assertNotIn(self.me, people_you_may_know(self.c))
+
+    # Test the friends page lists them
+    def test_friends_page(self):
+        self.client.login(username='me', password='pass')
+        response = self.client.get(reverse('friends'))
+        self.assertEqual(response.context['recommendations'], [self.c, self.d, self.e])
+        self.assertContains(response, '2 mutual friends')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserDirectoryTest(TestCase):
+    def setUp(self):
+        self.me = ExtendedUser.objects.create_user(username='me', password='pass')
+        names = ['alan', 'alice', 'alison', 'bob', 'carol', 'dave']
+        self.users = {name: ExtendedUser.objects.create_user(username=name, password='pass')
+                      for name in names}
+        Friendship.add(self.me, self.users['bob'])
+        FriendRequest.objects.create(sent_from=self.me, sent_to=self.users['carol'])
+        FriendRequest.objects.create(sent_from=self.users['dave'], sent_to=self.me)
+
+    # Test prefix search and status annotations come back in one query
+    def test_search_and_status(self):
+        with self.assertNumQueries(1):
+            page, next_after = user_directory(self.me, 'al')
+
+        self.assertEqual([user.username for user in page], ['alan', 'alice', 'alison'])
+        self.assertIsNone(next_after)
+
+        page, _ = user_directory(self.me)
+        status = {user.username: (user.is_friend, user.request_sent, user.request_received)
+                  for user in page}
+        self.assertNotIn('me', status)
+        self.assertEqual(status['bob'], (True, False, False))
+        self.assertEqual(status['carol'], (False, True, False))
+        self.assertEqual(status['dave'], (False, False, True))
+
+    # Test keyset pagination walks every user exactly once
+    def test_pagination(self):
+        seen = []
+        after = None
+
+        while True:
+            page, after = user_directory(self.me, after=after, size=2, include_friends=False)
+            seen += [user.username for user in page]
+
+            if after is None:
+                break
+
+        self.assertEqual(seen, ['alan', 'alice', 'alison', 'carol', 'dave'])
+
+    # Test the friends page shows one page of search results
+    def test_friends_page(self):
+        self.client.login(username='me', password='pass')
+        response = self.client.get(reverse('friends'), {'q': 'ali'})
+
+        self.assertEqual([user.username for user in response.context['users']], ['alice', 'alison'])
+        self.assertIsNone(response.context['next_after'])
+
+
+@override_settings(CACHES=TEST_CACHES)
 class FriendRequestTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -480,10 +682,10 @@ class FriendRequestTests(TestCase):
         response = self.client.get(reverse('accept-friend-request', args=[self.user1.pk]))
         self.assertEqual(response.status_code, 302)  # Expecting a redirect after successful acceptance
         self.assertFalse(FriendRequest.objects.filter(sent_from=self.user1, sent_to=self.user2).exists())
-        self.assertTrue(Friend.objects.filter(current_user=self.user1, users__in=[self.user2]).exists())
-        self.assertTrue(Friend.objects.filter(current_user=self.user2, users__in=[self.user1]).exists())
+        self.assertTrue(Friendship.are_friends(self.user1, self.user2))
 
 
+@override_settings(CACHES=TEST_CACHES)
 class NotificationViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -500,6 +702,7 @@ class NotificationViewTest(TestCase):
             pk=self.notification.pk).exists())
 
 
+@override_settings(CACHES=TEST_CACHES)
 class FriendSuggestionViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -509,6 +712,10 @@ class FriendSuggestionViewTest(TestCase):
         self.quiz = Quiz.objects.create(name='Test Quiz')
         Attempt.objects.create(user=self.user1, quiz=self.quiz, completed=True)
         Attempt.objects.create(user=self.user2, quiz=self.quiz, completed=True)
+        reset_matrix()
+
+    def tearDown(self):
+        reset_matrix()
 
     # Test friend suggestion view
     def test_friend_suggestion_view(self):
@@ -522,7 +729,81 @@ class FriendSuggestionViewTest(TestCase):
                       notification.message)
         self.assertIn('has completed the Test Quiz quiz too!', notification.message)
 
-
+    # Test that a user with no completed quizzes gets no suggestion
+    def test_friend_suggestion_nothing_completed(self):
+        self.user_model.objects.create_user(username='user3', password='pass')
+        self.client.login(username='user3', password='pass')
+        response = self.client.get(reverse('friend-suggestion'))
+        self.assertRedirects(response, reverse('pathways-home'), fetch_redirect_response=False)
+        self.assertFalse(Notification.objects.exists())
+
+    # Test that friends and pending requests aren't suggested
+    def test_friend_suggestion_excludes_friends(self):
+        user3 = self.user_model.objects.create_user(username='user3', password='pass')
+        Attempt.objects.create(user=user3, quiz=self.quiz, completed=True)
+        reset_matrix()
+        self.assertEqual([user_id for user_id, _ in suggest_friends(self.user1)], [self.user2.id, user3.id])
+
+        Friendship.add(self.user1, self.user2)
+        FriendRequest.objects.create(sent_from=user3, sent_to=self.user1)
+        self.assertEqual(suggest_friends(self.user1), [])
+
+    # Test that completing a quiz updates the matrix once committed
+    def test_completion_updates_matrix(self):
+        quiz = Quiz.objects.create(name='Other Quiz')
+        self.assertEqual(get_matrix().completed(self.user1.id), [self.quiz.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attempt = Attempt.objects.create(user=self.user1, quiz=quiz, completed=True)
+        self.assertEqual(sorted(get_matrix().completed(self.user1.id)), sorted([self.quiz.id, quiz.id]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attempt.delete()
+        self.assertEqual(get_matrix().completed(self.user1.id), [self.quiz.id])
+
+
+    # Test completions committed elsewhere show up once the matrix is rebuilt
+    def test_matrix_rebuilt_when_stale(self):
+        quiz = Quiz.objects.create(name='Other Quiz')
+        self.assertEqual(get_matrix().completed(self.user1.id), [self.quiz.id])
+
+        # Without running the on commit callbacks, as in another process
+        Attempt.objects.create(user=self.user1, quiz=quiz, completed=True)
+        self.assertEqual(get_matrix().completed(self.user1.id), [self.quiz.id])
+
+        with patch('app_user.suggestions.COMPLETION_MATRIX_MAX_AGE', 0):
+            self.assertEqual(sorted(get_matrix().completed(self.user1.id)), sorted([self.quiz.id, quiz.id]))
+
+
+class CompletionMatrixTest(TestCase):
+    # Test users are ranked by the Jaccard index of their completed quizzes
+    def test_similar(self):
+        matrix = CompletionMatrix([(1, 10), (1, 11), (1, 12),
+                                   (2, 10), (2, 11), (2, 12),
+                                   (3, 10), (3, 11), (3, 13),
+                                   (4, 10), (4, 14), (4, 15), (4, 16),
+                                   (5, 20)])
+        self.assertEqual(matrix.similar(1), [(2, 1.0), (3, 0.5), (4, 1 / 6)])
+        self.assertEqual(matrix.similar(1, 1), [(2, 1.0)])
+        self.assertEqual(matrix.similar(5), [])
+        self.assertEqual(matrix.shared(1, 3), [10, 11])
+
+    # Test changes are seen by later lookups and the matrix grows as needed
+    def test_set(self):
+        matrix = CompletionMatrix([(1, 10), (2, 10)])
+        self.assertEqual(matrix.similar(1), [(2, 1.0)])
+
+        matrix.set(2, 10, False)
+        self.assertEqual(matrix.similar(1), [])
+
+        for user_id in range(3, 40):
+            matrix.set(user_id, 10 + user_id)
+            matrix.set(user_id, 10)
+        self.assertEqual(len(matrix.similar(1, 100)), 37)
+        self.assertEqual(matrix.similar(1, 1), [(3, 0.5)])
+
+
+@override_settings(CACHES=TEST_CACHES)
 class NotificationSocketViewTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -605,23 +886,139 @@ class LoginFormTest(TestCase):
         self.assertFalse(form.is_valid())
 
 
+@override_settings(CACHES=TEST_CACHES)
 class NotificationListTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.factory = RequestFactory()
         self.user = ExtendedUser.objects.create_user(username='testuser', password='testpassword')
         self.notification = Notification.objects.create(user=self.user, message='Test notification')
 
-    # Test notification list for authenticated user
+    # Test notification count for authenticated user
     def test_notification_list_authenticated(self):
         request = self.factory.get('/')
         request.user = self.user
         result = notification_list(request)
-        self.assertEqual(len(result['notifications']), 1)
-        self.assertEqual(result['notifications'][0], self.notification)
+        self.assertEqual(result['notification_count'], 1)
+        self.assertNotIn('notifications', result)
 
-    # Test notification list for unauthenticated user
+    # Test notification count for unauthenticated user
     def test_notification_list_unauthenticated(self):
         request = self.factory.get('/')
         request.user = AnonymousUser()
         result = notification_list(request)
-        self.assertEqual(result['notifications'], {})
+        self.assertEqual(result, {'notification_count': 0})
+
+    # Test the unread count comes from the cache once warm
+    def test_notification_count_cached(self):
+        request = self.factory.get('/')
+        request.user = self.user
+        self.assertEqual(notification_list(request)['notification_count'], 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(notification_list(request)['notification_count'], 1)
+
+    # Test saving and deleting notifications invalidates the summary
+    def test_summary_invalidated(self):
+        self.assertEqual(get_summary(self.user.id)['unread'], 1)
+
+        newer = Notification.objects.create(user=self.user, message='Newer notification')
+        summary = get_summary(self.user.id)
+        self.assertEqual(summary['unread'], 2)
+        self.assertEqual(summary['latest'][0]['id'], newer.id)
+
+        self.notification.is_read = True
+        self.notification.save()
+        self.assertEqual(get_summary(self.user.id)['unread'], 1)
+
+        newer.delete()
+        self.assertEqual(get_summary(self.user.id), {'unread': 0, 'latest': []})
+
+    # Test the dropdown feed
+    def test_notification_feed(self):
+        client = Client()
+        self.assertEqual(client.get(reverse('notification-feed')).status_code, 401)
+
+        client.login(username='testuser', password='testpassword')
+        data = client.get(reverse('notification-feed')).json()
+        self.assertEqual(data['unread'], 1)
+        self.assertEqual(data['notifications'][0]['message'], 'Test notification')
+
+    # Test rendering a page doesn't query notifications once the count is cached
+    def test_page_no_notification_queries(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        client.get(reverse('index'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('index'))
+
+        self.assertContains(response, 'data-count="1"')
+        self.assertFalse([query for query in queries if 'app_user_notification' in query['sql']])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NotificationBulkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = ExtendedUser.objects.create_user(username='testuser', password='testpassword')
+        self.other = ExtendedUser.objects.create_user(username='otheruser', password='testpassword')
+
+        for i in range(3):
+            Notification.objects.create(user=self.user, message='Notification %d' % i)
+        Notification.objects.create(user=self.other, message='Other notification')
+
+    # Test marking all read is one query and updates the cached count
+    def test_mark_all_read(self):
+        self.assertEqual(get_summary(self.user.id)['unread'], 3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(mark_all_read(self.user.id), 3)
+
+        self.assertEqual(get_summary(self.user.id)['unread'], 0)
+        self.assertEqual(get_summary(self.other.id)['unread'], 1)
+
+    # Test clearing all reads the ids then deletes them in one query, and
+    # only affects the user
+    def test_clear_all(self):
+        self.assertEqual(get_summary(self.user.id)['unread'], 3)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(clear_all(self.user.id), 3)
+
+        self.assertEqual(get_summary(self.user.id), {'unread': 0, 'latest': []})
+        self.assertEqual(Notification.objects.filter(user=self.other).count(), 1)
+
+    # Test more ids than fit in one DELETE are deleted in batches
+    def test_clear_all_batches(self):
+        with patch('app_user.notifications.DELETE_BATCH_SIZE', 2), self.assertNumQueries(3):
+            self.assertEqual(clear_all(self.user.id), 3)
+
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+
+    # Test the bulk endpoints
+    def test_endpoints(self):
+        self.assertEqual(self.client.post(reverse('notifications-read')).status_code, 401)
+
+        self.client.login(username='testuser', password='testpassword')
+        self.assertEqual(self.client.get(reverse('notifications-read')).status_code, 405)
+        self.assertEqual(self.client.post(reverse('notifications-read')).json(), {'updated': 3})
+        self.assertEqual(self.client.post(reverse('notifications-clear')).json(), {'deleted': 3})
+
+    # Test pruning deletes only expired notifications, in batches
+    def test_prune(self):
+        now = timezone.now()
+        Notification.objects.filter(user=self.user).update(date_created=now - timedelta(days=100))
+        Notification.objects.create(user=self.user, message='Recent', is_read=True)
+        Notification.objects.create(user=self.other, message='Old read', is_read=True,
+                                    date_created=now - timedelta(days=40))
+        get_summary(self.user.id)
+
+        out = StringIO()
+        call_command('prune_notifications', batch_size=2, stdout=out)
+
+        self.assertEqual(sorted(Notification.objects.values_list('message', flat=True)),
+                         ['Other notification', 'Recent'])
+        self.assertEqual(get_summary(self.user.id)['unread'], 0)
+        self.assertIn('Pruned 4 notifications.', out.getvalue())
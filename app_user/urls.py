@@ -19,4 +19,7 @@ urlpatterns = [
     path("notification/<int:notification_id>/", notification, name="notification"),
     path("friend_suggestion/", friend_suggestion, name="friend-suggestion"),
     path("notification_socket", notification_socket, name="notification-socket"),
+    path("notifications", notification_feed, name="notification-feed"),
+    path("notifications/read", notifications_read, name="notifications-read"),
+    path("notifications/clear", notifications_clear, name="notifications-clear"),
 ]
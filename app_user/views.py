@@ -4,18 +4,23 @@ import os
 from django.shortcuts import render, redirect, get_object_or_404
 from google.oauth2 import id_token
 from google.auth.transport import requests
-from django.http import HttpResponse, HttpRequest
+from django.http import HttpResponse, HttpRequest, JsonResponse
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.contrib import messages
-from app_quiz.models import Attempt
-from .models import ExtendedUser, Friend, FriendRequest, Notification, Avatar, Decoration
+from app_quiz.models import Quiz
+from .models import ExtendedUser, Friendship, FriendRequest, Notification, Avatar, Decoration
+from .directory import user_directory
+from .suggestions import suggest_friends, get_matrix
+from .recommendations import people_you_may_know
+from .notifications import get_summary, mark_all_read, clear_all
 from .forms import UserCreationWithEmailForm, GoogleUserChangeUsername, LoginForm
 
 # Create your views here.
@@ -114,33 +119,27 @@ def user_tools(request):
     return render(request, 'tools.html')
 
 def add_friend(request, user_id):
-    new_friend = ExtendedUser.objects.get(id=user_id)
-    Friend.make_friend(request.user, new_friend)
-    Friend.make_friend(new_friend, request.user)
+    Friendship.add(request.user, user_id)
 
 def remove_friend(request, user_id):
-    new_friend = ExtendedUser.objects.get(id=user_id)
-    Friend.remove_friend(request.user, new_friend)
-    Friend.remove_friend(new_friend, request.user)
+    Friendship.remove(request.user, user_id)
     return redirect('friends')
 
+# The directory of other users is one fixed size page, searched by
+# username prefix with ?q= and paged with ?after=.
 def user_friends(request):
     if request.user.is_authenticated:
-        users = ExtendedUser.objects.all()
-        friends = {}
-        sent_friend_requests = {}
-        recieved_friend_requests = {}
-        if request.user.is_authenticated:
-            if Friend.objects.filter(current_user=request.user):
-                friend = Friend.objects.get(current_user=request.user)
-                friends = friend.users.all()
-            if FriendRequest.objects.filter(sent_from=request.user):
-                sent_friend_requests = FriendRequest.objects.all().filter(sent_from=request.user)
-            if FriendRequest.objects.filter(sent_to=request.user):
-                recieved_friend_requests = FriendRequest.objects.all().filter(sent_to=request.user)
+        query = request.GET.get('q', '').strip()
+        users, next_after = user_directory(request.user, query, request.GET.get('after'),
+                                           include_friends=False)
+        friends = Friendship.friends_of(request.user)
+        sent_friend_requests = FriendRequest.objects.filter(sent_from=request.user).select_related('sent_to')
+        recieved_friend_requests = FriendRequest.objects.filter(sent_to=request.user).select_related('sent_from')
         return render(request, 'friends.html', {'users':users, 'friends':friends,
                                                 'sent_requests':sent_friend_requests, 
-                                                'received_requests':recieved_friend_requests})
+                                                'received_requests':recieved_friend_requests,
+                                                'query':query, 'next_after':next_after,
+                                                'recommendations':people_you_may_know(request.user)})
     else:
         return redirect('login')
 
@@ -161,9 +160,11 @@ def deny_friend_request(request, user_id):
     remove_friend_request(request, user_id)
     return redirect('friends')
 
+# The request is removed first, so a missing request can't still make the
+# users friends.
 def accept_friend_request(request, user_id):
-    add_friend(request, user_id)
     remove_friend_request(request, user_id)
+    add_friend(request, user_id)
     return redirect('friends')
 
 def notification(request, notification_id):
@@ -171,25 +172,24 @@ def notification(request, notification_id):
     current_notification.delete()
     return redirect('friends')
 
+# Suggests one of the users whose completed quizzes are most like the
+# user's own, naming a quiz they've both completed.
 def friend_suggestion(request):
-    quizzes = {}
-    user_attempts = Attempt.objects.all().filter(user=request.user)
-    for attempt in user_attempts:
-        if attempt.completed:
-            quizzes[attempt.quiz] = attempt.completed
-    print(quizzes)
-    quiz = random.choice(list(quizzes.keys()))
-    other_attempts = Attempt.objects.all().filter(~Q(user=request.user))
-    other_users = []
-    for attempt in other_attempts:
-        other_users.append(attempt.user)
-    other_users = list(dict.fromkeys(other_users)) #remove duplicates
-    if len(other_users) > 0:
-        friend = random.choice(other_users)
-        current_notification = Notification.objects.get_or_create(message="Friend Suggestion: " +
-                                                          friend.username + " has completed the " +
-                                                          quiz.name + " quiz too!",
-                                                          user=request.user)
+    if not request.user.is_authenticated:
+        return redirect('login')
+
+    suggestions = suggest_friends(request.user)
+
+    if suggestions:
+        friend_id, _ = random.choice(suggestions)
+        friend = ExtendedUser.objects.filter(id=friend_id).first()
+        quiz = Quiz.objects.filter(id__in=get_matrix().shared(request.user.id, friend_id)).first()
+
+        if friend is not None and quiz is not None:
+            current_notification = Notification.objects.get_or_create(message="Friend Suggestion: " +
+                                                              friend.username + " has completed the " +
+                                                              quiz.name + " quiz too!",
+                                                              user=request.user)
     return redirect('pathways-home')
 
 def notification_socket(request):
@@ -198,6 +198,30 @@ def notification_socket(request):
         current_notification.delete()
         return redirect('friends')
 
+# Unread count and latest notifications for the header dropdown, which loads
+# them when it's first opened.
+def notification_feed(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "NotLoggedIn"}, status = 401)
+
+    summary = get_summary(request.user.id)
+
+    return JsonResponse({"unread": summary["unread"], "notifications": summary["latest"]})
+
+@require_POST
+def notifications_read(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "NotLoggedIn"}, status = 401)
+
+    return JsonResponse({"updated": mark_all_read(request.user.id)})
+
+@require_POST
+def notifications_clear(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "NotLoggedIn"}, status = 401)
+
+    return JsonResponse({"deleted": clear_all(request.user.id)})
+
 def shop(request):
     if request.user.is_authenticated:
         if request.method == 'POST':
@@ -208,11 +232,13 @@ def shop(request):
             if request_type == 'buy_avatar':
                 avatar = get_object_or_404(Avatar, id = request_id)
 
-                if user.points() >= avatar.cost:
-                    user.spentPoints += avatar.cost
-                    user.inventoryAvatar.add(avatar)
-                    user.save()
+                with transaction.atomic():
+                    purchased = user.spend_points(avatar.cost)
+
+                    if purchased:
+                        user.inventoryAvatar.add(avatar)
 
+                if purchased:
                     messages.add_message(request, messages.SUCCESS, 'You have successfully ' +
                                           'purchased ' + avatar.name + ' for ' + str(avatar.cost) + 
                                           ' points!')
@@ -223,11 +249,13 @@ def shop(request):
             elif request_type == 'buy_decoration':
                 decoration = get_object_or_404(Decoration, id = request_id)
 
-                if user.points() >= decoration.cost:
-                    user.spentPoints += decoration.cost
-                    user.inventoryDecoration.add(decoration)
-                    user.save()
+                with transaction.atomic():
+                    purchased = user.spend_points(decoration.cost)
+
+                    if purchased:
+                        user.inventoryDecoration.add(decoration)
 
+                if purchased:
                     messages.add_message(request, messages.SUCCESS, 'You have successfully ' +
                                           'purchased ' + decoration.name +
                                           ' for ' + str(decoration.cost) +